@@ -0,0 +1,28 @@
+"""
+ASGI config for blog project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed with settings.ASGI_URLCONF, which serves the read views
+through their async versions.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog.settings")
+django.setup(set_prefix=False)
+
+
+class BlogASGIHandler(ASGIHandler):
+    async def get_response_async(self, request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+application = BlogASGIHandler()
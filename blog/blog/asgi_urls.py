@@ -0,0 +1,13 @@
+"""blog URL Configuration for the ASGI application
+
+Same as blog.urls, with the read views of blog_app replaced by their async
+versions.
+"""
+from django.contrib import admin
+from django.urls import include, path
+
+urlpatterns = [
+    path('accounts/', include('django.contrib.auth.urls')),
+    path('blog/', include('blog_app.async_urls')),
+    path('admin/', admin.site.urls),
+]
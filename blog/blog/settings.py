@@ -39,12 +39,17 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # static files are served by WhiteNoise under runserver too
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     'django.contrib.sites',
 ]
 
 MIDDLEWARE = [
+    'blog_app.profiling.QueryProfilingMiddleware',
+    'blog_app.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,23 +60,48 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'blog.urls'
 
+TEMPLATE_CONTEXT_PROCESSORS = [
+    'django.template.context_processors.debug',
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
+            'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
+            # templates are compiled once per process, runserver's
+            # autoreloader still picks up changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
+    {
+        # the listing templates in blog_app/jinja2, see
+        # LISTING_TEMPLATE_ENGINE
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'blog_app.jinja.environment',
+            'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
+        },
+    },
 ]
+# engine the post listings (all posts and feed) are rendered with,
+# 'django' or 'jinja2', compare them with `manage.py render_benchmark`
+LISTING_TEMPLATE_ENGINE = 'django'
 
 WSGI_APPLICATION = 'blog.wsgi.application'
+ASGI_APPLICATION = 'blog.asgi.application'
+# URLconf of the ASGI application, serves async versions of the read views
+ASGI_URLCONF = 'blog.asgi_urls'
 
 
 # Database
@@ -85,9 +115,27 @@ DATABASES = {
         'PASSWORD': credentials['db']['password'],
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        # persistent connections, checked before reuse by each request
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     },
 }
 
+# read replicas of default, used by the read-only views
+for i, host in enumerate(credentials['db'].get('replicas', ())):
+    DATABASES[f'replica{i}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['blog_app.routers.ReplicaRouter']
+# seconds a client reads from default after writing, above replication lag
+DATABASE_STICKY_SECONDS = 10
+
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -117,8 +165,6 @@ TIME_ZONE = 'Europe/Moscow'
 
 USE_I18N = True
 
-USE_L10N = True
-
 USE_TZ = True
 
 
@@ -126,6 +172,25 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # hashed names and .gz/.br copies are written by collectstatic
+    'staticfiles': {
+        'BACKEND': 'blog_app.storage.StaticFilesStorage',
+    },
+}
+
+# pages use blog_app/fonts/fonts.css instead of Google Fonts, as long as
+# the font files `manage.py fetch_fonts` downloads next to it are there
+LOCAL_FONTS = True
+
+# seconds files without a hash in their name are cached by clients,
+# hashed ones are cached for good
+WHITENOISE_MAX_AGE = 60 * 60
 
 LOGIN_REDIRECT_URL = 'root_redirect'
 LOGOUT_REDIRECT_URL = 'root_redirect'
@@ -146,3 +211,152 @@ SITE_ID = 1
 REDIS_SERVER = 'redis://localhost:6379/0'
 CELERY_BROKER_URL = REDIS_SERVER
 CELERY_RESULT_BACKEND = REDIS_SERVER
+
+# settings for materialized feed timelines
+
+# posts of authors with more followers are not fanned out on write
+# and are pulled into the feed on read instead
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+# number of latest posts copied into timeline on follow
+FEED_BACKFILL_SIZE = 200
+
+# settings for the cached follow graph
+
+# seconds follow lists stay cached, they are also dropped on changes
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+
+# settings for post archival
+
+# posts older than this are moved out of the listings to the archive
+ARCHIVE_AFTER_DAYS = 365
+# posts (and read markers) moved per transaction
+ARCHIVE_BATCH_SIZE = 500
+# batches moved by one run of the periodic task, the rest waits for the
+# next run
+ARCHIVE_MAX_BATCHES = 100
+
+CELERY_BEAT_SCHEDULE = {
+    'archive-posts': {
+        'task': 'blog_app.tasks.archive_posts',
+        'schedule': 60 * 60,
+    },
+}
+
+# settings for background deletion
+
+# rows of deleted profiles and posts deleted per transaction
+DELETION_BATCH_SIZE = 500
+# batches deleted by one run of the task, which then queues the next run
+DELETION_MAX_BATCHES = 100
+# seconds the pks of deleted profiles stay cached, they are also dropped
+# on deletions and purges
+DELETED_PROFILES_TIMEOUT = 60 * 5
+
+# picks up runs that were lost, deletions queue their own
+CELERY_BEAT_SCHEDULE['purge-deleted'] = {
+    'task': 'blog_app.tasks.purge_deleted',
+    'schedule': 10 * 60,
+}
+
+# settings for new post notifications
+
+# follower emails are sent in batches, one task per batch
+NOTIFICATION_BATCH_SIZE = 500
+# emails per second per worker, 0 to disable throttling
+NOTIFICATION_RATE_LIMIT = 10
+NOTIFICATION_MAX_RETRIES = 5
+NOTIFICATION_RETRY_DELAY = 60
+
+# settings for page caching
+
+# version counters, pages, sessions, users and the follow graph are
+# shared by every web and Celery process, in a redis database of their own
+# as clear() flushes it
+CACHE_REDIS_SERVER = 'redis://localhost:6379/1'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_SERVER,
+    },
+}
+
+# anonymous pages are invalidated by version bumps, the timeout only
+# bounds the memory held by stale entries
+CACHE_PAGE_TIMEOUT = 60 * 10
+
+# settings for sessions and request users
+
+# sessions are read from the cache and written through to the database,
+# logouts and dropped users reach every process through the shared cache
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# users are loaded with their profile from the cache, ModelBackend keeps
+# the sessions created before valid
+AUTHENTICATION_BACKENDS = [
+    'blog_app.users.CachedUserBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# seconds users stay cached, they are also dropped on changes
+USER_CACHE_TIMEOUT = 60 * 15
+
+# settings for the transactional outbox
+
+# messages sent to the broker per relay transaction
+OUTBOX_BATCH_SIZE = 500
+# seconds the relay sleeps when the outbox is empty
+OUTBOX_POLL_INTERVAL = 1
+# sent messages are kept to recognize repeated deliveries
+OUTBOX_RETENTION_DAYS = 7
+
+# settings for real-time feed events
+
+# bus new post events are published on, LocalBus only reaches the
+# event streams of the process that published
+EVENTS_BUS = 'blog_app.events.RedisBus'
+# seconds between keep-alive comments on idle event streams
+EVENTS_HEARTBEAT = 15
+# seconds clients wait before reconnecting a dropped stream
+EVENTS_RETRY_DELAY = 5
+# posts replayed at most to a reconnecting client
+EVENTS_REPLAY_SIZE = 50
+# seconds after which streams are closed for the client to reconnect
+EVENTS_MAX_AGE = 60 * 5
+
+# settings for bulk follow and read mark endpoints
+
+# ids or usernames accepted in one request
+BULK_ACTION_MAX_ITEMS = 1000
+
+# settings for full-text search
+
+# PostgreSQL text search configuration used to parse and stem posts
+SEARCH_CONFIG = 'russian'
+
+# settings for the admin
+
+# larger changelists show estimated counts from the PostgreSQL planner
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+# settings for query profiling
+
+# share of requests profiled by QueryProfilingMiddleware, 0 disables it
+PROFILING_SAMPLE_RATE = 0
+# statements repeated this many times in a request are reported as N+1
+PROFILING_DUPLICATE_THRESHOLD = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'blog_app.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -1,5 +1,129 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.utils.translation import ngettext
 
-from .models import Post
+from . import archive, counters, deletion, search
+from .models import ArchivedPost, Post, Profile
+from .pagination import EstimatedCountPaginator
 
-admin.site.register(Post)
+
+# Changelists join the related rows they display, count large tables from
+# the query plan, search through indexes only and run actions as
+# set-based queries, so they stay fast on tables with millions of rows.
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # skips the COUNT(*) of the whole table next to filtered counts
+    show_full_result_count = False
+
+
+class BackgroundDeleteMixin:
+    """Replace the cascading delete with deletion.py.
+
+    A cascade of a prolific author holds its locks for a long time, the
+    delete actions hide the rows and leave the rest to purge_deleted.
+    """
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def _deleted(self, request, deleted, singular, plural):
+        self.message_user(request, ngettext(singular, plural, deleted)
+                          % deleted, messages.SUCCESS)
+
+
+@admin.action(description='Delete selected users in the background')
+def delete_users(modeladmin, request, queryset):
+    modeladmin._deleted(
+        request, deletion.delete_profiles(
+            Profile.objects.filter(user__in=queryset)),
+        'Deleting %d user.', 'Deleting %d users.')
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class BlogUserAdmin(BackgroundDeleteMixin, UserAdmin):
+    actions = [delete_users]
+
+
+@admin.register(Profile)
+class ProfileAdmin(BackgroundDeleteMixin, LargeTableAdmin):
+    list_display = ('user', 'post_count', 'followers_count',
+                    'following_count', 'deleted_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    search_help_text = 'Username prefix, case-sensitive.'
+    ordering = ('pk',)
+
+    raw_id_fields = ('user', 'following')
+    readonly_fields = Profile.COUNTER_FIELDS
+    actions = ['reconcile_counters', 'delete_profiles']
+
+    def get_search_results(self, request, queryset, search_term):
+        # LIKE 'prefix%' is served by the username index
+        if not search_term:
+            return queryset, False
+        return (queryset.filter(user__username__startswith=search_term),
+                False)
+
+    @admin.action(description='Recompute counters of selected profiles')
+    def reconcile_counters(self, request, queryset):
+        fixed = counters.reconcile(queryset)
+        self.message_user(request, ngettext(
+            'Fixed %d profile.', 'Fixed %d profiles.', fixed) % fixed,
+            messages.SUCCESS)
+
+    @admin.action(description='Delete selected profiles in the background')
+    def delete_profiles(self, request, queryset):
+        self._deleted(request, deletion.delete_profiles(queryset),
+                      'Deleting %d profile.', 'Deleting %d profiles.')
+
+
+@admin.register(Post)
+class PostAdmin(BackgroundDeleteMixin, LargeTableAdmin):
+    list_display = ('caption', 'author', 'pub_date', 'deleted_at')
+    list_select_related = ('author__user',)
+    search_fields = ('caption', 'content_text')
+    search_help_text = 'Full-text search in captions and texts.'
+    date_hierarchy = 'pub_date'
+    # the listing index
+    ordering = ('-pub_date', '-id')
+
+    autocomplete_fields = ('author',)
+    actions = ['archive_posts', 'delete_posts']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.search(queryset, search_term), False
+
+    @admin.action(description='Move selected posts to the archive')
+    def archive_posts(self, request, queryset):
+        moved = archive.archive_post_pks(
+            list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, ngettext(
+            'Archived %d post.', 'Archived %d posts.', moved) % moved,
+            messages.SUCCESS)
+
+    @admin.action(description='Delete selected posts in the background')
+    def delete_posts(self, request, queryset):
+        self._deleted(request, deletion.delete_posts(queryset),
+                      'Deleting %d post.', 'Deleting %d posts.')
+
+
+@admin.register(ArchivedPost)
+class ArchivedPostAdmin(LargeTableAdmin):
+    list_display = ('caption', 'author', 'pub_date', 'archived_at')
+    list_select_related = ('author__user',)
+    date_hierarchy = 'pub_date'
+    ordering = ('-pub_date', '-id')
+    raw_id_fields = ('author',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
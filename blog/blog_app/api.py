@@ -0,0 +1,84 @@
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+
+# loaded from the database only when selected
+TEXT_FIELDS = ('content_text', 'content_html', 'preview_html')
+
+POST_FIELDS = {
+    'pk': lambda post: post.pk,
+    'caption': lambda post: post.caption,
+    'content_text': lambda post: post.content_text,
+    'content_html': lambda post: post.content_html,
+    'preview_html': lambda post: post.preview_html,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'author': lambda post: post.author.user.username,
+    'author_pk': lambda post: post.author_id,
+    'url': lambda post: reverse('post_detail', args=(post.pk,)),
+}
+
+
+class PostJsonMixin:
+    """Render the view's posts as JSON instead of a template.
+
+    ?fields=pk,caption selects the serialized fields, text columns are not
+    loaded from the database unless they are selected.
+    """
+    fields_kwarg = 'fields'
+    extra_fields = {}
+
+    @cached_property
+    def available_fields(self):
+        return {**POST_FIELDS, **self.extra_fields}
+
+    @cached_property
+    def fields(self):
+        fields = self.request.GET.get(self.fields_kwarg)
+        if not fields:
+            return list(self.available_fields)
+        return [field.strip() for field in fields.split(',')]
+
+    def dispatch(self, request, *args, **kwargs):
+        unknown = [field for field in self.fields
+                   if field not in self.available_fields]
+        if unknown:
+            return JsonResponse(
+                {'error': f'Unknown fields: {", ".join(unknown)}.'},
+                status=400)
+
+        return super().dispatch(request, *args, **kwargs)
+
+    def defer_text(self, queryset):
+        return queryset.defer(None).defer(
+            *(field for field in TEXT_FIELDS if field not in self.fields))
+
+    def get_queryset(self):
+        return self.defer_text(super().get_queryset())
+
+    def get_archive_queryset(self):
+        queryset = super().get_archive_queryset()
+        return None if queryset is None else self.defer_text(queryset)
+
+    def serialize(self, post):
+        return {field: self.available_fields[field](post)
+                for field in self.fields}
+
+    def get_pagination_data(self, page):
+        return {
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    def get_json_data(self, context):
+        if 'object' in context:
+            return self.serialize(context['object'])
+
+        return {
+            'results': [self.serialize(post)
+                        for post in context['object_list']],
+            **self.get_pagination_data(context['page_obj']),
+        }
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse(self.get_json_data(context))
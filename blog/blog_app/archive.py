@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache, search
+from .models import ArchivedPost, FeedEntry, Post, ReadMarker
+from .utils import chunks
+
+
+# Posts older than ARCHIVE_AFTER_DAYS are moved from Post to ArchivedPost,
+# so the listings, feeds and their indexes only hold recent posts. Posts
+# move in batches of ARCHIVE_BATCH_SIZE, each in its own short transaction,
+# and every run resumes from what is left in Post. Read markers are then
+# cleared of the posts that are no longer in Post.
+
+POST_TABLE = Post._meta.db_table
+ARCHIVE_TABLE = ArchivedPost._meta.db_table
+COPIED_COLUMNS = ('id', 'caption', 'content_text', 'pub_date', 'author_id',
+                  'content_html', 'preview_html')
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def _move(posts):
+    # posts maps the pks of locked posts to their authors' pks
+    pks = list(posts)
+
+    # the copy and the delete run in the database, Post signals are not
+    # sent as the posts and their authors' counts stay
+    columns = ', '.join(COPIED_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ARCHIVE_TABLE} ({columns}, archived_at) '
+            f'SELECT {columns}, %s FROM {POST_TABLE} '
+            f'WHERE id IN ({_placeholders(pks)})',
+            [connection.ops.adapt_datetimefield_value(timezone.now()),
+             *pks])
+
+        FeedEntry.objects.filter(post_id__in=pks).delete()
+        search.remove_posts(pks)
+        cursor.execute(
+            f'DELETE FROM {POST_TABLE} WHERE id IN ({_placeholders(pks)})',
+            pks)
+
+    cache.bump_version('posts', *{f'blog:{pk}' for pk in posts.values()},
+                       *(f'post:{pk}' for pk in pks))
+
+
+@transaction.atomic
+def _archive_batch(before, batch_size):
+    # rows locked by another run are left to it
+    posts = dict(Post.objects.select_for_update(skip_locked=True)
+                 .filter(pub_date__lt=before, deleted_at__isnull=True)
+                 .order_by('pub_date', 'pk')
+                 .values_list('pk', 'author_id')[:batch_size])
+    if posts:
+        _move(posts)
+    return len(posts)
+
+
+def archive_post_pks(pks, batch_size=None):
+    """Move the given posts to the archive, returns the number moved."""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+
+    archived = 0
+    for batch in chunks(pks, batch_size):
+        with transaction.atomic():
+            posts = dict(Post.objects.select_for_update()
+                         .filter(pk__in=batch, deleted_at__isnull=True)
+                         .values_list('pk', 'author_id'))
+            if posts:
+                _move(posts)
+        archived += len(posts)
+
+    return archived
+
+
+def archive_posts(before=None, batch_size=None, max_batches=None):
+    """Move posts published before `before` to the archive.
+
+    At most max_batches batches if given, returns the number of posts.
+    """
+    before = before or archive_cutoff()
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = _archive_batch(before, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+
+    return archived
+
+
+@transaction.atomic
+def _prune_batch(last_pk, batch_size):
+    markers = list(ReadMarker.objects.select_for_update(skip_locked=True)
+                   .filter(pk__gt=last_pk)
+                   .exclude(read=set(), unread=set())
+                   .order_by('pk')[:batch_size])
+    if not markers:
+        return None, 0
+
+    post_pks = set().union(*(marker.read | marker.unread
+                             for marker in markers))
+    existing = set(Post.objects.filter(pk__in=post_pks)
+                   .values_list('pk', flat=True))
+
+    pruned = []
+    for marker in markers:
+        if not (marker.read | marker.unread) <= existing:
+            marker.read &= existing
+            marker.unread &= existing
+            pruned.append(marker)
+    ReadMarker.objects.bulk_update(pruned, ['read', 'unread'])
+
+    return markers[-1].pk, len(pruned)
+
+
+def prune_read_markers(batch_size=None):
+    """Drop archived and deleted posts from read markers.
+
+    Only markers with read or unread exceptions are read, returns the
+    number of markers changed.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+
+    pruned = 0
+    last_pk = 0
+    while True:
+        last_pk, changed = _prune_batch(last_pk, batch_size)
+        if last_pk is None:
+            break
+        pruned += changed
+
+    return pruned
+
+
+def run(before=None, batch_size=None, max_batches=None):
+    return (archive_posts(before, batch_size, max_batches),
+            prune_read_markers(batch_size))
@@ -0,0 +1,20 @@
+from django.urls import path
+
+from . import async_views, urls
+
+ASYNC_VIEWS = {
+    'all': async_views.AsyncAllView,
+    'feed': async_views.AsyncFeedView,
+    'blog': async_views.AsyncBlogView,
+    'post_detail': async_views.AsyncPostView,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(),
+         name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+] + [
+    # long-lived streams are only served by the ASGI application
+    path('feed/stream', async_views.FeedStreamView.as_view(),
+         name='feed_stream'),
+]
@@ -0,0 +1,243 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.views import generic
+
+from . import cache, deletion, events, feed, graph, reads
+from .models import ArchivedPost, Post, Profile
+from .pagination import CursorPaginationMixin
+from .views import BaseView, ListingTemplateMixin
+
+
+# Async counterparts of the read views, served by the ASGI application
+# (see blog.asgi_urls). They render the same templates with the same
+# context, querying through the async ORM; helpers that only exist in
+# sync form run in a thread through sync_to_async.
+
+class AsyncReadView(BaseView, generic.View):
+    template_name = None
+    template_engine = None
+    use_replica = True
+    login_required = False
+
+    def get_page_cache_versions(self):
+        return ['users']
+
+    async def get_context_data(self, **kwargs):
+        return super().get_context_data(**kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        # request.user is loaded lazily from the session
+        await sync_to_async(lambda: self.user_profile)()
+
+        if self.login_required and self.user_profile is None:
+            return redirect_to_login(request.get_full_path())
+
+        key = None
+        if self.user_profile is None:
+            key, response = await sync_to_async(cache.get_page)(
+                request, self.get_page_cache_versions())
+            if response is not None:
+                return response
+
+        response = TemplateResponse(request, self.template_name,
+                                    await self.get_context_data(**kwargs),
+                                    using=self.template_engine)
+        if key is not None:
+            cache.set_page(key, response)
+
+        return response
+
+
+class AsyncPostListView(CursorPaginationMixin, AsyncReadView):
+    context_object_name = 'posts_feed'
+    paginate_by = 10
+
+    async def get_queryset(self):
+        posts = await sync_to_async(deletion.visible)(
+            Post.objects.select_related('author__user'))
+        return posts.defer(*Post.LIST_DEFERRED).order_by('-pub_date')
+
+    async def paginate(self, queryset):
+        paginator, page, posts, is_paginated = (
+            await self.apaginate_queryset(queryset, self.paginate_by))
+        return {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': posts,
+            self.context_object_name: posts,
+        }
+
+    async def get_context_data(self, **kwargs):
+        context = await super().get_context_data(**kwargs)
+        context.update(await self.paginate(await self.get_queryset()))
+
+        return context
+
+
+class AsyncAllView(ListingTemplateMixin, AsyncPostListView):
+    template_name = 'blog_app/all_posts.html'
+
+    def get_page_cache_versions(self):
+        return super().get_page_cache_versions() + ['posts']
+
+
+class AsyncFeedView(ListingTemplateMixin, AsyncPostListView):
+    template_name = 'blog_app/feed.html'
+    login_required = True
+    cursor_date_field = 'feed_date'
+    cursor_pk_field = 'feed_pk'
+
+    async def get_queryset(self):
+        posts = await sync_to_async(feed.feed_queryset)(self.user_profile)
+        return posts.select_related('author__user').defer('content_text')
+
+    async def get_context_data(self, **kwargs):
+        context = await super().get_context_data(**kwargs)
+
+        posts = context['object_list']
+        read_posts = await sync_to_async(reads.read_post_ids)(
+            self.user_profile, posts)
+        for post in posts:
+            post.is_read = post.pk in read_posts
+
+        return context
+
+
+class AsyncBlogView(AsyncPostListView):
+    template_name = 'blog_app/blog.html'
+    context_object_name = 'posts'
+
+    def get_page_cache_versions(self):
+        return (super().get_page_cache_versions()
+                + [f'blog:{self.kwargs["profile_pk"]}'])
+
+    def get_archive_queryset(self):
+        return (ArchivedPost.objects
+                .filter(author_id=self.kwargs['profile_pk'])
+                .defer(*Post.LIST_DEFERRED))
+
+    async def is_followed(self, profile_pk):
+        if self.user_profile is None:
+            return None
+        return await sync_to_async(graph.is_following)(
+            self.user_profile.pk, profile_pk)
+
+    async def get_context_data(self, **kwargs):
+        context = await super(AsyncPostListView, self).get_context_data(
+            **kwargs)
+        profile_pk = self.kwargs['profile_pk']
+
+        # the async ORM runs each query in the same database thread, so
+        # gathering them wouldn't run them concurrently
+        profile = await (Profile.objects.select_related('user')
+                         .filter(pk=profile_pk, deleted_at__isnull=True)
+                         .afirst())
+        if profile is None:
+            raise Http404(f'User profile with pk = {profile_pk} '
+                          f'does not exist.')
+
+        context.update(await self.paginate(
+            Post.objects.filter(author_id=profile_pk, deleted_at__isnull=True)
+            .defer(*Post.LIST_DEFERRED).order_by('-pub_date')))
+        is_followed = await self.is_followed(profile_pk)
+        context['user_info'] = {
+            'username': profile.user.username,
+            'full_name': profile.user.get_full_name,
+            'postcount': profile.post_count,
+            'followers_count': profile.followers_count,
+            'pk': profile_pk
+        }
+        if is_followed is not None:
+            context['is_followed'] = is_followed
+
+        return context
+
+
+class AsyncPostView(AsyncReadView):
+    template_name = 'blog_app/post_detail.html'
+
+    def get_page_cache_versions(self):
+        return (super().get_page_cache_versions()
+                + [f'post:{self.kwargs["pk"]}'])
+
+    async def get_context_data(self, **kwargs):
+        context = await super().get_context_data(**kwargs)
+
+        hidden = await sync_to_async(deletion.deleted_profiles)()
+        post = await (Post.objects.select_related('author__user')
+                      .filter(pk=self.kwargs['pk'], deleted_at__isnull=True)
+                      .exclude(author_id__in=hidden).afirst())
+        if post is None:
+            post = await (ArchivedPost.objects.select_related('author__user')
+                          .filter(pk=self.kwargs['pk'])
+                          .exclude(author_id__in=hidden).afirst())
+        if post is None:
+            raise Http404('No post found matching the query')
+
+        context.update({'post': post, 'object': post})
+
+        return context
+
+
+class FeedStreamView(BaseView, generic.View):
+    """Server-sent events with the new posts of followed authors.
+
+    Authors followed after the stream is opened are picked up when the
+    client reconnects. On reconnect EventSource sends Last-Event-ID, feed
+    posts newer than it are replayed first.
+    """
+
+    def event(self, message):
+        return (f'id: {message["pk"]}\nevent: post\n'
+                f'data: {json.dumps(message)}\n\n')
+
+    async def missed_posts(self, last_event_id):
+        if not last_event_id.isdigit():
+            return []
+
+        posts = await sync_to_async(feed.feed_queryset)(self.user_profile)
+        posts = (posts.filter(pk__gt=int(last_event_id))
+                 .select_related('author__user')
+                 .order_by('pk')[:settings.EVENTS_REPLAY_SIZE])
+        return [post async for post in posts]
+
+    async def stream(self, author_pks, missed):
+        channels = [events.post_channel(pk) for pk in author_pks]
+        async with events.get_bus().subscribe(channels) as subscription:
+            yield f'retry: {settings.EVENTS_RETRY_DELAY * 1000}\n\n'
+            for post in missed:
+                yield self.event(events.post_message(post))
+
+            # the ASGI handler doesn't notice clients that went away, so
+            # streams end after EVENTS_MAX_AGE and live clients reconnect
+            closes_at = time.monotonic() + settings.EVENTS_MAX_AGE
+            while time.monotonic() < closes_at:
+                message = await subscription.get(settings.EVENTS_HEARTBEAT)
+                if message is events.CLOSED:
+                    return
+                # comments keep idle connections open through proxies
+                yield (': ping\n\n' if message is None
+                       else self.event(message))
+
+    async def get(self, request, *args, **kwargs):
+        await sync_to_async(lambda: self.user_profile)()
+        if self.user_profile is None:
+            return redirect_to_login(request.get_full_path())
+
+        author_pks = [pk async for pk in self.user_profile.following
+                      .values_list('pk', flat=True)]
+        missed = await self.missed_posts(
+            request.headers.get('Last-Event-ID', ''))
+
+        response = StreamingHttpResponse(self.stream(author_pks, missed),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,440 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.template import engines
+from django.test import AsyncClient, Client, RequestFactory
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from django.utils import timezone
+
+from . import counters, search
+from .models import FeedEntry, Post, Profile, ReadMarker
+from .pagination import CursorPaginator
+from .utils import bulk_create
+
+
+DISTRIBUTIONS = ('uniform', 'zipf')
+INTERFACES = ('wsgi', 'asgi')
+ENGINES = ('django', 'jinja2')
+LISTING_TEMPLATES = ('blog_app/all_posts.html', 'blog_app/feed.html')
+
+# the shared cache holds the users, the follow graph and the versions of
+# the real site, which the seeded pks would overwrite
+ISOLATED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
+}
+
+
+@contextmanager
+def isolated_environment(keepdb=False):
+    """Run with a throwaway test database and a process-local cache."""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       keepdb=keepdb)
+    try:
+        with override_settings(CACHES=ISOLATED_CACHES):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0,
+                                            keepdb=keepdb)
+        teardown_test_environment()
+
+
+def _pick_followees(rng, profile_pks, follows, distribution):
+    if distribution == 'uniform':
+        return rng.sample(profile_pks, min(follows, len(profile_pks)))
+
+    # zipf: weight 1/rank, so a few authors get most of the followers
+    weights = [1 / rank for rank in range(1, len(profile_pks) + 1)]
+    return set(rng.choices(profile_pks, weights=weights, k=follows))
+
+
+def seed(users=100, follows=20, distribution='zipf', posts=10,
+         read_ratio=0.5, random_seed=0, prefix='bench'):
+    """Bulk insert a synthetic follow graph with posts and read state."""
+    rng = random.Random(random_seed)
+    password = make_password(None)
+
+    bulk_create(User, (User(username=f'{prefix}{i}', password=password)
+                       for i in range(users)))
+    user_pks = list(User.objects.filter(username__startswith=prefix)
+                    .values_list('pk', flat=True))
+
+    bulk_create(Profile, (Profile(user_id=pk) for pk in user_pks))
+    profile_pks = list(Profile.objects.filter(user_id__in=user_pks)
+                       .order_by('pk').values_list('pk', flat=True))
+
+    # bulk_create() skips save(), every post has the same rendering
+    sample = Post(content_text='\n'.join(['lorem ipsum dolor sit amet'] * 40))
+    sample.render()
+    bulk_create(Post, (Post(caption=f'Post {i} of {pk}',
+                            content_text=sample.content_text,
+                            content_html=sample.content_html,
+                            preview_html=sample.preview_html, author_id=pk)
+                       for pk in profile_pks for i in range(posts)))
+
+    search.index_posts(Post.objects.filter(author_id__in=profile_pks)
+                       .values_list('pk', flat=True).iterator())
+
+    author_posts = {}
+    for pk, author_pk, pub_date in (
+            Post.objects.filter(author_id__in=profile_pks).order_by('pk')
+            .values_list('pk', 'author_id', 'pub_date')):
+        author_posts.setdefault(author_pk, []).append((pk, pub_date))
+
+    follow_pairs = [
+        (follower, followee)
+        for follower in profile_pks
+        for followee in _pick_followees(rng, profile_pks, follows,
+                                        distribution)
+        if follower != followee]
+
+    Follow = Profile.following.through
+    bulk_create(Follow, (Follow(from_profile_id=follower,
+                                to_profile_id=followee)
+                         for follower, followee in follow_pairs))
+
+    bulk_create(FeedEntry, (FeedEntry(profile_id=follower, post_id=pk,
+                                      pub_date=pub_date)
+                            for follower, followee in follow_pairs
+                            for pk, pub_date in author_posts.get(followee,
+                                                                 ())))
+
+    read_count = int(posts * read_ratio)
+    if read_count:
+        bulk_create(ReadMarker, (
+            ReadMarker(profile_id=follower, author_id=followee,
+                       read_until=author_posts[followee][read_count - 1][0])
+            for follower, followee in follow_pairs))
+
+    counters.reconcile(Profile.objects.filter(pk__in=profile_pks))
+
+    return profile_pks
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = max(0, int(round(percent / 100 * len(values) + 0.5)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def view_urls(profile_pks, rng):
+    profile_pk = rng.choice(profile_pks)
+    post_pk = (Post.objects.filter(author_id=profile_pk)
+               .values_list('pk', flat=True).first())
+
+    urls = {
+        'all': (reverse('all'), False),
+        'feed': (reverse('feed'), True),
+        'blog': (reverse('blog', args=(profile_pk,)), False),
+    }
+    if post_pk is not None:
+        urls['post_detail'] = (reverse('post_detail', args=(post_pk,)),
+                               False)
+
+    return urls
+
+
+def run(profile_pks, requests=100, viewers=10, views=None, cold=False,
+        random_seed=0):
+    """Request each view and report latency percentiles and query counts.
+
+    Anonymous views are requested without a session, the feed is
+    requested by `viewers` profiles in turn. With cold=True the cache
+    is cleared before every request.
+    """
+    rng = random.Random(random_seed)
+
+    anonymous = Client()
+    clients = []
+    for profile in (Profile.objects.select_related('user')
+                    .filter(pk__in=rng.sample(profile_pks,
+                                              min(viewers,
+                                                  len(profile_pks))))):
+        client = Client()
+        client.force_login(profile.user)
+        clients.append(client)
+
+    results = {}
+    for name, (url, login) in view_urls(profile_pks, rng).items():
+        if views and name not in views:
+            continue
+
+        timings, queries = [], []
+        started = time.perf_counter()
+        for i in range(requests):
+            if cold:
+                cache.clear()
+
+            client = clients[i % len(clients)] if login else anonymous
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - request_started)
+
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f'{url} returned {response.status_code}')
+            queries.append(len(captured))
+        elapsed = time.perf_counter() - started
+
+        results[name] = {
+            'url': url,
+            'requests': requests,
+            'rps': requests / elapsed,
+            'p50_ms': _percentile(timings, 50) * 1000,
+            'p95_ms': _percentile(timings, 95) * 1000,
+            'p99_ms': _percentile(timings, 99) * 1000,
+            'queries_mean': sum(queries) / len(queries),
+            'queries_max': max(queries),
+        }
+
+    return results
+
+
+class _Usage:
+    """Track database connections and threads during a concurrent run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = self.open = self.peak_open = 0
+        self.peak_threads = threading.active_count()
+        self.stopped = threading.Event()
+
+    def connection_created(self, sender, connection, **kwargs):
+        with self.lock:
+            self.connections += 1
+            self.open += 1
+            self.peak_open = max(self.peak_open, self.open)
+
+    def close_connections(self):
+        # what request_finished does with CONN_MAX_AGE = 0, the test
+        # clients disconnect it
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is not None:
+                conn.close()
+                with self.lock:
+                    self.open -= 1
+
+    def sample_threads(self):
+        while not self.stopped.wait(0.001):
+            self.peak_threads = max(self.peak_threads,
+                                    threading.active_count())
+
+    def __enter__(self):
+        connection_created.connect(self.connection_created)
+        self.sampler = threading.Thread(target=self.sample_threads)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.sampler.join()
+        connection_created.disconnect(self.connection_created)
+
+
+def _check(url, response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} returned {response.status_code}')
+
+
+def _run_wsgi(clients, url, counts, usage):
+    # one worker thread per client, as in a threaded WSGI server
+    def worker(client, count):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            _check(url, response)
+            usage.close_connections()
+        return timings
+
+    with ThreadPoolExecutor(len(clients)) as executor:
+        futures = [executor.submit(worker, client, count)
+                   for client, count in zip(clients, counts)]
+        return [timing for future in futures for timing in future.result()]
+
+
+def _run_asgi(clients, url, counts, usage):
+    # every request gets its own thread for sync code, as under an ASGI
+    # server, and the clients share one event loop
+    async def request(client):
+        async with ThreadSensitiveContext():
+            started = time.perf_counter()
+            response = await client.get(url)
+            timing = time.perf_counter() - started
+            _check(url, response)
+            await sync_to_async(usage.close_connections)()
+        return timing
+
+    async def worker(client, count):
+        return [await request(client) for _ in range(count)]
+
+    async def main():
+        return await asyncio.gather(*(worker(client, count)
+                                      for client, count in zip(clients,
+                                                               counts)))
+
+    # asyncio.run() rather than async_to_sync(), which would run all sync
+    # code back in this thread
+    with override_settings(ROOT_URLCONF=settings.ASGI_URLCONF):
+        return [timing for timings in asyncio.run(main())
+                for timing in timings]
+
+
+def run_concurrent(profile_pks, requests=100, concurrency=10,
+                   interface='wsgi', viewers=10, views=None, random_seed=0):
+    """Request each view from `concurrency` clients at once.
+
+    Requests go through the WSGI handler from a pool of threads or through
+    the ASGI handler (async views) from one event loop. Besides latency,
+    reports connections opened, the peak of open connections and the peak
+    number of threads.
+    """
+    rng = random.Random(random_seed)
+    client_class = Client if interface == 'wsgi' else AsyncClient
+    run_clients = _run_wsgi if interface == 'wsgi' else _run_asgi
+
+    users = list(User.objects.filter(profile__pk__in=rng.sample(
+        profile_pks, min(viewers, len(profile_pks)))))
+    counts = [requests // concurrency + (i < requests % concurrency)
+              for i in range(concurrency)]
+
+    results = {}
+    for name, (url, login) in view_urls(profile_pks, rng).items():
+        if views and name not in views:
+            continue
+
+        clients = []
+        for i in range(concurrency):
+            client = client_class()
+            if login:
+                client.force_login(users[i % len(users)])
+            clients.append(client)
+
+        with _Usage() as usage:
+            started = time.perf_counter()
+            timings = run_clients(clients, url, counts, usage)
+            elapsed = time.perf_counter() - started
+
+        results[name] = {
+            'url': url,
+            'interface': interface,
+            'requests': requests,
+            'concurrency': concurrency,
+            'rps': requests / elapsed,
+            'p50_ms': _percentile(timings, 50) * 1000,
+            'p95_ms': _percentile(timings, 95) * 1000,
+            'p99_ms': _percentile(timings, 99) * 1000,
+            'connections': usage.connections,
+            'peak_connections': usage.peak_open,
+            'peak_threads': usage.peak_threads,
+        }
+
+    return results
+
+
+def listing_context(page_size):
+    """Context of a listing page of page_size posts, without the database.
+
+    Every other post is read, as on a feed page.
+    """
+    sample = Post(content_text='\n'.join(['lorem ipsum dolor sit amet'] * 40))
+    sample.render()
+
+    author = Profile(pk=1, user=User(pk=1, username='bench',
+                                     first_name='Bench', last_name='Author'))
+    pub_date = timezone.now()
+
+    posts = []
+    for i in range(page_size):
+        post = Post(pk=i + 1, caption=f'Post {i}', pub_date=pub_date,
+                    content_html=sample.content_html,
+                    preview_html=sample.preview_html, author=author)
+        post.is_read = i % 2 == 0
+        posts.append(post)
+
+    paginator = CursorPaginator(Post.objects.none(), page_size)
+    page = paginator._page(posts + [posts[-1]], None, False)
+
+    return {
+        'user_profile': author,
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': True,
+        'object_list': posts,
+        'posts_feed': posts,
+    }
+
+
+def run_render(page_sizes=(10, 100), renders=100, engine_names=ENGINES,
+               templates=LISTING_TEMPLATES):
+    """Time renders of the listing templates with each template engine."""
+    request = RequestFactory().get('/')
+
+    results = {}
+    for template_name in templates:
+        for page_size in page_sizes:
+            context = listing_context(page_size)
+            request.user = context['user_profile'].user
+
+            result = {}
+            for engine_name in engine_names:
+                template = engines[engine_name].get_template(template_name)
+                # compiles the template
+                html = template.render(context, request)
+
+                timings = []
+                for _ in range(renders):
+                    started = time.perf_counter()
+                    template.render(context, request)
+                    timings.append(time.perf_counter() - started)
+
+                result[engine_name] = {
+                    'renders': renders,
+                    'bytes': len(html.encode()),
+                    'mean_ms': sum(timings) / renders * 1000,
+                    'p50_ms': _percentile(timings, 50) * 1000,
+                    'p95_ms': _percentile(timings, 95) * 1000,
+                }
+
+            if len(result) > 1:
+                fastest = min(result, key=lambda name: result[name]['mean_ms'])
+                result['fastest'] = fastest
+            name = template_name.rsplit('/', 1)[-1].split('.')[0]
+            results[f'{name}_{page_size}'] = result
+
+    return results
+
+
+def compare(baseline, current, metrics=('p95_ms', 'queries_max')):
+    changes = {}
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        changes[name] = {
+            metric: ((result[metric] - baseline[name][metric])
+                     / baseline[name][metric] if baseline[name][metric]
+                     else None)
+            for metric in metrics
+            if metric in result and metric in baseline[name]}
+
+    return changes
@@ -0,0 +1,167 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+
+# Cached pages are keyed by version counters which are bumped on writes instead of deleting cached entries. A missing version starts
+# from the current time so an evicted counter never reuses an old key.
+# The time of the last bump is kept next to each counter for Last-Modified.
+
+STATS_KINDS = ('page',)
+
+
+def incr(key, delta=1, initial=0):
+    # add() is atomic, increments of processes that both miss the key
+    # are not lost
+    cache.add(key, initial, None)
+    return cache.incr(key, delta)
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _get_or_add(keys, initial):
+    values = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in values]
+    if missing:
+        # the value added first wins, so every process derives the same
+        # keys and validators from it
+        for key in missing:
+            cache.add(key, initial, None)
+        values.update(cache.get_many(missing))
+
+    return values
+
+
+def get_versions(*names):
+    keys = [_version_key(name) for name in names]
+    versions = _get_or_add(keys, int(time.time() * 1000))
+
+    return [versions[key] for key in keys]
+
+
+def _modified_key(name):
+    return f'modified:{name}'
+
+
+def bump_version(*names):
+    for name in names:
+        incr(_version_key(name), initial=int(time.time() * 1000))
+
+    cache.set_many({_modified_key(name): time.time() for name in names},
+                   None)
+
+
+def get_last_modified(*names):
+    modified = _get_or_add([_modified_key(name) for name in names],
+                           time.time())
+
+    return datetime.fromtimestamp(max(modified.values()), timezone.utc)
+
+
+def invalidate_post(post):
+    bump_version('posts', f'blog:{post.author_id}', f'post:{post.pk}')
+
+
+def invalidate_user():
+    bump_version('users')
+
+
+def make_key(prefix, *parts):
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def record(kind, hit):
+    incr(f'stats:{kind}:{"hit" if hit else "miss"}')
+
+
+def get_stats():
+    keys = [f'stats:{kind}:{result}'
+            for kind in STATS_KINDS for result in ('hit', 'miss')]
+    values = cache.get_many(keys)
+
+    stats = {}
+    for kind in STATS_KINDS:
+        hit = values.get(f'stats:{kind}:hit', 0)
+        miss = values.get(f'stats:{kind}:miss', 0)
+        stats[kind] = {
+            'hit': hit,
+            'miss': miss,
+            'ratio': hit / (hit + miss) if hit + miss else None,
+        }
+
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([f'stats:{kind}:{result}'
+                       for kind in STATS_KINDS for result in ('hit', 'miss')])
+
+
+def get_page(request, versions):
+    key = make_key('page', request.get_full_path(), *get_versions(*versions))
+
+    content = cache.get(key)
+    record('page', content is not None)
+    return key, (HttpResponse(content) if content is not None else None)
+
+
+def set_page(key, response):
+    if response.status_code == 200 and hasattr(response, 'render'):
+        response.add_post_render_callback(
+            lambda response: cache.set(key, response.content,
+                                       settings.CACHE_PAGE_TIMEOUT))
+
+
+class AnonymousPageCacheMixin:
+    """Serve whole pages to anonymous visitors from the cache."""
+
+    cache_pages = True
+
+    def get_page_cache_versions(self):
+        return ['users']
+
+    def dispatch(self, request, *args, **kwargs):
+        if (not self.cache_pages or request.method != 'GET'
+                or request.user.is_authenticated):
+            return super().dispatch(request, *args, **kwargs)
+
+        key, response = get_page(request, self.get_page_cache_versions())
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        set_page(key, response)
+
+        return response
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match/If-Modified-Since from the version counters.
+
+    The view's get_page_cache_versions() names the counters the response
+    depends on, a 304 is returned before the view itself runs.
+    """
+
+    def _etag(self, request, *args, **kwargs):
+        return make_key('etag', request.get_full_path(),
+                        *get_versions(*self.get_page_cache_versions()))
+
+    def _last_modified(self, request, *args, **kwargs):
+        return get_last_modified(*self.get_page_cache_versions())
+
+    def dispatch(self, request, *args, **kwargs):
+        view = condition(etag_func=self._etag,
+                         last_modified_func=self._last_modified)(
+            super().dispatch)
+
+        return view(request, *args, **kwargs)
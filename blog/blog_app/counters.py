@@ -0,0 +1,100 @@
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import ArchivedPost, Post, Profile
+
+
+Follow = Profile.following.through
+
+
+def change_post_count(author_pk, delta):
+    Profile.objects.filter(pk=author_pk).update(
+        post_count=F('post_count') + delta)
+
+
+def change_follow_counts(follower_pks, followee_pks, delta):
+    # every follower gains (loses) every followee
+    Profile.objects.filter(pk__in=follower_pks).update(
+        following_count=F('following_count') + delta * len(followee_pks))
+    Profile.objects.filter(pk__in=followee_pks).update(
+        followers_count=F('followers_count') + delta * len(follower_pks))
+
+
+def lock_profiles(pks):
+    # in pk order, so that transactions locking the same profiles don't
+    # deadlock
+    list(Profile.objects.select_for_update().filter(pk__in=pks)
+         .order_by('pk').values_list('pk', flat=True))
+
+
+def existing_follows(follower_pks=None, followee_pks=None):
+    follows = Follow.objects.select_for_update()
+    if follower_pks is not None:
+        follows = follows.filter(from_profile_id__in=follower_pks)
+    if followee_pks is not None:
+        follows = follows.filter(to_profile_id__in=followee_pks)
+
+    return list(follows.values_list('from_profile_id', 'to_profile_id'))
+
+
+def _decrement(field, counts):
+    # one UPDATE for any number of profiles, each by its own count
+    if not counts:
+        return
+
+    Profile.objects.filter(pk__in=counts).update(**{
+        field: F(field) - Case(*(When(pk=pk, then=Value(count))
+                                 for pk, count in counts.items()))})
+
+
+def remove_posts(counts):
+    """Count off posts, counts maps author pks to their number."""
+    _decrement('post_count', counts)
+
+
+def remove_follows(follows):
+    followers, followees = {}, {}
+    for follower, followee in follows:
+        followers[follower] = followers.get(follower, 0) + 1
+        followees[followee] = followees.get(followee, 0) + 1
+
+    _decrement('following_count', followers)
+    _decrement('followers_count', followees)
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('*')).values('count')), 0)
+
+
+def _post_count():
+    # archived posts still count, deleted ones don't
+    return (_count(Post.objects.filter(deleted_at__isnull=True), 'author')
+            + _count(ArchivedPost.objects.all(), 'author'))
+
+
+def actual_counts():
+    return {
+        'actual_post_count': _post_count(),
+        'actual_followers_count': _count(Follow.objects.all(), 'to_profile'),
+        'actual_following_count': _count(Follow.objects.all(),
+                                         'from_profile'),
+    }
+
+
+def reconcile(profiles):
+    drifted = (profiles.annotate(**actual_counts())
+               .exclude(post_count=F('actual_post_count'),
+                        followers_count=F('actual_followers_count'),
+                        following_count=F('actual_following_count'))
+               .values_list('pk', flat=True))
+
+    fixed = 0
+    for pk in drifted:
+        fixed += Profile.objects.filter(pk=pk).update(
+            post_count=_post_count(),
+            followers_count=_count(Follow.objects.all(), 'to_profile'),
+            following_count=_count(Follow.objects.all(), 'from_profile'))
+
+    return fixed
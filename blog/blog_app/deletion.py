@@ -0,0 +1,125 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import counters
+from .cache import invalidate_post
+from .models import ArchivedPost, Post, Profile
+from .routers import PRIMARY
+
+
+# Deleting a profile or a post only sets its deleted_at, which hides it
+# right away: post listings go through visible(), deleted profiles can't
+# sign in and their pages are not found. The rows that depend on it are
+# deleted in the background, see purge.py. Any number of rows is hidden
+# with one UPDATE; the signals below are sent with their pks, so that the
+# counters, the search index and the caches are updated in bulk.
+
+# sent with pks and authors, the number of hidden posts per author pk
+posts_deleted = Signal()
+# sent with pks and user_pks
+profiles_deleted = Signal()
+
+
+def _profiles_key():
+    return 'deletion:profiles'
+
+
+def deleted_profiles():
+    pks = cache.get(_profiles_key())
+    if pks is None:
+        pks = set(Profile.objects.using(PRIMARY)
+                  .filter(deleted_at__isnull=False)
+                  .values_list('pk', flat=True))
+        cache.set(_profiles_key(), pks, settings.DELETED_PROFILES_TIMEOUT)
+
+    return pks
+
+
+def invalidate_profiles():
+    def delete():
+        cache.delete(_profiles_key())
+
+    # sets loaded by other connections before commit are dropped again
+    delete()
+    transaction.on_commit(delete)
+
+
+def visible(queryset):
+    """Exclude deleted posts and the posts of deleted profiles."""
+    if not queryset.model.is_archived:
+        queryset = queryset.filter(deleted_at__isnull=True)
+
+    hidden = deleted_profiles()
+    return queryset.exclude(author_id__in=hidden) if hidden else queryset
+
+
+def _hide(queryset, *fields):
+    model = queryset.model
+    # locked in pk order, so that a repeated request doesn't delete the
+    # rows twice and concurrent ones don't deadlock
+    rows = list(model.objects.select_for_update()
+                .filter(pk__in=queryset.values('pk'), deleted_at__isnull=True)
+                .order_by('pk').values_list('pk', *fields))
+    if rows:
+        model.objects.filter(pk__in=[row[0] for row in rows]).update(
+            deleted_at=timezone.now())
+
+    return rows
+
+
+@transaction.atomic
+def delete_posts(posts):
+    """Hide the posts and queue their deletion, returns the number of
+    posts that were not deleted yet.
+    """
+    rows = _hide(posts, 'author_id')
+    if rows:
+        posts_deleted.send(Post, pks=[pk for pk, _ in rows],
+                           authors=Counter(author for _, author in rows))
+    return len(rows)
+
+
+@transaction.atomic
+def delete_profiles(profiles):
+    """Hide the profiles with their posts, sign their users out and queue
+    the deletion. Returns the number of profiles that were not deleted yet.
+    """
+    rows = _hide(profiles, 'user_id')
+    if rows:
+        user_pks = [user_pk for _, user_pk in rows]
+        User.objects.filter(pk__in=user_pks).update(is_active=False)
+        invalidate_profiles()
+        profiles_deleted.send(Profile, pks=[pk for pk, _ in rows],
+                              user_pks=user_pks)
+    return len(rows)
+
+
+def delete_post(post):
+    """Hide the post and queue its deletion, False if it already was."""
+    return bool(delete_posts(Post.objects.filter(pk=post.pk)))
+
+
+@transaction.atomic
+def delete_archived_post(post):
+    """Delete the archived post right away, nothing else refers to it.
+    False if it already was deleted.
+    """
+    deleted, _ = ArchivedPost.objects.filter(pk=post.pk).delete()
+    if deleted:
+        # archived posts are counted with the author's posts
+        counters.change_post_count(post.author_id, -1)
+        invalidate_post(post)
+    return bool(deleted)
+
+
+def delete_profile(profile):
+    """Hide the profile and sign its user out, False if it already was
+    deleted.
+    """
+    return bool(delete_profiles(Profile.objects.filter(pk=profile.pk)))
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import threading
+from functools import lru_cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from . import api
+
+
+# New posts are published on one channel per author and event streams
+# subscribe to the channels of the authors their user follows. Listeners
+# are asyncio queues, so idle streams hold no thread: a process keeps
+# thousands of them on its event loop.
+
+logger = logging.getLogger(__name__)
+
+POST_EVENT_FIELDS = ('pk', 'caption', 'pub_date', 'author', 'author_pk',
+                     'url')
+
+# delivered to listeners when the bus loses its connection, streams end
+# and clients reconnect
+CLOSED = object()
+
+
+def post_channel(author_pk):
+    return f'posts:{author_pk}'
+
+
+class Subscription:
+    """Async context manager listening on channels of a bus."""
+
+    def __init__(self, bus, channels):
+        self.bus = bus
+        self.channels = set(channels)
+        self.loop = None
+        self.queue = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        await self.bus._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.bus._remove(self)
+
+    def put(self, message):
+        # messages are published from request threads
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    async def get(self, timeout=None):
+        """Next message, None if nothing arrived within timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBus:
+    """Delivers messages to listeners in the same process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def _close_all(self):
+        with self._lock:
+            subscriptions = {subscription
+                             for channel in self._subscriptions.values()
+                             for subscription in channel}
+        for subscription in subscriptions:
+            subscription.put(CLOSED)
+
+    async def _add(self, subscription):
+        with self._lock:
+            added = [channel for channel in subscription.channels
+                     if not self._subscriptions.get(channel)]
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(
+                    subscription)
+        if added:
+            await self._listen(added)
+
+    async def _remove(self, subscription):
+        with self._lock:
+            removed = []
+            for channel in subscription.channels:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+                    removed.append(channel)
+        if removed:
+            await self._unlisten(removed)
+
+    async def _listen(self, channels):
+        pass
+
+    async def _unlisten(self, channels):
+        pass
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def subscribe(self, channels):
+        return Subscription(self, channels)
+
+
+class RedisBus(LocalBus):
+    """Delivers messages to listeners in every process through Redis.
+
+    A process holds a single subscriber connection, subscribed to the
+    channels its listeners need, and fans the messages out locally.
+    """
+
+    def __init__(self, url=None):
+        super().__init__()
+        self.url = url or settings.REDIS_SERVER
+        self._pubsub = None
+        self._reader = None
+
+    @cached_property
+    def client(self):
+        return redis.Redis.from_url(self.url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    async def _listen(self, channels):
+        if self._pubsub is None:
+            self._pubsub = (redis.asyncio.Redis.from_url(self.url)
+                            .pubsub(ignore_subscribe_messages=True))
+        await self._pubsub.subscribe(*channels)
+
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    async def _unlisten(self, channels):
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(*channels)
+
+    async def _read(self):
+        try:
+            async for message in self._pubsub.listen():
+                if message['type'] == 'message':
+                    self._deliver(message['channel'].decode(),
+                                  json.loads(message['data']))
+        except redis.RedisError:
+            logger.exception('Lost the event bus connection.')
+            self._pubsub = None
+            self._close_all()
+
+
+@lru_cache(maxsize=None)
+def _get_bus(path):
+    return import_string(path)()
+
+
+def get_bus():
+    return _get_bus(settings.EVENTS_BUS)
+
+
+def post_message(post):
+    return {field: api.POST_FIELDS[field](post)
+            for field in POST_EVENT_FIELDS}
+
+
+def publish_post(post):
+    try:
+        get_bus().publish(post_channel(post.author_id), post_message(post))
+    except redis.RedisError:
+        # followers still get the post on their next feed load
+        logger.warning('Could not publish post %s.', post.pk, exc_info=True)
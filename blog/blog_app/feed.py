@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from . import deletion, graph
+from .models import FeedEntry, Post
+from .utils import bulk_create
+
+
+# Feed timelines are materialized on write (fan-out) into FeedEntry rows.
+# Authors with more than FEED_FANOUT_MAX_FOLLOWERS followers are skipped
+# on write and their posts are pulled into the feed on read instead.
+
+def is_fanout_author(profile_pk):
+    return profile_pk not in graph.pulled()
+
+
+def fanout_authors(profile_pks):
+    return set(profile_pks) - graph.pulled()
+
+
+def pulled_authors(profile):
+    return graph.pulled_authors(profile.pk)
+
+
+def push_post(post):
+    if not is_fanout_author(post.author_id):
+        return
+
+    bulk_create(FeedEntry,
+                (FeedEntry(profile_id=follower, post_id=post.pk,
+                           pub_date=post.pub_date)
+                 for follower in graph.followers(post.author_id)),
+                ignore_conflicts=True)
+
+
+def add_follows(follower_pks, author_pks, limit=None):
+    # copies the latest `limit` posts of every fan-out author to every
+    # follower with a single select
+    limit = settings.FEED_BACKFILL_SIZE if limit is None else limit
+
+    authors = fanout_authors(author_pks)
+    if not authors or not follower_pks:
+        return
+
+    posts = Post.objects.filter(author_id__in=authors,
+                                deleted_at__isnull=True)
+    if limit:
+        posts = (posts.annotate(rank=Window(
+            RowNumber(), partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('pk').desc())))
+            .filter(rank__lte=limit))
+    posts = list(posts.values_list('pk', 'pub_date'))
+
+    bulk_create(FeedEntry,
+                (FeedEntry(profile_id=follower, post_id=pk,
+                           pub_date=pub_date)
+                 for follower in follower_pks for pk, pub_date in posts),
+                ignore_conflicts=True)
+
+
+def remove_follows(follower_pks, author_pks):
+    FeedEntry.objects.filter(profile_id__in=follower_pks,
+                             post__author_id__in=author_pks).delete()
+
+
+def add_authors(profile, author_pks, limit=None):
+    add_follows({profile.pk}, author_pks, limit=limit)
+
+
+def remove_authors(profile, author_pks):
+    remove_follows({profile.pk}, author_pks)
+
+
+def rebuild(profile, limit=None):
+    FeedEntry.objects.filter(profile=profile).delete()
+    add_authors(profile, profile.following.values_list('pk', flat=True),
+                limit=limit)
+
+
+def feed_queryset(profile, pulled=None):
+    # feed_date and feed_pk are the timeline entry columns on the pure
+    # fan-out path, so that ordering and keyset pagination can use the
+    # FeedEntry index
+    if pulled is None:
+        pulled = pulled_authors(profile)
+
+    posts = deletion.visible(Post.objects.all())
+    if not pulled:
+        return (posts.filter(feedentry__profile=profile)
+                .annotate(feed_date=F('feedentry__pub_date'),
+                          feed_pk=F('feedentry__post'))
+                .order_by('-feed_date', '-feed_pk'))
+
+    timeline = FeedEntry.objects.filter(profile=profile).values('post_id')
+    return (posts.filter(Q(pk__in=timeline) | Q(author__in=pulled))
+            .annotate(feed_date=F('pub_date'), feed_pk=F('pk'))
+            .order_by('-feed_date', '-feed_pk'))
@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class IntegerSetField(models.TextField):
+    """Set of integers stored as a comma separated string."""
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, set):
+            return value
+        if not value:
+            return set()
+        return {int(item) for item in value.split(',')}
+
+    def get_prep_value(self, value):
+        return ','.join(str(item) for item in sorted(value or ()))
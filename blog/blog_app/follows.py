@@ -0,0 +1,66 @@
+import re
+
+from django.db import transaction
+
+from . import cache, counters, feed, graph, reads
+from .models import Profile
+
+
+# Bulk follow changes go through profile.following.add()/remove() once,
+# so the profile_update signal handler sees the whole pk set and updates
+# counters, timelines and read state in a constant number of statements.
+
+def parse_usernames(text):
+    return {username.lstrip('@') for username in re.split(r'[\s,;]+', text)
+            if username.lstrip('@')}
+
+
+def remove_pairs(pairs):
+    """Update everything derived from (follower, followee) pairs.
+
+    Counters, timelines, read state and cached lists, for follows that
+    the caller then deletes.
+    """
+    counters.remove_follows(pairs)
+
+    follower_pks = {follower for follower, _ in pairs}
+    followee_pks = {followee for _, followee in pairs}
+    reads.clear(follower_pks, followee_pks)
+    feed.remove_follows(follower_pks, followee_pks)
+    graph.update(follower_pks, followee_pks)
+    cache.bump_version(*(f'blog:{pk}' for pk in followee_pks),
+                       *(f'feed:{pk}' for pk in follower_pks))
+
+
+@transaction.atomic
+def follow(profile, profile_pks):
+    pks = set(Profile.objects.filter(pk__in=profile_pks,
+                                     deleted_at__isnull=True)
+              .exclude(pk=profile.pk)
+              .exclude(pk__in=profile.following.values('pk'))
+              .values_list('pk', flat=True))
+    if pks:
+        profile.following.add(*pks)
+
+    return pks
+
+
+@transaction.atomic
+def unfollow(profile, profile_pks):
+    pks = set(profile.following.filter(pk__in=profile_pks)
+              .values_list('pk', flat=True))
+    if pks:
+        profile.following.remove(*pks)
+
+    return pks
+
+
+def import_follows(profile, usernames):
+    """Follow profiles by username, returns followed pks and unknown names."""
+    usernames = set(usernames)
+    found = dict(Profile.objects.filter(user__username__in=usernames,
+                                        deleted_at__isnull=True)
+                 .values_list('user__username', 'pk'))
+
+    return (follow(profile, found.values()),
+            sorted(usernames - set(found)))
@@ -0,0 +1,118 @@
+import os
+import re
+from functools import lru_cache
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+
+# The web fonts are served with the other static files instead of from
+# Google Fonts: fetch() downloads the woff2 files of FAMILIES in SUBSETS
+# into blog_app/static/blog_app/fonts and writes fonts.css with their
+# @font-face rules, run it again to update the fonts. The files are
+# committed with the app, without them pages link Google Fonts, see
+# stylesheet_url().
+
+FAMILIES = ('Roboto Slab', 'Vollkorn')
+SUBSETS = ('cyrillic', 'latin')
+CSS_URL = 'https://fonts.googleapis.com/css2?{}&display=swap'
+# Google Fonts only serves woff2 to browsers that support it
+USER_AGENT = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+FONTS_CSS = 'blog_app/fonts/fonts.css'
+HEADER = '''/* Self-hosted fonts, generated by `manage.py fetch_fonts`, which
+   downloads the font files next to this file. */
+'''
+
+URL_RE = re.compile(r'url\(([^)]+)\)')
+FACE_RE = re.compile(r'/\* ([\w-]+) \*/\s*@font-face\s*\{(.*?)\}', re.DOTALL)
+
+
+def _property(block, name):
+    match = re.search(rf'{name}:\s*([^;]+);', block)
+    return match.group(1).strip() if match else None
+
+
+def _css_url(families):
+    return CSS_URL.format('&'.join(f'family={family.replace(" ", "+")}'
+                                   for family in families))
+
+
+def stylesheet_url():
+    """Url of the stylesheet with the @font-face rules of FAMILIES."""
+    if settings.LOCAL_FONTS and shipped():
+        return static(FONTS_CSS)
+    return _css_url(FAMILIES)
+
+
+@lru_cache(maxsize=None)
+def shipped():
+    """Whether fonts.css and all the font files it uses are there."""
+    path = finders.find(FONTS_CSS)
+    if not path:
+        return False
+    with open(path) as css_file:
+        names = URL_RE.findall(css_file.read())
+    directory = os.path.dirname(path)
+    return bool(names) and all(
+        os.path.isfile(os.path.join(directory, name)) for name in names)
+
+
+def _get(url):
+    with urlopen(Request(url, headers={'User-Agent': USER_AGENT}),
+                 timeout=30) as response:
+        return response.read()
+
+
+def localize(css, subsets=SUBSETS):
+    """@font-face rules of css for subsets with local font file names.
+
+    Returns the rewritten css and a mapping of file names to the font
+    urls they are downloaded from.
+    """
+    faces, files = [], {}
+    for subset, block in FACE_RE.findall(css):
+        if subset not in subsets:
+            continue
+
+        family = _property(block, 'font-family').strip('\'"')
+        style = _property(block, 'font-style')
+        weight = _property(block, 'font-weight')
+        url = re.search(r'url\(([^)]+)\)', _property(block, 'src')).group(1)
+
+        name = '-'.join([family.lower().replace(' ', '-'), subset, weight]
+                        + ([style] if style != 'normal' else []))
+        files[f'{name}.woff2'] = url
+
+        local = family.replace(' ', '')
+        faces.append(
+            f'/* {subset} */\n'
+            f'@font-face {{\n'
+            f"  font-family: '{family}';\n"
+            f'  font-style: {style};\n'
+            f'  font-weight: {weight};\n'
+            f'  font-display: swap;\n'
+            f"  src: local('{family}'), local('{local}-Regular'),\n"
+            f"       url({name}.woff2) format('woff2');\n"
+            f"  unicode-range: {_property(block, 'unicode-range')};\n"
+            f'}}\n')
+
+    return '\n'.join([HEADER, *faces]), files
+
+
+def fetch(families=FAMILIES, subsets=SUBSETS, get=_get):
+    """Download the fonts and rewrite fonts.css, returns the file names."""
+    css, files = localize(get(_css_url(families)).decode(), subsets)
+
+    directory = os.path.dirname(finders.find(FONTS_CSS))
+    for name, url in files.items():
+        with open(os.path.join(directory, name), 'wb') as font_file:
+            font_file.write(get(url))
+    with open(os.path.join(directory, 'fonts.css'), 'w') as css_file:
+        css_file.write(css)
+
+    shipped.cache_clear()
+    return sorted(files)
@@ -0,0 +1,166 @@
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Profile
+from .routers import PRIMARY
+from .utils import BULK_BATCH_SIZE, chunks
+
+
+# The follow graph is cached as adjacency lists, the followers and the
+# followed profiles of every profile as sorted arrays of 4 byte ids, plus
+# the authors pulled into feeds on read (more than
+# FEED_FANOUT_MAX_FOLLOWERS followers). Lists of changed profiles and the
+# pulled authors are dropped when follows change, right away and again on
+# commit, and are loaded back with one indexed query by the next read.
+
+Follow = Profile.following.through
+
+FOLLOWERS = 'followers'
+FOLLOWING = 'following'
+# (column of the profile, column of its neighbours)
+COLUMNS = {
+    FOLLOWERS: ('to_profile_id', 'from_profile_id'),
+    FOLLOWING: ('from_profile_id', 'to_profile_id'),
+}
+
+TYPECODE = 'I'
+
+
+def _key(direction, pk):
+    return f'graph:{direction}:{pk}'
+
+
+def _pulled_key():
+    # a changed threshold starts a new set
+    return f'graph:pulled:{settings.FEED_FANOUT_MAX_FOLLOWERS}'
+
+
+def _pack(pks):
+    return array(TYPECODE, sorted(pks)).tobytes()
+
+
+def _unpack(data):
+    pks = array(TYPECODE)
+    pks.frombytes(data)
+    return pks
+
+
+def _load(direction, pks):
+    column, neighbour = COLUMNS[direction]
+    lists = {pk: [] for pk in pks}
+    for pk, other in (Follow.objects.using(PRIMARY)
+                      .filter(**{f'{column}__in': pks})
+                      .values_list(column, neighbour).iterator()):
+        lists[pk].append(other)
+
+    return {pk: _pack(other) for pk, other in lists.items()}
+
+
+def _get_many(direction, pks):
+    keys = {_key(direction, pk): pk for pk in pks}
+    lists = {keys[key]: data for key, data in cache.get_many(keys).items()}
+
+    missing = [pk for pk in keys.values() if pk not in lists]
+    if missing:
+        loaded = _load(direction, missing)
+        cache.set_many({_key(direction, pk): data
+                        for pk, data in loaded.items()},
+                       settings.FOLLOW_GRAPH_TIMEOUT)
+        lists.update(loaded)
+
+    return {pk: _unpack(data) for pk, data in lists.items()}
+
+
+def followers(profile_pk):
+    return _get_many(FOLLOWERS, [profile_pk])[profile_pk]
+
+
+def following(profile_pk):
+    return _get_many(FOLLOWING, [profile_pk])[profile_pk]
+
+
+def is_following(follower_pk, author_pk):
+    pks = following(follower_pk)
+    i = bisect_left(pks, author_pk)
+    return i < len(pks) and pks[i] == author_pk
+
+
+def pulled():
+    data = cache.get(_pulled_key())
+    if data is None:
+        data = _pack(Profile.objects.using(PRIMARY)
+                     .filter(followers_count__gt=(
+                         settings.FEED_FANOUT_MAX_FOLLOWERS))
+                     .values_list('pk', flat=True))
+        cache.set(_pulled_key(), data, settings.FOLLOW_GRAPH_TIMEOUT)
+
+    return set(_unpack(data))
+
+
+def pulled_authors(profile_pk):
+    authors = pulled()
+    return [pk for pk in following(profile_pk) if pk in authors]
+
+
+def update(follower_pks, followee_pks):
+    """Drop the lists changed by follows between the given profiles.
+
+    Must be called after the followers counters were updated.
+    """
+    keys = ([_key(FOLLOWING, pk) for pk in follower_pks]
+            + [_key(FOLLOWERS, pk) for pk in followee_pks]
+            + [_pulled_key()])
+
+    def invalidate():
+        cache.delete_many(keys)
+
+    # lists loaded by other connections before commit are dropped again
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def reset(profile_pk):
+    """Start a new profile with empty lists (pks can be reused)."""
+    empty = _pack(())
+    cache.set_many({_key(FOLLOWERS, profile_pk): empty,
+                    _key(FOLLOWING, profile_pk): empty},
+                   settings.FOLLOW_GRAPH_TIMEOUT)
+    cache.delete(_pulled_key())
+
+
+def rebuild(batch_size=BULK_BATCH_SIZE):
+    """Load the lists of every profile, returns graph statistics."""
+    stats = {'profiles': 0, 'edges': 0, 'bytes': 0}
+
+    pks = Profile.objects.order_by('pk').values_list('pk', flat=True)
+    for batch in chunks(pks.iterator(), batch_size):
+        lists = {}
+        for direction in (FOLLOWERS, FOLLOWING):
+            lists.update({_key(direction, pk): data for pk, data
+                          in _load(direction, batch).items()})
+        cache.set_many(lists, settings.FOLLOW_GRAPH_TIMEOUT)
+
+        stats['profiles'] += len(batch)
+        stats['bytes'] += sum(len(data) for data in lists.values())
+
+    itemsize = array(TYPECODE).itemsize
+    # every edge is stored once in each direction
+    stats['edges'] = stats['bytes'] // itemsize // 2
+
+    cache.delete(_pulled_key())
+    stats['pulled'] = len(pulled())
+    stats['bytes'] += stats['pulled'] * itemsize
+    stats['built'] = time.time()
+
+    cache.set('graph:stats', stats, None)
+    return stats
+
+
+def get_stats():
+    """Statistics of the last rebuild, None if there was none."""
+    return cache.get('graph:stats')
@@ -0,0 +1,30 @@
+from django.template.defaultfilters import date, urlencode
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.timezone import template_localtime
+from jinja2 import Environment, Undefined
+from . import fonts
+
+
+# Environment of the Jinja2 versions of the listing templates (see
+# blog_app/jinja2), rendered instead of the Django templates when
+# LISTING_TEMPLATE_ENGINE = 'jinja2'. They output the same HTML.
+
+def url(name, *args):
+    return reverse(name, args=args)
+
+
+def local_date(value, arg=None):
+    # Django templates convert datetimes to the current time zone first
+    return date(template_localtime(value), arg)
+
+
+def environment(**options):
+    # missing variables render empty as in Django templates, also with DEBUG
+    options['undefined'] = Undefined
+
+    env = Environment(**options)
+    env.globals.update(url=url, static=static, fonts_url=fonts.stylesheet_url)
+    env.filters.update(date=local_date, urlencode=urlencode)
+
+    return env
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog_app import archive
+
+
+class Command(BaseCommand):
+    help = 'Move old posts to the archive and prune their read markers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive posts older than this.')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.ARCHIVE_BATCH_SIZE,
+                            help='Posts moved per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches, the next '
+                                 'run continues.')
+
+    def handle(self, *args, **options):
+        archived, pruned = archive.run(archive.archive_cutoff(options['days']),
+                                       options['batch_size'],
+                                       options['max_batches'])
+
+        self.stdout.write(f'Archived {archived} posts, '
+                          f'pruned {pruned} read markers.')
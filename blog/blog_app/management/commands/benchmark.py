@@ -0,0 +1,91 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from blog_app import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic dataset into a throwaway test database and '
+            'measure latency, throughput and query counts of the blog views.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=50,
+                            help='Follow targets drawn per user.')
+        parser.add_argument('--distribution', default='zipf',
+                            choices=benchmark.DISTRIBUTIONS)
+        parser.add_argument('--posts', type=int, default=20,
+                            help='Posts per user.')
+        parser.add_argument('--read-ratio', type=float, default=0.5)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per view.')
+        parser.add_argument('--viewers', type=int, default=10,
+                            help='Logged in users requesting the feed.')
+        parser.add_argument('--view', action='append', dest='views',
+                            help='Only benchmark this view (repeatable).')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the cache before every request.')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Concurrent clients, 0 to request views '
+                                 'one at a time and count queries.')
+        parser.add_argument('--interface', default='wsgi',
+                            choices=benchmark.INTERFACES,
+                            help='Handler used for concurrent requests, '
+                                 'asgi serves the async views.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--label', default='',
+                            help='Label stored in the report, '
+                                 'e.g. a commit hash.')
+        parser.add_argument('--output', help='Write JSON report to file.')
+        parser.add_argument('--compare',
+                            help='JSON report to compare results with.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('At least two users are required.')
+        if options['interface'] == 'asgi' and not options['concurrency']:
+            options['concurrency'] = 1
+
+        config = {key: options[key] for key in (
+            'users', 'follows', 'distribution', 'posts', 'read_ratio',
+            'requests', 'viewers', 'cold', 'concurrency', 'interface',
+            'seed')}
+
+        with benchmark.isolated_environment(keepdb=options['keepdb']):
+            profile_pks = benchmark.seed(
+                users=options['users'], follows=options['follows'],
+                distribution=options['distribution'], posts=options['posts'],
+                read_ratio=options['read_ratio'], random_seed=options['seed'])
+            if options['concurrency']:
+                results = benchmark.run_concurrent(
+                    profile_pks, requests=options['requests'],
+                    concurrency=options['concurrency'],
+                    interface=options['interface'],
+                    viewers=options['viewers'], views=options['views'],
+                    random_seed=options['seed'])
+            else:
+                results = benchmark.run(
+                    profile_pks, requests=options['requests'],
+                    viewers=options['viewers'], views=options['views'],
+                    cold=options['cold'], random_seed=options['seed'])
+
+        report = {
+            'label': options['label'],
+            'vendor': connection.vendor,
+            'config': config,
+            'results': results,
+        }
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                report['changes'] = benchmark.compare(
+                    json.load(baseline)['results'], results)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        self.stdout.write(output)
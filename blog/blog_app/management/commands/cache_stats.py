@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog_app import cache
+
+
+class Command(BaseCommand):
+    help = 'Show page cache hit/miss counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset counters after reporting.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(cache.get_stats(), indent=2))
+
+        if options['reset']:
+            cache.reset_stats()
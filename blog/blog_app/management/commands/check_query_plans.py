@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog_app import benchmark, query_plans
+from blog_app.models import Profile
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database and fail if the main view '
+            'queries are planned with full table scans or sorts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--follows', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with benchmark.isolated_environment():
+            benchmark.seed(users=options['users'],
+                           follows=options['follows'],
+                           posts=options['posts'])
+
+            profile = Profile.objects.order_by('-following_count').first()
+            author = Profile.objects.order_by('-followers_count').first()
+
+            if options['verbosity'] > 1:
+                for name, queryset in query_plans.view_querysets(
+                        profile, author).items():
+                    self.stdout.write(name)
+                    for line in query_plans.explain(queryset):
+                        self.stdout.write(f'    {line}')
+
+            problems = query_plans.check(profile, author)
+
+        if problems:
+            raise CommandError('\n'.join(
+                f'{name}: {line}'
+                for name, lines in problems.items() for line in lines))
+
+        self.stdout.write('All query plans use indexes.')
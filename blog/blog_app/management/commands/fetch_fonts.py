@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blog_app import fonts
+
+
+class Command(BaseCommand):
+    help = ('Download the web fonts from Google Fonts into the static files '
+            'and regenerate fonts.css.')
+
+    def handle(self, *args, **options):
+        for name in fonts.fetch():
+            self.stdout.write(f'Saved {name}.')
+        self.stdout.write('Commit them with fonts.css to serve them.')
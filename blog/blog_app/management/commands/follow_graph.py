@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog_app import graph
+from blog_app.utils import BULK_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Show the size of the cached follow graph as of its last '
+            'rebuild, or rebuild it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Load the follow lists of all profiles '
+                                 'into the cache first.')
+        parser.add_argument('--batch-size', type=int,
+                            default=BULK_BATCH_SIZE,
+                            help='Profiles loaded per batch.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            stats = graph.rebuild(options['batch_size'])
+        else:
+            stats = graph.get_stats()
+            if stats is None:
+                raise CommandError('The follow graph was not rebuilt yet, '
+                                   'run the command with --rebuild.')
+
+        self.stdout.write(json.dumps(stats, indent=2))
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog_app import profiling
+
+
+class Command(BaseCommand):
+    help = 'Show per-view query profiling collected by the middleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', default='db_ms_mean',
+                            help='Report field to sort views by.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset collected data after reporting.')
+
+    def handle(self, *args, **options):
+        report = profiling.get_report()
+        ordered = dict(sorted(report.items(),
+                              key=lambda item: item[1][options['sort']],
+                              reverse=True))
+        self.stdout.write(json.dumps(ordered, indent=2))
+
+        if options['reset']:
+            profiling.reset_report()
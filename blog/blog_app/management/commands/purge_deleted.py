@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog_app import purge
+
+
+class Command(BaseCommand):
+    help = 'Delete the rows of deleted profiles and posts in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.DELETION_BATCH_SIZE,
+                            help='Rows deleted per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches, the next '
+                                 'run continues.')
+
+    def summary(self, totals):
+        return ', '.join(f'{count} {kind.replace("_", " ")}'
+                         for kind, count in totals.items())
+
+    def handle(self, *args, **options):
+        def progress(totals):
+            if options['verbosity'] > 1:
+                self.stdout.write(self.summary(totals))
+
+        totals = purge.purge(options['batch_size'], options['max_batches'],
+                             progress)
+        pending = purge.pending()
+
+        self.stdout.write(f'Deleted {self.summary(totals)}. '
+                          f'{pending["profiles"]} profiles and '
+                          f'{pending["posts"]} posts left.')
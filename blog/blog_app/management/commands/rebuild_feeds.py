@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog_app import feed
+from blog_app.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized feed timelines from follow relationships.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_pk', nargs='*', type=int,
+                            help='Profiles to rebuild (all by default).')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Posts per followed author to copy '
+                                 '(FEED_BACKFILL_SIZE by default, 0 for all).')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.order_by('pk')
+        if options['profile_pk']:
+            profiles = profiles.filter(pk__in=options['profile_pk'])
+
+        rebuilt = 0
+        for profile in profiles.iterator():
+            with transaction.atomic():
+                feed.rebuild(profile, limit=options['limit'])
+            rebuilt += 1
+
+        self.stdout.write(f'Rebuilt {rebuilt} feed timelines.')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog_app import search
+
+
+class Command(BaseCommand):
+    help = 'Reindex all posts for full-text search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Posts indexed per statement.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f'Indexed {indexed} posts.')
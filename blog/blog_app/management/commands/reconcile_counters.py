@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from blog_app import counters
+from blog_app.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Recompute drifted profile post/follower/following counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Profiles checked per batch.')
+
+    def handle(self, *args, **options):
+        checked = fixed = 0
+        last_pk = 0
+
+        while True:
+            batch = list(Profile.objects.filter(pk__gt=last_pk)
+                         .order_by('pk')
+                         .values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+
+            fixed += counters.reconcile(Profile.objects.filter(pk__in=batch))
+            checked += len(batch)
+            last_pk = batch[-1]
+
+        self.stdout.write(f'Checked {checked} profiles, fixed {fixed}.')
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog_app import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send committed outbox messages to the Celery broker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.OUTBOX_BATCH_SIZE,
+                            help='Messages sent per transaction.')
+        parser.add_argument('--interval', type=float,
+                            default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Seconds to wait when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the outbox is drained.')
+
+    def handle(self, *args, **options):
+        sent = 0
+
+        while True:
+            batch = outbox.relay(options['batch_size'])
+            sent += batch
+            if batch == options['batch_size']:
+                continue
+
+            purged = outbox.purge()
+            if options['once']:
+                break
+
+            if options['verbosity'] > 1 and (sent or purged):
+                self.stdout.write(f'Sent {sent} messages, purged {purged}.')
+            sent = 0
+            time.sleep(options['interval'])
+
+        self.stdout.write(f'Sent {sent} messages, purged {purged}.')
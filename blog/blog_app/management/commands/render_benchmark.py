@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog_app import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Measure render times of the post listing templates with the '
+            'Django and Jinja2 engines.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, action='append',
+                            dest='page_sizes',
+                            help='Posts per page (repeatable), 10 and 100 '
+                                 'by default.')
+        parser.add_argument('--renders', type=int, default=200,
+                            help='Timed renders per template and engine.')
+        parser.add_argument('--engine', action='append', dest='engines',
+                            choices=benchmark.ENGINES,
+                            help='Only time this engine (repeatable).')
+        parser.add_argument('--label', default='',
+                            help='Label stored in the report, '
+                                 'e.g. a commit hash.')
+        parser.add_argument('--output', help='Write JSON report to file.')
+
+    def handle(self, *args, **options):
+        config = {
+            'page_sizes': options['page_sizes'] or [10, 100],
+            'renders': options['renders'],
+            'engines': options['engines'] or list(benchmark.ENGINES),
+        }
+
+        report = {
+            'label': options['label'],
+            'config': config,
+            'results': benchmark.run_render(
+                page_sizes=config['page_sizes'], renders=config['renders'],
+                engine_names=config['engines']),
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        self.stdout.write(output)
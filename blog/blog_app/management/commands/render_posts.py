@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Render the stored HTML of posts saved before it existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Posts rendered per batch.')
+        parser.add_argument('--all', action='store_true',
+                            help='Render every post, e.g. after the '
+                                 'rendering changed.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('content_text').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(content_html='')
+
+        rendered = 0
+        last_pk = 0
+
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+
+            for post in batch:
+                post.render()
+            Post.objects.bulk_update(batch, ['content_html', 'preview_html'])
+            rendered += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(f'Rendered {rendered} posts.')
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:03
+
+import blog_app.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0002_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadMarker',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_until', models.PositiveIntegerField(default=0)),
+                ('read', blog_app.fields.IntegerSetField(blank=True, default=set)),
+                ('unread', blog_app.fields.IntegerSetField(blank=True, default=set)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog_app.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog_app.profile')),
+            ],
+            options={
+                'unique_together': {('profile', 'author')},
+            },
+        ),
+    ]
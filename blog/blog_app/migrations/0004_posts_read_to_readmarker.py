@@ -0,0 +1,74 @@
+from itertools import groupby
+
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+
+def posts_read_to_markers(apps, schema_editor):
+    Post = apps.get_model('blog_app', 'Post')
+    Profile = apps.get_model('blog_app', 'Profile')
+    ReadMarker = apps.get_model('blog_app', 'ReadMarker')
+    db_alias = schema_editor.connection.alias
+
+    rows = (Profile.posts_read.through.objects.using(db_alias)
+            .order_by('profile_id', 'post__author_id', 'post_id')
+            .values_list('profile_id', 'post__author_id', 'post_id'))
+
+    markers = []
+    for (profile_id, author_id), group in groupby(
+            rows.iterator(), key=lambda row: row[:2]):
+        read = {post_id for _, _, post_id in group}
+
+        read_until = 0
+        author_posts = (Post.objects.using(db_alias)
+                        .filter(author_id=author_id)
+                        .order_by('pk').values_list('pk', flat=True))
+        for pk in author_posts.iterator():
+            if pk not in read:
+                break
+            read.discard(pk)
+            read_until = pk
+
+        markers.append(ReadMarker(profile_id=profile_id, author_id=author_id,
+                                  read_until=read_until, read=read))
+
+        if len(markers) >= BATCH_SIZE:
+            ReadMarker.objects.using(db_alias).bulk_create(markers)
+            markers = []
+
+    ReadMarker.objects.using(db_alias).bulk_create(markers)
+
+
+def markers_to_posts_read(apps, schema_editor):
+    Post = apps.get_model('blog_app', 'Post')
+    Profile = apps.get_model('blog_app', 'Profile')
+    ReadMarker = apps.get_model('blog_app', 'ReadMarker')
+    PostRead = Profile.posts_read.through
+    db_alias = schema_editor.connection.alias
+
+    for marker in ReadMarker.objects.using(db_alias).iterator():
+        read = set(Post.objects.using(db_alias)
+                   .filter(author_id=marker.author_id,
+                           pk__lte=marker.read_until)
+                   .exclude(pk__in=marker.unread)
+                   .values_list('pk', flat=True))
+        read.update(Post.objects.using(db_alias)
+                    .filter(author_id=marker.author_id, pk__in=marker.read)
+                    .values_list('pk', flat=True))
+
+        PostRead.objects.using(db_alias).bulk_create(
+            [PostRead(profile_id=marker.profile_id, post_id=pk)
+             for pk in read])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0003_readmarker'),
+    ]
+
+    operations = [
+        migrations.RunPython(posts_read_to_markers, markers_to_posts_read),
+    ]
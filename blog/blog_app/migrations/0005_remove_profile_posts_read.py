@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0004_posts_read_to_readmarker'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='profile',
+            name='posts_read',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:03
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('*')).values('count')), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('blog_app', 'Post')
+    Profile = apps.get_model('blog_app', 'Profile')
+    Follow = Profile.following.through
+
+    Profile.objects.using(schema_editor.connection.alias).update(
+        post_count=count(Post.objects.all(), 'author'),
+        followers_count=count(Follow.objects.all(), 'to_profile'),
+        following_count=count(Follow.objects.all(), 'from_profile'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0005_remove_profile_posts_read'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
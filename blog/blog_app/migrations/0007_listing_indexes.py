@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0006_profile_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='feedentry',
+            name='blog_app_fe_profile_386f90_idx',
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['profile', '-pub_date', '-post'], name='blog_app_fe_profile_725ec2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='blog_app_po_pub_dat_bc1c99_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='blog_app_po_author__54a319_idx'),
+        ),
+        # followers of a profile are looked up by to_profile_id, the unique
+        # (from_profile_id, to_profile_id) index only serves followees
+        migrations.RunSQL(
+            'CREATE INDEX blog_app_profile_following_to_from_idx '
+            'ON blog_app_profile_following (to_profile_id, from_profile_id)',
+            'DROP INDEX blog_app_profile_following_to_from_idx',
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE blog_app_post_search ('
+            'post_id integer PRIMARY KEY REFERENCES blog_app_post (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)')
+        schema_editor.execute(
+            'CREATE INDEX blog_app_post_search_document_idx '
+            'ON blog_app_post_search USING gin (document)')
+        schema_editor.execute(
+            "INSERT INTO blog_app_post_search (post_id, document) "
+            "SELECT id, "
+            "setweight(to_tsvector(%s::regconfig, caption), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, content_text), 'B') "
+            "FROM blog_app_post",
+            [settings.SEARCH_CONFIG, settings.SEARCH_CONFIG])
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE blog_app_post_search USING fts5('
+            "caption, content_text, tokenize = 'unicode61')")
+        schema_editor.execute(
+            'INSERT INTO blog_app_post_search (rowid, caption, content_text) '
+            'SELECT id, caption, content_text FROM blog_app_post')
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE blog_app_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0007_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
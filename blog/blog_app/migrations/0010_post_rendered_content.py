@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:08
+
+from django.db import migrations, models
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+
+BATCH_SIZE = 1000
+# Post.PREVIEW_WORDS when the fields were added
+PREVIEW_WORDS = 64
+
+
+def render_posts(apps, schema_editor):
+    Post = apps.get_model('blog_app', 'Post')
+    posts = (Post.objects.using(schema_editor.connection.alias)
+             .only('content_text').order_by('pk'))
+
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        # as Post.render()
+        for post in batch:
+            post.content_html = linebreaks(post.content_text, autoescape=True)
+            post.preview_html = Truncator(post.content_html).words(
+                PREVIEW_WORDS, html=True, truncate=' …')
+        posts.bulk_update(batch, ['content_html', 'preview_html'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0009_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='preview_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_posts, migrations.RunPython.noop),
+    ]
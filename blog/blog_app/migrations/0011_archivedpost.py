@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0010_post_rendered_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('caption', models.CharField(max_length=128)),
+                ('content_text', models.TextField()),
+                ('pub_date', models.DateTimeField()),
+                ('content_html', models.TextField(blank=True)),
+                ('preview_html', models.TextField(blank=True)),
+                ('archived_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog_app.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['author', '-pub_date', '-id'], name='blog_app_ar_author__488903_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0012_deletion_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=200, unique=True)),
+                ('requests', models.PositiveBigIntegerField(default=0)),
+                ('queries', models.PositiveBigIntegerField(default=0)),
+                ('duplicates', models.PositiveBigIntegerField(default=0)),
+                ('db_us', models.PositiveBigIntegerField(default=0)),
+                ('render_us', models.PositiveBigIntegerField(default=0)),
+                ('total_us', models.PositiveBigIntegerField(default=0)),
+                ('duplicate_sql', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
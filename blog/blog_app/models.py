@@ -1,22 +1,236 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+from .fields import IntegerSetField
 
 
 class Profile(models.Model):
+    COUNTER_FIELDS = ('post_count', 'followers_count', 'following_count')
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     following = models.ManyToManyField('self', symmetrical=False)
-    posts_read = models.ManyToManyField('Post')
+
+    # maintained with F() updates from signals, see counters.py
+    post_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    # set when the profile is deleted, see deletion.py
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='profile_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         return f'{self.user.username} ({self.user.get_full_name()})'
 
+    def save(self, *args, **kwargs):
+        # never write back possibly stale counters of a loaded instance
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS]
+
+        super().save(*args, **kwargs)
+
 
 class Post(models.Model):
+    PREVIEW_WORDS = 64
+    # listings show content_html, only the feed needs preview_html
+    LIST_DEFERRED = ('content_text', 'preview_html')
+
+    is_archived = False
+
     caption = models.CharField(max_length=128)
     content_text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(Profile, on_delete=models.CASCADE)
 
+    # rendered from content_text on save, see render_posts to re-render
+    content_html = models.TextField(blank=True, editable=False)
+    preview_html = models.TextField(blank=True, editable=False)
+
+    # set when the post is deleted, see deletion.py
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # match the (pub_date, pk) keyset ordering of the listings
+        indexes = [
+            models.Index(fields=['-pub_date', '-id']),
+            models.Index(fields=['author', '-pub_date', '-id']),
+            models.Index(fields=['id'], name='post_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
+
     def __str__(self):
         return f'{self.caption}: {self.content_text[:16]} ' \
                f'({self.author.user.username} - {self.pub_date})'
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content_text' in update_fields:
+            self.render()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content_html',
+                                           'preview_html'}
+
+        super().save(*args, **kwargs)
+
+    def render(self):
+        self.content_html = linebreaks(self.content_text, autoescape=True)
+        self.preview_html = Truncator(self.content_html).words(
+            self.PREVIEW_WORDS, html=True, truncate=' …')
+
+
+class ArchivedPost(models.Model):
+    """Post moved out of the Post table by archive.py, read-only.
+
+    Keeps the pk it had as a Post, so links to it stay valid.
+    """
+    is_archived = True
+
+    id = models.IntegerField(primary_key=True)
+    caption = models.CharField(max_length=128)
+    content_text = models.TextField()
+    pub_date = models.DateTimeField()
+    author = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                               related_name='+')
+    content_html = models.TextField(blank=True)
+    preview_html = models.TextField(blank=True)
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['author', '-pub_date', '-id'])]
+
+    def __str__(self):
+        return f'{self.caption}: {self.content_text[:16]} ' \
+               f'({self.author.user.username} - {self.pub_date}, archived)'
+
+
+class FeedEntry(models.Model):
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('profile', 'post')
+        indexes = [models.Index(fields=['profile', '-pub_date', '-post'])]
+
+    def __str__(self):
+        return f'{self.profile.user.username}: {self.post_id}'
+
+
+class ReadMarker(models.Model):
+    """Read state of one author's posts for one profile.
+
+    Posts with pk up to read_until are read unless listed in unread,
+    later posts are unread unless listed in read.
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    author = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                               related_name='+')
+    read_until = models.PositiveIntegerField(default=0)
+    read = IntegerSetField(blank=True, default=set)
+    unread = IntegerSetField(blank=True, default=set)
+
+    class Meta:
+        unique_together = ('profile', 'author')
+
+    def __str__(self):
+        return (f'{self.profile.user.username} -> '
+                f'{self.author.user.username}: {self.read_until}')
+
+    def is_read(self, post_pk):
+        if post_pk <= self.read_until:
+            return post_pk not in self.unread
+        return post_pk in self.read
+
+    def mark(self, post_pk, read):
+        if post_pk <= self.read_until:
+            (self.unread.discard if read else self.unread.add)(post_pk)
+        else:
+            (self.read.add if read else self.read.discard)(post_pk)
+
+    def mark_until(self, post_pk):
+        if post_pk <= self.read_until:
+            self.unread = {pk for pk in self.unread if pk > post_pk}
+            return
+
+        self.read_until = post_pk
+        self.unread = set()
+        self.read = {pk for pk in self.read if pk > post_pk}
+
+    def compact(self, next_post_pks):
+        # next_post_pks are the author's posts after read_until in pk order
+        for pk in next_post_pks:
+            if pk not in self.read:
+                break
+            self.read.discard(pk)
+            self.read_until = pk
+
+
+class OutboxMessage(models.Model):
+    """Celery task call stored in the transaction that caused it.
+
+    Sent to the broker by the outbox relay once committed, key is the task
+    id and identifies repeated deliveries, see outbox.py.
+    """
+    key = models.CharField(max_length=200, unique=True)
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    handled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='outbox_pending_idx',
+                         condition=models.Q(sent_at__isnull=True)),
+            models.Index(fields=['sent_at']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    @transaction.atomic
+    def handle(cls, key, work):
+        """Call work and mark the message handled in one transaction,
+        unless it already was.
+
+        A repeated delivery waits on the message lock until the first one
+        is done. Tasks that were not sent through the outbox always work.
+        """
+        message = cls.objects.select_for_update().filter(key=key).first()
+        if message is not None and message.handled_at is not None:
+            return
+
+        work()
+
+        if message is not None:
+            message.handled_at = timezone.now()
+            message.save(update_fields=['handled_at'])
+
+
+class ViewProfile(models.Model):
+    """Query profiling totals of one URL name, see profiling.py."""
+    url_name = models.CharField(max_length=200, unique=True)
+    requests = models.PositiveBigIntegerField(default=0)
+    queries = models.PositiveBigIntegerField(default=0)
+    duplicates = models.PositiveBigIntegerField(default=0)
+    db_us = models.PositiveBigIntegerField(default=0)
+    render_us = models.PositiveBigIntegerField(default=0)
+    total_us = models.PositiveBigIntegerField(default=0)
+    # repeated statements of the last profiled request that had any
+    duplicate_sql = models.JSONField(default=dict)
+
+    def __str__(self):
+        return self.url_name
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from blog.celery import background_worker
+
+from . import tasks  # noqa: F401, registers the relayed tasks
+from .models import OutboxMessage
+from .utils import bulk_create
+
+
+# Side effects of a write are stored as OutboxMessage rows in its own
+# transaction and sent to Celery by a relay (the relay_outbox command),
+# so workers never see uncommitted data and requests never wait on the
+# broker. Delivery is at least once: messages are sent again when the
+# relay fails before marking them sent, tasks do their work in the
+# transaction that marks their key handled to skip repeats
+# (OutboxMessage.handle).
+
+def enqueue(key, *signatures):
+    """Store task signatures, keyed by key and the task name."""
+    bulk_create(OutboxMessage,
+                (OutboxMessage(key=f'{key}:{signature.task}',
+                               task=signature.task,
+                               args=list(signature.args))
+                 for signature in signatures),
+                ignore_conflicts=True)
+
+
+@transaction.atomic
+def relay(batch_size=None):
+    """Send a batch of pending messages, returns the number sent."""
+    messages = list(OutboxMessage.objects
+                    .select_for_update(skip_locked=True)
+                    .filter(sent_at__isnull=True).order_by('pk')
+                    [:batch_size or settings.OUTBOX_BATCH_SIZE])
+    if not messages:
+        return 0
+
+    # one broker connection for the whole batch
+    with background_worker.producer_or_acquire() as producer:
+        for message in messages:
+            background_worker.tasks[message.task].apply_async(
+                message.args, task_id=message.key, producer=producer)
+
+    OutboxMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+        sent_at=timezone.now())
+
+    return len(messages)
+
+
+def purge():
+    """Delete messages sent more than OUTBOX_RETENTION_DAYS ago."""
+    before = timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    deleted, _ = OutboxMessage.objects.filter(sent_at__lt=before).delete()
+    return deleted
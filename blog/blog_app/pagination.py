@@ -0,0 +1,225 @@
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+    """Page number paginator that estimates large counts.
+
+    Counts above ESTIMATED_COUNT_THRESHOLD are taken from the query plan
+    instead of a COUNT(*), exact counts are used on other databases.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset paginator over a descending (date_field, pk_field) ordering.
+
+    Pages are addressed by opaque signed cursors instead of page numbers,
+    so no page costs an OFFSET scan and the total count is only computed
+    when count_mode is 'exact' or 'estimated'.
+
+    archive_queryset holds rows older than every row of queryset, pages
+    continue into it once queryset runs out.
+    """
+    salt = 'blog_app.pagination.cursor'
+
+    def __init__(self, queryset, per_page, date_field='pub_date',
+                 pk_field='pk', count_mode=None, archive_queryset=None):
+        self.queryset = queryset
+        self.archive_queryset = archive_queryset
+        self.per_page = int(per_page)
+        self.date_field = date_field
+        self.pk_field = pk_field
+        self.count_mode = count_mode
+
+    @cached_property
+    def count(self):
+        if self.count_mode == 'exact':
+            return self.queryset.count()
+        elif self.count_mode == 'estimated':
+            return estimate_count(self.queryset)
+        return None
+
+    def encode_cursor(self, obj, backwards):
+        return signing.dumps(
+            (getattr(obj, self.date_field).isoformat(),
+             getattr(obj, self.pk_field), backwards),
+            salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            date, pk, backwards = signing.loads(cursor, salt=self.salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise Http404('Invalid cursor.')
+
+        date = parse_datetime(date) if isinstance(date, str) else None
+        if date is None or not isinstance(pk, int):
+            raise Http404('Invalid cursor.')
+
+        return date, pk, bool(backwards)
+
+    def _after(self, date, pk, backwards):
+        lookup = 'gt' if backwards else 'lt'
+        return (Q(**{f'{self.date_field}__{lookup}': date})
+                | Q(**{self.date_field: date,
+                       f'{self.pk_field}__{lookup}': pk}))
+
+    def page_queryset(self, cursor=None, queryset=None):
+        date, pk, backwards = (self.decode_cursor(cursor) if cursor
+                               else (None, None, False))
+
+        ordering = (self.date_field, self.pk_field)
+        if not backwards:
+            ordering = tuple(f'-{field}' for field in ordering)
+
+        queryset = (self.queryset if queryset is None
+                    else queryset).order_by(*ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(date, pk, backwards))
+
+        return queryset[:self.per_page + 1], backwards
+
+    def page_querysets(self, cursor=None):
+        """Page querysets of queryset and the archive in page order."""
+        querysets = [self.queryset]
+        if self.archive_queryset is not None:
+            querysets.append(self.archive_queryset)
+
+        pages = [self.page_queryset(cursor, queryset)
+                 for queryset in querysets]
+        backwards = pages[0][1]
+        if backwards:
+            pages.reverse()
+
+        return [queryset for queryset, _ in pages], backwards
+
+    def page(self, cursor=None):
+        querysets, backwards = self.page_querysets(cursor)
+
+        object_list = []
+        for queryset in querysets:
+            # the next queryset is only queried when this one runs out
+            object_list += queryset[:self.per_page + 1 - len(object_list)]
+            if len(object_list) > self.per_page:
+                break
+
+        return self._page(object_list, cursor, backwards)
+
+    async def apage(self, cursor=None):
+        querysets, backwards = self.page_querysets(cursor)
+
+        object_list = []
+        for queryset in querysets:
+            object_list += [
+                obj async for obj
+                in queryset[:self.per_page + 1 - len(object_list)]]
+            if len(object_list) > self.per_page:
+                break
+
+        return self._page(object_list, cursor, backwards)
+
+    def _page(self, object_list, cursor, backwards):
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if backwards:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        next_cursor = previous_cursor = None
+        if object_list:
+            if has_next:
+                next_cursor = self.encode_cursor(object_list[-1], False)
+            if has_previous:
+                previous_cursor = self.encode_cursor(object_list[0], True)
+
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    cursor_kwarg = 'cursor'
+    cursor_date_field = 'pub_date'
+    cursor_pk_field = 'pk'
+    paginate_count = None
+
+    def get_archive_queryset(self):
+        return None
+
+    def get_cursor_paginator(self, queryset, page_size):
+        return CursorPaginator(
+            queryset, page_size, date_field=self.cursor_date_field,
+            pk_field=self.cursor_pk_field, count_mode=self.paginate_count,
+            archive_queryset=self.get_archive_queryset())
+
+    def get_cursor(self):
+        return (self.kwargs.get(self.cursor_kwarg)
+                or self.request.GET.get(self.cursor_kwarg))
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        page = paginator.page(self.get_cursor())
+
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        page = await paginator.apage(self.get_cursor())
+
+        return paginator, page, page.object_list, page.has_other_pages()
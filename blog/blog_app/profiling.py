@@ -0,0 +1,150 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import F
+
+from .models import ViewProfile
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = Counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.query_count += 1
+            self.queries[sql] += 1
+
+    def duplicates(self):
+        # the same statement repeated with different parameters usually
+        # means a query per object (N+1)
+        return {sql: count for sql, count in self.queries.items()
+                if count >= settings.PROFILING_DUPLICATE_THRESHOLD}
+
+
+@contextmanager
+def profile_queries():
+    profile = RequestProfile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        yield profile
+
+
+# Totals are kept in ViewProfile rows, shared by all processes and read by
+# the report command, and are updated with F() expressions so that
+# concurrent requests don't lose increments.
+
+def record(url_name, profile, total_time):
+    values = {
+        'requests': 1,
+        'queries': profile.query_count,
+        'duplicates': sum(profile.duplicates().values()),
+        'db_us': int(profile.db_time * 1000000),
+        'render_us': int(profile.render_time * 1000000),
+        'total_us': int(total_time * 1000000),
+    }
+
+    updates = {metric: F(metric) + value for metric, value in values.items()}
+    duplicates = profile.duplicates()
+    if duplicates:
+        updates['duplicate_sql'] = duplicates
+
+    profiles = ViewProfile.objects.filter(url_name=url_name)
+    if not profiles.update(**updates):
+        # the first profiled request of this URL name
+        ViewProfile.objects.bulk_create([ViewProfile(url_name=url_name)],
+                                        ignore_conflicts=True)
+        profiles.update(**updates)
+
+
+def get_report():
+    report = {}
+    for totals in ViewProfile.objects.order_by('url_name'):
+        requests = totals.requests or 1
+
+        report[totals.url_name] = {
+            'requests': totals.requests,
+            'queries_mean': totals.queries / requests,
+            'duplicates_mean': totals.duplicates / requests,
+            'db_ms_mean': totals.db_us / requests / 1000,
+            'render_ms_mean': totals.render_us / requests / 1000,
+            'total_ms_mean': totals.total_us / requests / 1000,
+            'duplicate_sql': totals.duplicate_sql,
+        }
+
+    return report
+
+
+def reset_report():
+    ViewProfile.objects.all().delete()
+
+
+class QueryProfilingMiddleware:
+    """Profile a sample of requests, grouped by resolved URL name.
+
+    Enabled by a non-zero PROFILING_SAMPLE_RATE, the share of requests
+    that get their queries recorded.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with profile_queries() as profile:
+            request._query_profile = profile
+            response = self.get_response(request)
+        total_time = time.perf_counter() - started
+
+        match = request.resolver_match
+        url_name = (match.url_name if match and match.url_name
+                    else 'unresolved')
+        record(url_name, profile, total_time)
+
+        logger.info(json.dumps({
+            'url_name': url_name,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': profile.query_count,
+            'duplicates': profile.duplicates(),
+            'db_ms': profile.db_time * 1000,
+            'render_ms': profile.render_time * 1000,
+            'total_ms': total_time * 1000,
+        }))
+
+        return response
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, '_query_profile', None)
+        if profile is not None:
+            started = time.perf_counter()
+
+            def render_finished(response):
+                profile.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(render_finished)
+
+        return response
@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from . import cache, deletion, follows, search
+from .models import ArchivedPost, FeedEntry, Post, Profile, ReadMarker
+
+
+# Rows of deleted profiles and posts (see deletion.py) are deleted in
+# batches of DELETION_BATCH_SIZE, each in its own short transaction, and
+# every run resumes from what is left. The post, or the profile with its
+# user, is deleted last, when nothing refers to it any more.
+
+POST_TABLE = Post._meta.db_table
+KINDS = ('follows', 'feed_entries', 'read_markers', 'posts',
+         'archived_posts', 'profiles')
+
+Follow = Profile.following.through
+
+
+def _delete(queryset, batch_size):
+    pks = list(queryset.order_by('pk')
+               .values_list('pk', flat=True)[:batch_size])
+    if pks:
+        queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def _delete_follows(follows_queryset, batch_size):
+    rows = list(follows_queryset.order_by('pk')
+                .values_list('pk', 'from_profile_id', 'to_profile_id')
+                [:batch_size])
+    if rows:
+        follows.remove_pairs([(follower, followee)
+                              for _, follower, followee in rows])
+        Follow.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return len(rows)
+
+
+def _delete_posts(profile_pk, batch_size):
+    pks = list(Post.objects.filter(author_id=profile_pk).order_by('pk')
+               .values_list('pk', flat=True)[:batch_size])
+    if not pks:
+        return 0
+
+    # no Post signals, the author's counters go with the profile
+    FeedEntry.objects.filter(post_id__in=pks).delete()
+    search.remove_posts(pks)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {POST_TABLE} '
+            f'WHERE id IN ({", ".join(["%s"] * len(pks))})', pks)
+    cache.bump_version(*(f'post:{pk}' for pk in pks))
+
+    return len(pks)
+
+
+def _profile_steps(pk, batch_size):
+    # in order: follows first, they take the followers' feed entries and
+    # read markers of the profile's posts with them
+    yield 'follows', lambda: _delete_follows(
+        Follow.objects.filter(from_profile_id=pk), batch_size)
+    yield 'follows', lambda: _delete_follows(
+        Follow.objects.filter(to_profile_id=pk), batch_size)
+    yield 'feed_entries', lambda: _delete(
+        FeedEntry.objects.filter(profile_id=pk), batch_size)
+    yield 'feed_entries', lambda: _delete(
+        FeedEntry.objects.filter(post__author_id=pk), batch_size)
+    yield 'read_markers', lambda: _delete(
+        ReadMarker.objects.filter(profile_id=pk), batch_size)
+    yield 'read_markers', lambda: _delete(
+        ReadMarker.objects.filter(author_id=pk), batch_size)
+    yield 'posts', lambda: _delete_posts(pk, batch_size)
+    yield 'archived_posts', lambda: _delete(
+        ArchivedPost.objects.filter(author_id=pk), batch_size)
+
+
+@transaction.atomic
+def _purge_profile_batch(batch_size):
+    # profiles locked by another run are left to it
+    profile = (Profile.objects.select_for_update(skip_locked=True)
+               .filter(deleted_at__isnull=False).order_by('pk').first())
+    if profile is None:
+        return None
+
+    for kind, delete in _profile_steps(profile.pk, batch_size):
+        deleted = delete()
+        if deleted:
+            return kind, deleted
+
+    # the profile goes with its user, with nothing left to cascade to
+    User.objects.filter(pk=profile.user_id).delete()
+    deletion.invalidate_profiles()
+    cache.bump_version('posts', f'blog:{profile.pk}')
+    return 'profiles', 1
+
+
+@transaction.atomic
+def _purge_post_batch(batch_size):
+    post = (Post.objects.select_for_update(skip_locked=True)
+            .filter(deleted_at__isnull=False).order_by('pk').first())
+    if post is None:
+        return None
+
+    deleted = _delete(FeedEntry.objects.filter(post_id=post.pk), batch_size)
+    if deleted:
+        return 'feed_entries', deleted
+
+    post.delete()
+    return 'posts', 1
+
+
+def pending():
+    """Number of deleted profiles and posts still to be purged."""
+    return {
+        'profiles': Profile.objects.filter(deleted_at__isnull=False).count(),
+        'posts': Post.objects.filter(deleted_at__isnull=False).count(),
+    }
+
+
+def purge(batch_size=None, max_batches=None, progress=None):
+    """Delete the rows of deleted profiles and posts in batches.
+
+    At most max_batches batches if given. progress is called with the
+    totals after every batch, returns the number of rows deleted by kind.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+
+    totals = dict.fromkeys(KINDS, 0)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        result = (_purge_profile_batch(batch_size)
+                  or _purge_post_batch(batch_size))
+        if result is None:
+            break
+
+        kind, deleted = result
+        totals[kind] += deleted
+        batches += 1
+        if progress is not None:
+            progress(totals)
+
+    return totals
@@ -0,0 +1,85 @@
+import re
+
+from django.db import connections, transaction
+
+from . import deletion, feed
+from .models import Post, Profile, ReadMarker
+from .pagination import CursorPaginator
+
+
+# A plan regresses when a listing query reads a whole table or sorts the
+# filtered rows instead of walking an index in the keyset order.
+SQLITE_PROBLEMS = (
+    re.compile(r'\bSCAN (?:TABLE )?(\w+)$'),
+    re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)'),
+)
+POSTGRESQL_PROBLEMS = (
+    re.compile(r'Seq Scan on (\w+)'),
+    re.compile(r'->\s+Sort\b|^\s*Sort\b'),
+)
+
+
+def _pages(name, queryset, date_field='pub_date', pk_field='pk'):
+    paginator = CursorPaginator(queryset, 10, date_field=date_field,
+                                pk_field=pk_field)
+    first_page, _ = paginator.page_queryset()
+
+    cursor_post = first_page.first()
+    if cursor_post is None:
+        return {name: first_page}
+
+    next_page, _ = paginator.page_queryset(
+        paginator.encode_cursor(cursor_post, False))
+    return {name: first_page, f'{name}_next': next_page}
+
+
+def view_querysets(profile, author):
+    querysets = {}
+    querysets.update(_pages(
+        'all', deletion.visible(Post.objects.select_related('author__user'))))
+    querysets.update(_pages(
+        'blog', deletion.visible(Post.objects.filter(author__pk=author.pk))))
+    querysets.update(_pages(
+        'feed', feed.feed_queryset(profile).select_related('author__user'),
+        date_field='feed_date', pk_field='feed_pk'))
+    querysets['followers'] = (Profile.following.through.objects
+                              .filter(to_profile_id=author.pk)
+                              .values_list('from_profile_id', flat=True))
+    querysets['read_markers'] = ReadMarker.objects.filter(
+        profile=profile, author_id__in=[author.pk])
+
+    return querysets
+
+
+def explain(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.explain().splitlines()
+
+    # make the planner prefer any usable index, a remaining sequential scan
+    # or sort means that no index matches the query
+    with transaction.atomic(using=queryset.db):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+        return queryset.explain().splitlines()
+
+
+def find_problems(queryset):
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        patterns = SQLITE_PROBLEMS
+    elif vendor == 'postgresql':
+        patterns = POSTGRESQL_PROBLEMS
+    else:
+        return []
+
+    return [line.strip() for line in explain(queryset)
+            if any(pattern.search(line) for pattern in patterns)]
+
+
+def check(profile, author):
+    return {name: problems for name, problems in
+            ((name, find_problems(queryset)) for name, queryset
+             in view_querysets(profile, author).items())
+            if problems}
@@ -0,0 +1,135 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Window
+from django.db.models.functions import RowNumber
+
+from . import cache
+from .models import Post, ReadMarker
+from .utils import bulk_create
+
+
+# Read state is kept per (profile, author) in a single ReadMarker row:
+# a high-water mark over post pks plus sparse read/unread exceptions.
+
+def get_markers(profile, author_pks):
+    return {marker.author_id: marker for marker in
+            ReadMarker.objects.filter(profile=profile,
+                                      author_id__in=set(author_pks))}
+
+
+def read_post_ids(profile, posts):
+    posts = list(posts)
+    markers = get_markers(profile, (post.author_id for post in posts))
+
+    return {post.pk for post in posts
+            if post.author_id in markers
+            and markers[post.author_id].is_read(post.pk)}
+
+
+def is_read(profile, post):
+    return post.pk in read_post_ids(profile, [post])
+
+
+def _compact(markers):
+    # one query for the posts following read_until of every marker, at
+    # most len(marker.read) + 1 of them are needed per author
+    markers = [marker for marker in markers if marker.read]
+    if not markers:
+        return
+
+    after = Q()
+    for marker in markers:
+        after |= Q(author_id=marker.author_id, pk__gt=marker.read_until)
+
+    next_posts = {}
+    for author_pk, pk in (
+            Post.objects.filter(after)
+            .annotate(rank=Window(RowNumber(), partition_by=F('author_id'),
+                                  order_by=F('pk').asc()))
+            .filter(rank__lte=max(len(marker.read) for marker in markers) + 1)
+            .order_by('author_id', 'pk').values_list('author_id', 'pk')):
+        next_posts.setdefault(author_pk, []).append(pk)
+
+    for marker in markers:
+        marker.compact(next_posts.get(marker.author_id, ()))
+
+
+@transaction.atomic
+def _update_markers(profile, updates):
+    # updates maps author pks to functions changing that author's marker,
+    # any number of authors take the same few statements
+    if not updates:
+        return
+
+    bulk_create(ReadMarker, (ReadMarker(profile=profile, author_id=pk)
+                             for pk in updates), ignore_conflicts=True)
+    markers = list(ReadMarker.objects.select_for_update()
+                   .filter(profile=profile, author_id__in=updates))
+
+    for marker in markers:
+        updates[marker.author_id](marker)
+    _compact(markers)
+
+    ReadMarker.objects.bulk_update(markers,
+                                   ['read_until', 'read', 'unread'])
+    cache.bump_version(f'feed:{profile.pk}')
+
+
+def mark(profile, post, read=True):
+    _update_markers(profile, {
+        post.author_id: lambda marker: marker.mark(post.pk, read)})
+
+
+def toggle(profile, post):
+    _update_markers(profile, {
+        post.author_id: lambda marker: marker.mark(
+            post.pk, not marker.is_read(post.pk))})
+
+
+def mark_until(profile, author_pk, post_pk):
+    _update_markers(profile, {
+        author_pk: lambda marker: marker.mark_until(post_pk)})
+
+
+def _mark_many(marker, post_pks, read):
+    for pk in post_pks:
+        marker.mark(pk, read)
+
+
+def mark_posts(profile, post_pks, read=True):
+    by_author = {}
+    for pk, author_pk in (Post.objects.filter(pk__in=post_pks)
+                          .values_list('pk', 'author_id')):
+        by_author.setdefault(author_pk, []).append(pk)
+
+    _update_markers(profile, {
+        author_pk: partial(_mark_many, post_pks=pks, read=read)
+        for author_pk, pks in by_author.items()})
+
+    return sum(len(pks) for pks in by_author.values())
+
+
+def mark_before(profile, before, author_pks=None):
+    """Mark posts published before `before` read.
+
+    Only posts of author_pks if given, of followed authors otherwise.
+    """
+    if author_pks is None:
+        author_pks = profile.following.values('pk')
+
+    last_posts = (Post.objects
+                  .filter(author_id__in=author_pks, pub_date__lt=before)
+                  .values('author_id').annotate(last=Max('pk'))
+                  .values_list('author_id', 'last'))
+
+    updates = {author_pk: partial(ReadMarker.mark_until, post_pk=last)
+               for author_pk, last in last_posts}
+    _update_markers(profile, updates)
+
+    return len(updates)
+
+
+def clear(profile_pks, author_pks):
+    ReadMarker.objects.filter(profile_id__in=profile_pks,
+                              author_id__in=author_pks).delete()
@@ -0,0 +1,73 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# GET requests to views with use_replica = True read from one of the
+# DATABASE_REPLICAS, everything else uses default. Once a request writes
+# it reads from default too, and the client gets a cookie that keeps its
+# requests on default for DATABASE_STICKY_SECONDS, longer than the
+# replication lag, so users always see their own writes.
+
+STICKY_COOKIE = 'db_primary'
+
+# shared caches are filled from the primary: a row read from a lagging
+# replica would stay cached long after the lag is over
+PRIMARY = 'default'
+
+# a mutable state object, so that writes made in sync_to_async threads
+# are seen by the middleware
+_state = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica and not state.wrote:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as default
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(STICKY_COOKIE, '1',
+                                max_age=settings.DATABASE_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if (request.method in ('GET', 'HEAD')
+                and getattr(view_class, 'use_replica', False)
+                and STICKY_COOKIE not in request.COOKIES
+                and settings.DATABASE_REPLICAS):
+            _state.get().replica = random.choice(settings.DATABASE_REPLICAS)
@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .utils import BULK_BATCH_SIZE, chunks
+
+
+# Posts are indexed into a separate table which is kept up to date from the
+# Post save and delete signals: a tsvector column with a GIN index on
+# PostgreSQL and an FTS5 virtual table (rowid is the post pk) on SQLite.
+
+TABLE = 'blog_app_post_search'
+POST_TABLE = Post._meta.db_table
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+class PostgresBackend:
+    def index(self, cursor, pks):
+        cursor.execute(
+            f"INSERT INTO {TABLE} (post_id, document) "
+            f"SELECT id, "
+            f"setweight(to_tsvector(%s::regconfig, caption), 'A') || "
+            f"setweight(to_tsvector(%s::regconfig, content_text), 'B') "
+            f"FROM {POST_TABLE} WHERE id IN ({_placeholders(pks)}) "
+            f"ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+            [settings.SEARCH_CONFIG, settings.SEARCH_CONFIG, *pks])
+
+    def remove(self, cursor, pks):
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE post_id IN ({_placeholders(pks)})',
+            pks)
+
+    def clear(self, cursor):
+        cursor.execute(f'TRUNCATE {TABLE}')
+
+    def matches(self, query):
+        return (f'SELECT post_id FROM {TABLE} '
+                f'WHERE document @@ plainto_tsquery(%s::regconfig, %s)',
+                [settings.SEARCH_CONFIG, query])
+
+    def rank(self, query):
+        return (f'SELECT ts_rank(document, '
+                f'plainto_tsquery(%s::regconfig, %s)) FROM {TABLE} '
+                f'WHERE post_id = {POST_TABLE}.id',
+                [settings.SEARCH_CONFIG, query])
+
+
+class SQLiteBackend:
+    def index(self, cursor, pks):
+        self.remove(cursor, pks)
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, caption, content_text) '
+            f'SELECT id, caption, content_text FROM {POST_TABLE} '
+            f'WHERE id IN ({_placeholders(pks)})', pks)
+
+    def remove(self, cursor, pks):
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE rowid IN ({_placeholders(pks)})', pks)
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {TABLE}')
+
+    def _match_query(self, query):
+        # every word is quoted so that FTS5 query syntax in the user input
+        # is matched literally, words are implicitly ANDed
+        return ' '.join('"{}"'.format(word.replace('"', '""'))
+                        for word in query.split())
+
+    def matches(self, query):
+        return (f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+                [self._match_query(query)])
+
+    def rank(self, query):
+        # bm25 is lower for better matches, captions weigh twice the text
+        return (f'SELECT -bm25({TABLE}, 2.0, 1.0) FROM {TABLE} '
+                f'WHERE {TABLE} MATCH %s AND rowid = {POST_TABLE}.id',
+                [self._match_query(query)])
+
+
+BACKENDS = {
+    'postgresql': PostgresBackend(),
+    'sqlite': SQLiteBackend(),
+}
+
+
+def get_backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor)
+
+
+def index_posts(pks):
+    backend = get_backend()
+    if backend is None:
+        return
+
+    with connection.cursor() as cursor:
+        for batch in chunks(pks, BULK_BATCH_SIZE):
+            backend.index(cursor, batch)
+
+
+def remove_posts(pks):
+    backend = get_backend()
+    if backend is None:
+        return
+
+    with connection.cursor() as cursor:
+        for batch in chunks(pks, BULK_BATCH_SIZE):
+            backend.remove(cursor, batch)
+
+
+def rebuild(batch_size=BULK_BATCH_SIZE):
+    backend = get_backend()
+    if backend is None:
+        return 0
+
+    indexed = 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        pks = Post.objects.order_by('pk').values_list('pk', flat=True)
+        for batch in chunks(pks.iterator(), batch_size):
+            backend.index(cursor, batch)
+            indexed += len(batch)
+
+    return indexed
+
+
+def search(queryset, query):
+    """Filter queryset to posts matching query, best matches first."""
+    query = query.strip()
+    if not query:
+        return queryset.none()
+
+    backend = get_backend(connections[queryset.db].vendor)
+    if backend is None:
+        # no index on this database, fall back to a scan
+        return (queryset.filter(Q(caption__icontains=query)
+                                | Q(content_text__icontains=query))
+                .annotate(search_rank=Value(0.0, output_field=FloatField()))
+                .order_by('-pub_date', '-pk'))
+
+    return (queryset.filter(id__in=RawSQL(*backend.matches(query)))
+            .annotate(search_rank=RawSQL(*backend.rank(query),
+                                         output_field=FloatField()))
+            .order_by('-search_rank', '-pub_date', '-pk'))
@@ -0,0 +1,16 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Content-hashed static files with gzip and brotli variants.
+
+    collectstatic writes every file under a name with its content hash,
+    served with a far-future Cache-Control, next to .gz and .br
+    compressed copies. Before collectstatic has run (development, tests)
+    there is no manifest and files keep their names.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
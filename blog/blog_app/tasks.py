@@ -1,18 +1,102 @@
+import time
+from smtplib import SMTPException
+
+from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core.mail import send_mail
+from django.core.mail import get_connection, send_mass_mail
+from django.urls import reverse
 
 from blog.celery import background_worker
 
-from blog_app.models import Post, Profile
+from blog_app import archive, deletion, events, graph, purge
+from blog_app.models import OutboxMessage, Post, Profile
+from blog_app.utils import chunks
+
+
+# notify_followers and publish_post are sent through the outbox, which
+# may deliver them more than once. They are acknowledged after they ran,
+# so that a lost worker doesn't lose them either.
+
+@background_worker.task(bind=True, acks_late=True)
+def notify_followers(self, post_pk):
+    OutboxMessage.handle(self.request.id, lambda: _notify_followers(post_pk))
+
+
+def _notify_followers(post_pk):
+    post = (deletion.visible(Post.objects.select_related('author__user'))
+            .filter(pk=post_pk).first())
+    if post is None:
+        return
+
+    link = ''.join([Site.objects.get_current().domain,
+                    reverse('post_detail', args=(post.pk,))])
+
+    for follower_pks in chunks(graph.followers(post.author_id),
+                               settings.NOTIFICATION_BATCH_SIZE):
+        emails = list(Profile.objects.filter(pk__in=follower_pks)
+                      .exclude(user__email='')
+                      .order_by('pk')
+                      .values_list('user__email', flat=True))
+        if emails:
+            send_new_post_notifications.delay(str(post.author), link, emails)
+
+
+@background_worker.task(bind=True, acks_late=True)
+def publish_post(self, post_pk):
+    OutboxMessage.handle(self.request.id, lambda: _publish_post(post_pk))
+
+
+def _publish_post(post_pk):
+    post = (deletion.visible(Post.objects.select_related('author__user'))
+            .filter(pk=post_pk).first())
+    if post is not None:
+        events.publish_post(post)
 
 
 @background_worker.task
-def send_new_post_notification(post_author, path, destination_email):
-    link = ''.join([Site.objects.get_current().domain, path])
-
-    send_mail(
-        'Новый пост в вашей ленте',
-        f'Пользователь @{post_author} написал новый пост: http://{link}',
-        'noreply@yetanotherblog.org',
-        [destination_email]
-    )
+def archive_posts():
+    archive.run(max_batches=settings.ARCHIVE_MAX_BATCHES)
+
+
+@background_worker.task(bind=True)
+def purge_deleted(self):
+    # every run starts from what is left, repeated deliveries only find
+    # less to do and need no outbox bookkeeping
+    def progress(totals):
+        if not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta=totals)
+
+    totals = purge.purge(max_batches=settings.DELETION_MAX_BATCHES,
+                         progress=progress)
+    if any(purge.pending().values()):
+        self.apply_async()
+
+    return totals
+
+
+@background_worker.task(bind=True,
+                        max_retries=settings.NOTIFICATION_MAX_RETRIES)
+def send_new_post_notifications(self, post_author, link, emails):
+    # emails are sent over one SMTP connection, at most
+    # NOTIFICATION_RATE_LIMIT per second (0 disables throttling)
+    rate = settings.NOTIFICATION_RATE_LIMIT or len(emails)
+
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for chunk in chunks(emails, rate):
+                started = time.monotonic()
+                send_mass_mail(
+                    [('Новый пост в вашей ленте',
+                      f'Пользователь @{post_author} написал новый пост: '
+                      f'http://{link}',
+                      settings.DEFAULT_FROM_EMAIL,
+                      [email]) for email in chunk],
+                    connection=connection)
+                sent += len(chunk)
+
+                if settings.NOTIFICATION_RATE_LIMIT and sent < len(emails):
+                    time.sleep(max(0, 1 - (time.monotonic() - started)))
+    except (SMTPException, OSError) as exc:
+        raise self.retry(args=(post_author, link, emails[sent:]), exc=exc,
+                         countdown=settings.NOTIFICATION_RETRY_DELAY)
@@ -0,0 +1,10 @@
+from django import template
+
+from blog_app import fonts
+
+register = template.Library()
+
+
+@register.simple_tag
+def fonts_url():
+    return fonts.stylesheet_url()
@@ -1,9 +1,39 @@
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.models import User
+from django.core import mail, signing
+from django.core.cache import cache as django_cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connection, router
+from django.http import HttpResponse
+from django.template import engines
+from django.test import (AsyncClient, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from blog.celery import background_worker
 
-from .models import Profile, Post
+from . import (archive, async_views, benchmark, cache, counters, deletion,
+               events, follows, fonts, graph, outbox, profiling, purge,
+               query_plans, reads, routers, search, tasks, users, views)
+from .models import (ArchivedPost, FeedEntry, OutboxMessage, Profile, Post,
+                     ReadMarker)
+from .pagination import EstimatedCountPaginator
 
 
 class ProfileModelTest(TestCase):
@@ -12,7 +42,8 @@ class ProfileModelTest(TestCase):
         user = User.objects.create_user(username, '', 'testpassword')
 
         self.assertQuerysetEqual(
-            Profile.objects.all(), [f'<Profile: {username} ()>'])
+            Profile.objects.all(), [f'<Profile: {username} ()>'],
+            transform=repr)
 
         self.assertEqual(
             user, Profile.objects.get(user__username=username).user)
@@ -49,17 +80,18 @@ class ProfileModelTest(TestCase):
         p = Post(caption='c', content_text='t', author=following.profile)
         p.save()
 
-        user.profile.posts_read.add(p)
+        reads.mark(user.profile, p)
 
-        self.assertEqual(p, user.profile.posts_read.all()[0])
+        self.assertTrue(reads.is_read(user.profile, p))
 
         user.profile.following.remove(following.profile)
 
-        self.assertQuerysetEqual(user.profile.posts_read.all(), [])
+        self.assertFalse(reads.is_read(user.profile, p))
+        self.assertQuerysetEqual(ReadMarker.objects.all(), [])
 
         user.profile.following.add(following.profile)
 
-        self.assertQuerysetEqual(user.profile.posts_read.all(), [])
+        self.assertFalse(reads.is_read(user.profile, p))
 
     def test_follower_profile_cleanup(self):
         username = 'user'
@@ -74,11 +106,11 @@ class ProfileModelTest(TestCase):
         p = Post(caption='c', content_text='t', author=following.profile)
         p.save()
 
-        user.profile.posts_read.add(p)
+        reads.mark(user.profile, p)
 
         following.delete()
 
-        self.assertQuerysetEqual(user.profile.posts_read.all(), [])
+        self.assertQuerysetEqual(ReadMarker.objects.all(), [])
         self.assertQuerysetEqual(user.profile.following.all(), [])
 
     def test_follows(self):
@@ -93,13 +125,13 @@ class ProfileModelTest(TestCase):
 
         self.assertQuerysetEqual(
             user1.profile.following.all().order_by('user__username'),
-            ['<Profile: user2 ()>', '<Profile: user3 ()>'])
+            ['<Profile: user2 ()>', '<Profile: user3 ()>'], transform=repr)
         self.assertQuerysetEqual(
             user2.profile.following.all().order_by('user__username'),
-            ['<Profile: user1 ()>'])
+            ['<Profile: user1 ()>'], transform=repr)
         self.assertQuerysetEqual(
             user3.profile.following.all().order_by('user__username'),
-            ['<Profile: user2 ()>'])
+            ['<Profile: user2 ()>'], transform=repr)
 
 
 class PostModelTest(TestCase):
@@ -117,6 +149,57 @@ class PostModelTest(TestCase):
         self.assertEqual(Post.objects.count(), 0)
 
 
+class PostRenderTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user('user', '', 'testpassword')
+
+    def test_rendered_on_save(self):
+        post = Post.objects.create(caption='c',
+                                   content_text='<b>one</b>\n\ntwo',
+                                   author=self.user.profile)
+        self.assertEqual(post.content_html,
+                         '<p>&lt;b&gt;one&lt;/b&gt;</p>\n\n<p>two</p>')
+
+        post.content_text = 'three'
+        post.save(update_fields=['content_text'])
+        post.refresh_from_db()
+        self.assertEqual(post.content_html, '<p>three</p>')
+
+    def test_preview_truncated(self):
+        words = ' '.join(['word'] * (Post.PREVIEW_WORDS + 1))
+        post = Post.objects.create(caption='c', content_text=words,
+                                   author=self.user.profile)
+        self.assertEqual(post.preview_html,
+                         '<p>' + ' '.join(['word'] * Post.PREVIEW_WORDS)
+                         + ' …</p>')
+
+    def test_listing_skips_source_text(self):
+        Post.objects.create(caption='c', content_text='text',
+                            author=self.user.profile)
+
+        with CaptureQueriesContext(connection) as captured:
+            res = self.client.get(reverse('all'))
+        self.assertContains(res, '<p>text</p>', html=True)
+        self.assertFalse(any('content_text' in query['sql']
+                             for query in captured.captured_queries))
+
+    def test_render_posts_command(self):
+        post = Post.objects.create(caption='c', content_text='text',
+                                   author=self.user.profile)
+        Post.objects.update(content_html='', preview_html='')
+
+        out = StringIO()
+        call_command('render_posts', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Rendered 1 posts.')
+        post.refresh_from_db()
+        self.assertEqual(post.content_html, '<p>text</p>')
+
+        out = StringIO()
+        call_command('render_posts', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Rendered 0 posts.')
+
+
 class RootRedirectViewTest(TestCase):
     def test_redirect_not_logged_in(self):
         self.assertRedirects(
@@ -189,3 +272,1951 @@ class FeedViewTest(TestCase):
         self.assertNotContains(res, f'@{another} ({another.get_full_name()})')
         self.assertNotContains(res, another_post.caption)
         self.assertNotContains(res, another_post.content_text)
+
+
+class FeedTimelineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.client.force_login(user=self.user)
+
+    def test_fanout_on_write(self):
+        self.user.profile.following.add(self.author.profile)
+
+        p = Post(caption='timeline post', content_text='t',
+                 author=self.author.profile)
+        p.save()
+
+        self.assertQuerysetEqual(
+            FeedEntry.objects.filter(profile=self.user.profile)
+                .values_list('post', flat=True), [p.pk], transform=int)
+
+    def test_backfill_on_follow_and_trim_on_unfollow(self):
+        p = Post(caption='timeline post', content_text='t',
+                 author=self.author.profile)
+        p.save()
+
+        self.user.profile.following.add(self.author.profile)
+        self.assertContains(self.client.get(reverse('feed')), p.caption)
+
+        self.user.profile.following.remove(self.author.profile)
+        self.assertFalse(
+            FeedEntry.objects.filter(profile=self.user.profile).exists())
+        self.assertNotContains(self.client.get(reverse('feed')), p.caption)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_fanout_on_read_for_popular_author(self):
+        self.user.profile.following.add(self.author.profile)
+
+        p = Post(caption='timeline post', content_text='t',
+                 author=self.author.profile)
+        p.save()
+
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertContains(self.client.get(reverse('feed')), p.caption)
+
+    def test_rebuild_command(self):
+        self.user.profile.following.add(self.author.profile)
+
+        p = Post(caption='timeline post', content_text='t',
+                 author=self.author.profile)
+        p.save()
+
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+
+        self.assertQuerysetEqual(
+            FeedEntry.objects.values_list('profile', 'post'),
+            [(self.user.profile.pk, p.pk)], transform=tuple)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        self.posts = []
+        for i in range(25):
+            p = Post(caption=f'caption #{i:02}#', content_text='t',
+                     author=self.user.profile)
+            p.save()
+            self.posts.append(p)
+
+        # identical dates must be ordered by pk
+        Post.objects.filter(pk__in=[p.pk for p in self.posts[5:15]]).update(
+            pub_date=self.posts[5].pub_date)
+
+    def _captions(self, res):
+        return [p.caption for p in res.context['posts_feed']]
+
+    def test_next_and_previous_pages(self):
+        expected = [p.caption for p in reversed(self.posts)]
+
+        first = self.client.get(reverse('all'))
+        self.assertEqual(self._captions(first), expected[:10])
+        self.assertIsNone(first.context['page_obj'].previous_cursor)
+
+        second = self.client.get(
+            reverse('all'),
+            {'cursor': first.context['page_obj'].next_cursor})
+        self.assertEqual(self._captions(second), expected[10:20])
+
+        third = self.client.get(
+            reverse('all'),
+            {'cursor': second.context['page_obj'].next_cursor})
+        self.assertEqual(self._captions(third), expected[20:])
+        self.assertIsNone(third.context['page_obj'].next_cursor)
+
+        back = self.client.get(
+            reverse('all'),
+            {'cursor': third.context['page_obj'].previous_cursor})
+        self.assertEqual(self._captions(back), expected[10:20])
+
+        back = self.client.get(
+            reverse('all'),
+            {'cursor': back.context['page_obj'].previous_cursor})
+        self.assertEqual(self._captions(back), expected[:10])
+        self.assertIsNone(back.context['page_obj'].previous_cursor)
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('all'))
+
+        self.assertFalse(
+            [q for q in queries.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(reverse('all'), {'cursor': 'garbage'})
+        self.assertEqual(res.status_code, 404)
+
+
+class FeedQueryCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        self.client.force_login(user=self.user)
+
+    def _populate(self, authors, readers):
+        start = Profile.objects.count()
+        for i in range(start, start + authors):
+            author = User.objects.create_user(f'author{i}', '', 'password')
+            self.user.profile.following.add(author.profile)
+
+            for j in range(3):
+                p = Post(caption=f'caption {i}.{j}', content_text='t',
+                         author=author.profile)
+                p.save()
+                reads.mark(self.user.profile, p)
+
+                for k in range(readers):
+                    reader, _ = User.objects.get_or_create(
+                        username=f'reader{k}')
+                    reads.mark(reader.profile, p)
+
+    def test_constant_query_count(self):
+        self._populate(authors=1, readers=0)
+        users.get_user(self.user.pk)
+        deletion.deleted_profiles()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('feed'))
+
+        self._populate(authors=4, readers=5)
+        self.assertLessEqual(len(small), 6)
+        with self.assertNumQueries(len(small)):
+            res = self.client.get(reverse('feed'))
+
+        self.assertContains(res, 'Отметить: не прочитано', count=10)
+
+    def test_read_flag(self):
+        author = User.objects.create_user('author', '', 'password')
+        self.user.profile.following.add(author.profile)
+
+        read = Post(caption='read', content_text='t', author=author.profile)
+        read.save()
+        unread = Post(caption='unread', content_text='t',
+                      author=author.profile)
+        unread.save()
+        reads.mark(self.user.profile, read)
+
+        res = self.client.get(reverse('feed'))
+        flags = {post.caption: post.is_read
+                 for post in res.context['posts_feed']}
+        self.assertEqual(flags, {'read': True, 'unread': False})
+
+
+class ReadMarkerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.user.profile.following.add(self.author.profile)
+
+        self.posts = []
+        for i in range(5):
+            p = Post(caption=f'c{i}', content_text='t',
+                     author=self.author.profile)
+            p.save()
+            self.posts.append(p)
+
+    def _read(self):
+        return [reads.is_read(self.user.profile, p) for p in self.posts]
+
+    def _marker(self):
+        return ReadMarker.objects.get(profile=self.user.profile)
+
+    def test_toggle(self):
+        self.client.force_login(user=self.user)
+
+        for expected in (True, False):
+            self.client.post(reverse('post_mark'),
+                             {'mark_post_read': self.posts[1].pk},
+                             HTTP_REFERER=reverse('feed'))
+            self.assertEqual(
+                self._read(), [False, expected, False, False, False])
+
+    def test_watermark_compaction(self):
+        reads.mark(self.user.profile, self.posts[1])
+        reads.mark(self.user.profile, self.posts[0])
+
+        marker = self._marker()
+        self.assertEqual(marker.read_until, self.posts[1].pk)
+        self.assertEqual(marker.read, set())
+
+        reads.mark(self.user.profile, self.posts[0], read=False)
+        self.assertEqual(self._read(), [False, True, False, False, False])
+        self.assertEqual(self._marker().unread, {self.posts[0].pk})
+
+    def test_mark_until(self):
+        reads.mark(self.user.profile, self.posts[4])
+        reads.mark(self.user.profile, self.posts[0], read=False)
+        reads.mark_until(self.user.profile, self.author.profile.pk,
+                         self.posts[2].pk)
+
+        self.assertEqual(self._read(), [True, True, True, False, True])
+
+        marker = self._marker()
+        self.assertEqual(marker.read_until, self.posts[2].pk)
+        self.assertEqual(marker.read, {self.posts[4].pk})
+        self.assertEqual(marker.unread, set())
+
+
+@override_settings(NOTIFICATION_BATCH_SIZE=2, NOTIFICATION_RATE_LIMIT=0)
+@override_settings(EVENTS_BUS='blog_app.events.LocalBus')
+class NotificationTest(TransactionTestCase):
+    def setUp(self):
+        background_worker.conf.task_always_eager = True
+
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.followers = []
+        for i in range(5):
+            follower = User.objects.create_user(
+                f'follower{i}', f'follower{i}@example.com', 'testpassword')
+            follower.profile.following.add(self.author.profile)
+            self.followers.append(follower)
+
+        self.client.force_login(user=self.author)
+
+    def tearDown(self):
+        background_worker.conf.task_always_eager = False
+
+    def _create_post(self):
+        self.client.post(reverse('post_create'),
+                         {'caption': 'caption', 'content_text': 'text'})
+        outbox.relay()
+        return Post.objects.get()
+
+    def test_notify_followers(self):
+        with mock.patch('blog_app.tasks.send_mass_mail',
+                        wraps=mail.send_mass_mail) as send:
+            p = self._create_post()
+
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            [f.email for f in self.followers])
+        self.assertIn(reverse('post_detail', args=(p.pk,)),
+                      mail.outbox[0].body)
+
+    def test_retry_failed_batch(self):
+        calls = []
+
+        def flaky_send(datatuple, connection):
+            calls.append(len(datatuple))
+            if len(calls) == 2:
+                raise SMTPException('Connection lost')
+            return mail.send_mass_mail(datatuple, connection=connection)
+
+        with mock.patch('blog_app.tasks.send_mass_mail', flaky_send):
+            self._create_post()
+
+        self.assertEqual(calls, [2, 2, 2, 1])
+        self.assertEqual(len(mail.outbox), 5)
+
+
+@override_settings(EVENTS_BUS='blog_app.events.LocalBus')
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.follower = User.objects.create_user(
+            'follower', 'follower@example.com', 'testpassword')
+        self.follower.profile.following.add(self.author.profile)
+
+        self.client.force_login(user=self.author)
+
+    def tearDown(self):
+        background_worker.conf.task_always_eager = False
+
+    def _create_post(self):
+        with mock.patch.object(background_worker, 'producer_or_acquire') \
+                as broker:
+            self.client.post(reverse('post_create'),
+                             {'caption': 'caption', 'content_text': 'text'})
+        broker.assert_not_called()
+        return Post.objects.get()
+
+    def test_post_create_writes_messages(self):
+        p = self._create_post()
+
+        self.assertQuerysetEqual(
+            OutboxMessage.objects.order_by('key'),
+            [(f'post:{p.pk}:{tasks.notify_followers.name}',
+              tasks.notify_followers.name, [p.pk]),
+             (f'post:{p.pk}:{tasks.publish_post.name}',
+              tasks.publish_post.name, [p.pk])],
+            transform=lambda m: (m.key, m.task, m.args))
+
+    def test_rolled_back_post_has_no_messages(self):
+        with mock.patch('blog_app.views.PostCreate.get_success_url',
+                        side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.client.post(reverse('post_create'),
+                             {'caption': 'caption', 'content_text': 'text'})
+
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_batches(self):
+        background_worker.conf.task_always_eager = True
+        p = self._create_post()
+
+        with mock.patch.object(tasks.publish_post, 'apply_async') as send:
+            self.assertEqual(outbox.relay(batch_size=1), 1)
+        send.assert_not_called()
+        self.assertEqual(len(mail.outbox), 1)
+
+        self.assertEqual(outbox.relay(), 1)
+        self.assertEqual(outbox.relay(), 0)
+        self.assertFalse(OutboxMessage.objects.filter(sent_at=None).exists())
+        self.assertFalse(OutboxMessage.objects.filter(handled_at=None)
+                         .exists())
+        self.assertIn(reverse('post_detail', args=(p.pk,)),
+                      mail.outbox[0].body)
+
+    def test_repeated_delivery_is_skipped(self):
+        background_worker.conf.task_always_eager = True
+        p = self._create_post()
+        key = f'post:{p.pk}:{tasks.notify_followers.name}'
+
+        tasks.notify_followers.apply((p.pk,), task_id=key)
+        tasks.notify_followers.apply((p.pk,), task_id=key)
+        self.assertEqual(len(mail.outbox), 1)
+
+        # tasks not sent through the outbox always run
+        tasks.notify_followers.apply((p.pk,))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_delivery_is_repeated(self):
+        background_worker.conf.task_always_eager = True
+        p = self._create_post()
+        key = f'post:{p.pk}:{tasks.notify_followers.name}'
+
+        with mock.patch('blog_app.graph.followers',
+                        side_effect=RuntimeError):
+            result = tasks.notify_followers.apply((p.pk,), task_id=key)
+        self.assertTrue(result.failed())
+        self.assertIsNone(OutboxMessage.objects.get(key=key).handled_at)
+
+        tasks.notify_followers.apply((p.pk,), task_id=key)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNotNone(OutboxMessage.objects.get(key=key).handled_at)
+
+    def test_relay_command_and_purge(self):
+        background_worker.conf.task_always_eager = True
+        self._create_post()
+        out = StringIO()
+        call_command('relay_outbox', once=True, batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue(), 'Sent 2 messages, purged 0.\n')
+
+        with override_settings(OUTBOX_RETENTION_DAYS=-1):
+            self.assertEqual(outbox.purge(), 2)
+
+
+class CacheTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        self.post = Post(caption='cached caption', content_text='text',
+                         author=self.user.profile)
+        self.post.save()
+
+    def test_anonymous_page_cache(self):
+        for name, args in (('all', ()),
+                           ('blog', (self.user.profile.pk,)),
+                           ('post_detail', (self.post.pk,))):
+            url = reverse(name, args=args)
+            self.assertContains(self.client.get(url), 'cached caption')
+
+            with self.assertNumQueries(0):
+                self.assertContains(self.client.get(url), 'cached caption')
+
+        self.assertEqual(cache.get_stats()['page']['hit'], 3)
+        self.assertEqual(cache.get_stats()['page']['miss'], 3)
+
+    def test_invalidation(self):
+        self.client.get(reverse('all'))
+        self.client.get(reverse('post_detail', args=(self.post.pk,)))
+
+        self.post.caption = 'updated caption'
+        self.post.save()
+        self.assertContains(self.client.get(reverse('all')), 'updated caption')
+        self.assertContains(
+            self.client.get(reverse('post_detail', args=(self.post.pk,))),
+            'updated caption')
+
+        self.post.delete()
+        self.assertNotContains(
+            self.client.get(reverse('all')), 'updated caption')
+
+        self.user.first_name = 'renamed'
+        self.user.save()
+        self.assertContains(
+            self.client.get(reverse('blog', args=(self.user.profile.pk,))),
+            'renamed')
+
+    def test_authenticated_not_page_cached(self):
+        self.client.force_login(user=self.user)
+        self.client.get(reverse('all'))
+        self.client.get(reverse('all'))
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['page']['hit'] + stats['page']['miss'], 0)
+
+    def test_authenticated_sees_updates(self):
+        self.client.force_login(user=self.user)
+        self.client.get(reverse('all'))
+
+        self.post.content_text = 'updated text'
+        self.post.save()
+        self.assertContains(self.client.get(reverse('all')), 'updated text')
+
+    def test_bump_missing_version(self):
+        django_cache.delete('version:evicted')
+        cache.bump_version('evicted')
+        version, = cache.get_versions('evicted')
+        self.assertGreater(version, 1)
+
+        cache.bump_version('evicted')
+        self.assertEqual(cache.get_versions('evicted'), [version + 1])
+
+    def test_missing_version_added_once(self):
+        django_cache.set('version:raced', 5, None)
+
+        # another process added the counter after this one missed it
+        get_many = django_cache.get_many
+        with mock.patch.object(django_cache, 'get_many', side_effect=[
+                {}, get_many(['version:raced'])]):
+            self.assertEqual(cache.get_versions('raced'), [5])
+
+
+class CounterTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{i}', '', 'password')
+                      for i in range(3)]
+        self.profiles = [user.profile for user in self.users]
+
+    def _counts(self, profile):
+        profile.refresh_from_db()
+        return (profile.post_count, profile.followers_count,
+                profile.following_count)
+
+    def test_post_count(self):
+        posts = []
+        for i in range(3):
+            p = Post(caption='c', content_text='t', author=self.profiles[0])
+            p.save()
+            posts.append(p)
+        posts[0].delete()
+
+        self.assertEqual(self._counts(self.profiles[0]), (2, 0, 0))
+
+        res = self.client.get(reverse('blog', args=(self.profiles[0].pk,)))
+        self.assertEqual(res.context['user_info']['postcount'], 2)
+
+    def test_follow_counts(self):
+        first, second, third = self.profiles
+
+        first.following.add(second, third)
+        first.following.add(second)
+        second.following.add(third)
+        third.following.add(first)
+        self.assertEqual(self._counts(first), (0, 1, 2))
+        self.assertEqual(self._counts(second), (0, 1, 1))
+        self.assertEqual(self._counts(third), (0, 2, 1))
+
+        first.following.remove(second, second)
+        first.following.remove(second)
+        third.following.clear()
+        self.assertEqual(self._counts(first), (0, 0, 1))
+        self.assertEqual(self._counts(second), (0, 0, 1))
+        self.assertEqual(self._counts(third), (0, 2, 0))
+
+        self.users[1].delete()
+        self.assertEqual(self._counts(third), (0, 1, 0))
+
+    def test_stale_instance_save(self):
+        stale = Profile.objects.get(pk=self.profiles[0].pk)
+
+        p = Post(caption='c', content_text='t', author=self.profiles[0])
+        p.save()
+        self.profiles[1].following.add(self.profiles[0])
+
+        stale.save()
+        self.users[0].save()
+        self.assertEqual(self._counts(self.profiles[0]), (1, 1, 0))
+
+    def test_reconcile_command(self):
+        self.profiles[0].following.add(self.profiles[1])
+        p = Post(caption='c', content_text='t', author=self.profiles[1])
+        p.save()
+
+        Profile.objects.update(post_count=7, followers_count=0)
+
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=2, stdout=out)
+        self.assertIn('Checked 3 profiles, fixed 3.', out.getvalue())
+
+        self.assertEqual(self._counts(self.profiles[0]), (0, 0, 1))
+        self.assertEqual(self._counts(self.profiles[1]), (1, 1, 0))
+        self.assertEqual(self._counts(self.profiles[2]), (0, 0, 0))
+
+
+class ConcurrentCounterTest(TransactionTestCase):
+    def test_follow_added_twice(self):
+        author = User.objects.create_user('author', '', 'password').profile
+        follower = User.objects.create_user('f', '', 'password').profile
+        follower.following.add(author)
+
+        # as seen by a request that checked before the first add committed
+        with mock.patch.object(type(follower.following),
+                               '_get_missing_target_ids',
+                               side_effect=lambda *args: {author.pk}):
+            follower.following.add(author)
+
+        author.refresh_from_db()
+        follower.refresh_from_db()
+        self.assertEqual((author.followers_count,
+                          follower.following_count), (1, 1))
+        self.assertEqual(follower.following.count(), 1)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_updates(self):
+        author = User.objects.create_user('author', '', 'password').profile
+        followers = [User.objects.create_user(f'f{i}', '', 'password').profile
+                     for i in range(8)]
+
+        def work(follower):
+            try:
+                follower.following.add(author)
+                Post(caption='c', content_text='t', author=author).save()
+                follower.following.remove(author)
+                follower.following.add(author)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(follower,))
+                   for follower in followers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        author.refresh_from_db()
+        self.assertEqual(author.post_count, 8)
+        self.assertEqual(author.followers_count, 8)
+
+
+class BenchmarkTest(TestCase):
+    def test_seed_and_run(self):
+        profile_pks = benchmark.seed(users=10, follows=3, posts=4,
+                                     read_ratio=0.5)
+
+        self.assertEqual(Post.objects.count(), 40)
+        for profile in Profile.objects.filter(pk__in=profile_pks):
+            self.assertEqual(profile.post_count, 4)
+            self.assertEqual(profile.following_count,
+                             profile.following.count())
+            self.assertEqual(
+                FeedEntry.objects.filter(profile=profile).count(),
+                4 * profile.following_count)
+
+        results = benchmark.run(profile_pks, requests=3, viewers=2)
+
+        self.assertEqual(set(results),
+                         {'all', 'feed', 'blog', 'post_detail'})
+        for result in results.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_run_render(self):
+        results = benchmark.run_render(page_sizes=(2,), renders=2)
+
+        self.assertEqual(set(results), {'all_posts_2', 'feed_2'})
+        for result in results.values():
+            self.assertIn(result['fastest'], benchmark.ENGINES)
+            for engine in benchmark.ENGINES:
+                self.assertEqual(result[engine]['renders'], 2)
+
+
+class ConcurrentBenchmarkTest(TransactionTestCase):
+    # requests are served from other threads, which only see committed data
+    def test_run_concurrent(self):
+        profile_pks = benchmark.seed(users=6, follows=2, posts=2)
+
+        for interface in benchmark.INTERFACES:
+            with self.subTest(interface=interface):
+                results = benchmark.run_concurrent(
+                    profile_pks, requests=4, concurrency=2,
+                    interface=interface, viewers=2)
+
+                self.assertEqual(set(results),
+                                 {'all', 'feed', 'blog', 'post_detail'})
+                for result in results.values():
+                    self.assertEqual(result['interface'], interface)
+                    self.assertGreater(result['rps'], 0)
+                    self.assertGreaterEqual(result['peak_threads'], 1)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1)
+class ProfilingTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        for i in range(3):
+            Post(caption='c', content_text='t',
+                 author=self.user.profile).save()
+
+    def test_report_by_url_name(self):
+        self.client.force_login(user=self.user)
+        with self.assertLogs('blog_app.profiling', 'INFO'):
+            self.client.get(reverse('all'))
+            self.client.get(reverse('all'))
+            self.client.get(reverse('feed'))
+
+        report = profiling.get_report()
+        self.assertEqual(report['all']['requests'], 2)
+        self.assertEqual(report['feed']['requests'], 1)
+        self.assertGreater(report['all']['queries_mean'], 0)
+        self.assertGreater(report['all']['render_ms_mean'], 0)
+
+        out = StringIO()
+        call_command('profiling_report', reset=True, stdout=out)
+        self.assertIn('"all"', out.getvalue())
+        self.assertEqual(profiling.get_report(), {})
+
+    def test_duplicate_queries(self):
+        with profiling.profile_queries() as profile:
+            for post in Post.objects.all():
+                post.author.user
+
+        self.assertEqual(list(profile.duplicates().values()), [3, 3])
+
+    def test_staff_only_endpoint(self):
+        self.client.force_login(user=self.user)
+        with self.assertLogs('blog_app.profiling', 'INFO'):
+            res = self.client.get(reverse('profiling_report'))
+        self.assertEqual(res.status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        with self.assertLogs('blog_app.profiling', 'INFO'):
+            res = self.client.get(reverse('profiling_report'))
+        self.assertIn('profiling_report', res.json())
+
+
+class QueryPlanTest(TestCase):
+    def test_view_queries_use_indexes(self):
+        profile_pks = benchmark.seed(users=30, follows=5, posts=5)
+
+        profile = Profile.objects.get(pk=profile_pks[-1])
+        author = Profile.objects.order_by('-followers_count').first()
+
+        self.assertEqual(query_plans.check(profile, author), {})
+
+    def test_regression_detected(self):
+        queryset = Post.objects.order_by('caption')
+
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self.assertTrue(query_plans.find_problems(queryset))
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.reader = User.objects.create_user('reader', '', 'testpassword')
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.other = User.objects.create_user('other', '', 'testpassword')
+        self.reader.profile.following.add(self.author.profile)
+
+        self.in_caption = Post.objects.create(
+            caption='Django performance', content_text='notes',
+            author=self.author.profile)
+        self.in_text = Post.objects.create(
+            caption='Weekly notes', content_text='profiling django queries',
+            author=self.author.profile)
+        self.unfollowed = Post.objects.create(
+            caption='Django', content_text='elsewhere',
+            author=self.other.profile)
+
+    def test_ranked_matches(self):
+        self.assertEqual(
+            list(search.search(Post.objects.all(), 'django')),
+            [self.unfollowed, self.in_caption, self.in_text])
+        self.assertEqual(
+            list(search.search(Post.objects.all(), 'django queries')),
+            [self.in_text])
+        self.assertFalse(search.search(Post.objects.all(), '  '))
+        self.assertFalse(search.search(Post.objects.all(), '"OR NEAR('))
+
+    def test_index_follows_save_and_delete(self):
+        self.in_text.content_text = 'nothing to see'
+        self.in_text.save()
+        self.assertNotIn(self.in_text,
+                         search.search(Post.objects.all(), 'django'))
+
+        self.in_caption.delete()
+        self.assertEqual(list(search.search(Post.objects.all(), 'django')),
+                         [self.unfollowed])
+
+        self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(list(search.search(Post.objects.all(), 'django')),
+                         [self.unfollowed])
+
+    def test_scopes(self):
+        url = reverse('search')
+
+        response = self.client.get(url, {'q': 'django'})
+        self.assertEqual(len(response.context['posts_feed']), 3)
+
+        response = self.client.get(url, {'q': 'django', 'scope': 'blog',
+                                         'author': self.other.profile.pk})
+        self.assertEqual(list(response.context['posts_feed']),
+                         [self.unfollowed])
+
+        response = self.client.get(url, {'q': 'django', 'scope': 'feed'})
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.reader)
+        response = self.client.get(url, {'q': 'django', 'scope': 'feed'})
+        self.assertEqual(list(response.context['posts_feed']),
+                         [self.in_caption, self.in_text])
+
+        response = self.client.get(url, {'q': 'django', 'scope': 'blog'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_api(self):
+        for i in range(11):
+            Post.objects.create(caption=f'Django {i}', content_text='t',
+                                author=self.other.profile)
+
+        response = self.client.get(reverse('search_api'),
+                                   {'q': 'django', 'page': 2})
+        data = response.json()
+        self.assertEqual(data['count'], 14)
+        self.assertEqual(data['num_pages'], 2)
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual(data['results'][-1]['pk'], self.in_text.pk)
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.reader = User.objects.create_user('reader', '', 'testpassword')
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.reader.profile.following.add(self.author.profile)
+
+        self.post = Post.objects.create(caption='API post',
+                                        content_text='API text',
+                                        author=self.author.profile)
+
+    def test_all_fields(self):
+        data = self.client.get(reverse('all_api')).json()
+        self.assertEqual(data['results'][0]['content_text'], 'API text')
+        self.assertIsNone(data['next_cursor'])
+
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get(reverse('all_api'),
+                                   {'fields': 'pk,caption'}).json()
+        self.assertEqual(data['results'],
+                         [{'pk': self.post.pk, 'caption': 'API post'}])
+        self.assertFalse(any('content_text' in query['sql']
+                             or 'content_html' in query['sql']
+                             for query in captured.captured_queries))
+
+        data = self.client.get(reverse('all_api'),
+                               {'fields': 'pk,content_html'}).json()
+        self.assertEqual(data['results'][0]['content_html'],
+                         '<p>API text</p>')
+
+        response = self.client.get(reverse('all_api'), {'fields': 'pk,nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified(self):
+        url = reverse('all_api')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        Post.objects.create(caption='New', content_text='t',
+                            author=self.author.profile)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_feed(self):
+        url = reverse('feed_api')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertFalse(response.json()['results'][0]['is_read'])
+
+        reads.mark(self.reader.profile, self.post)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['is_read'])
+
+    def test_blog_and_post(self):
+        url = reverse('blog_api', args=(self.author.profile.pk,))
+        data = self.client.get(url).json()
+        self.assertEqual(data['author']['post_count'], 1)
+        self.assertIsNone(data['author']['is_followed'])
+
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertTrue(response.json()['author']['is_followed'])
+
+        self.reader.profile.following.remove(self.author.profile)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertFalse(response.json()['author']['is_followed'])
+
+        response = self.client.get(
+            reverse('post_detail_api', args=(self.post.pk,)),
+            {'fields': 'caption'})
+        self.assertEqual(response.json(), {'caption': 'API post'})
+
+
+@override_settings(ROOT_URLCONF='blog.asgi_urls')
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.reader = User.objects.create_user('reader', '', 'testpassword')
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.reader.profile.following.add(self.author.profile)
+
+        self.posts = [Post.objects.create(caption=f'Async post {i}',
+                                          content_text='t',
+                                          author=self.author.profile)
+                      for i in range(12)]
+        reads.mark(self.reader.profile, self.posts[-1])
+
+        self.async_client = AsyncClient()
+
+    def _get(self, url, **kwargs):
+        async def get():
+            return await self.async_client.get(url, **kwargs)
+        return async_to_sync(get)()
+
+    def _content(self, response):
+        # csrf tokens are masked differently on every response
+        return re.sub(rb'name="csrfmiddlewaretoken" value="[^"]+"', b'',
+                      response.content)
+
+    # cursors are signed with the current second
+    @mock.patch.object(signing.TimestampSigner, 'timestamp',
+                       return_value='0')
+    def test_same_context_as_sync_views(self, timestamp):
+        self.client.force_login(self.reader)
+        self.async_client.force_login(self.reader)
+
+        for url in (reverse('all'), reverse('feed'),
+                    reverse('blog', args=(self.author.profile.pk,)),
+                    reverse('post_detail', args=(self.posts[0].pk,))):
+            with self.subTest(url=url):
+                with override_settings(ROOT_URLCONF='blog.urls'):
+                    expected = self.client.get(url)
+                response = self._get(url)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self._content(response),
+                                 self._content(expected))
+
+    def test_feed_login_and_pagination(self):
+        response = self._get(reverse('feed'))
+        self.assertEqual(response.status_code, 302)
+
+        self.async_client.force_login(self.reader)
+        response = self._get(reverse('feed'))
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page[0].is_read)
+
+        response = self._get(reverse('feed'),
+                             data={'cursor': page.next_cursor})
+        self.assertEqual([post.pk for post in response.context['posts_feed']],
+                         [self.posts[1].pk, self.posts[0].pk])
+
+    def test_anonymous_page_cache_and_404(self):
+        url = reverse('blog', args=(self.author.profile.pk,))
+        self._get(url)
+        self._get(url)
+        self.assertEqual(cache.get_stats()['page']['hit'], 1)
+
+        self.assertEqual(self._get(reverse('blog', args=(0,))).status_code,
+                         404)
+        self.assertEqual(
+            self._get(reverse('post_detail', args=(0,))).status_code, 404)
+
+
+class BulkActionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'testpassword')
+        self.profile = self.user.profile
+        self.authors = [User.objects.create_user(f'author{i}', '', 'password')
+                        .profile for i in range(6)]
+
+        self.posts = {}
+        for author in self.authors:
+            self.posts[author.pk] = []
+            for i in range(3):
+                p = Post(caption=f'c{i}', content_text='t', author=author)
+                p.save()
+                self.posts[author.pk].append(p)
+
+        self.client.force_login(self.user)
+
+    def _post(self, name, data):
+        return self.client.post(reverse(name), data)
+
+    def _follow_queries(self, authors):
+        with CaptureQueriesContext(connection) as queries:
+            self._post('bulk_follow',
+                       {'profile': [author.pk for author in authors]})
+        self.profile.following.clear()
+        return len(queries)
+
+    def test_follow_query_count_is_constant(self):
+        users.get_user(self.user.pk)
+        self.assertEqual(self._follow_queries(self.authors[:2]),
+                         self._follow_queries(self.authors))
+
+    def test_follow_and_unfollow(self):
+        pks = [author.pk for author in self.authors[:3]]
+        res = self._post('bulk_follow',
+                         {'profile': [*pks, self.profile.pk, 0]})
+        self.assertEqual(res.json(), {'followed': pks})
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.following_count, 3)
+        self.assertEqual(FeedEntry.objects.filter(profile=self.profile).count(),
+                         9)
+
+        res = self._post('bulk_follow', {'profile': ','.join(map(str, pks))})
+        self.assertEqual(res.json(), {'followed': []})
+
+        reads.mark_posts(self.profile, [self.posts[pks[0]][0].pk])
+        res = self._post('bulk_unfollow', {'profile': pks[:2]})
+        self.assertEqual(res.json(), {'unfollowed': pks[:2]})
+
+        self.profile.refresh_from_db()
+        self.authors[0].refresh_from_db()
+        self.assertEqual(self.profile.following_count, 1)
+        self.assertEqual(self.authors[0].followers_count, 0)
+        self.assertEqual(FeedEntry.objects.filter(profile=self.profile).count(),
+                         3)
+        self.assertFalse(ReadMarker.objects.filter(profile=self.profile,
+                                                   author_id=pks[0]).exists())
+
+    def test_reverse_clear_removes_timeline(self):
+        author = self.authors[0]
+        self.profile.following.add(author)
+        reads.mark_posts(self.profile, [self.posts[author.pk][0].pk])
+
+        author.profile_set.clear()
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.following_count, 0)
+        self.assertFalse(FeedEntry.objects.filter(profile=self.profile).exists())
+        self.assertFalse(ReadMarker.objects.filter(profile=self.profile)
+                         .exists())
+
+    def test_invalid_input(self):
+        self.assertEqual(
+            self._post('bulk_follow', {'profile': 'abc'}).status_code, 400)
+        with override_settings(BULK_ACTION_MAX_ITEMS=2):
+            res = self._post('bulk_follow', {'profile': [1, 2, 3]})
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            self._post('mark_read_before', {'before': 'x'}).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(
+            self._post('bulk_follow', {'profile': [1]}).status_code, 302)
+
+    def test_import_follows(self):
+        res = self._post('import_follows',
+                         {'usernames': '@author0, author1\nnobody'})
+        self.assertEqual(res.json(), {
+            'followed': [self.authors[0].pk, self.authors[1].pk],
+            'unknown': ['nobody']})
+
+        upload = StringIO('author2 user')
+        upload.name = 'following.txt'
+        res = self._post('import_follows', {'file': upload})
+        self.assertEqual(res.json(), {'followed': [self.authors[2].pk],
+                                      'unknown': []})
+
+    def test_mark_read(self):
+        post_pks = [p.pk for author in self.authors[:2]
+                    for p in self.posts[author.pk][:2]]
+        res = self._post('bulk_mark_read', {'post': post_pks})
+        self.assertEqual(res.json(), {'marked': 4})
+
+        read = reads.read_post_ids(
+            self.profile, [p for posts in self.posts.values() for p in posts])
+        self.assertEqual(read, set(post_pks))
+
+        res = self._post('bulk_mark_unread', {'post': post_pks[:1]})
+        self.assertEqual(res.json(), {'marked': 1})
+        self.assertFalse(reads.is_read(self.profile,
+                                       self.posts[self.authors[0].pk][0]))
+
+    def test_mark_before(self):
+        self.profile.following.add(*self.authors[:2])
+        before = self.posts[self.authors[1].pk][2].pub_date
+
+        res = self.client.post(reverse('mark_read_before'),
+                               {'before': before.isoformat(),
+                                'next': reverse('feed')})
+        self.assertRedirects(res, reverse('feed'))
+
+        # only followed authors are marked without an author list
+        self.assertEqual(
+            [reads.is_read(self.profile, p)
+             for author in self.authors[:3] for p in self.posts[author.pk]],
+            [True, True, True, True, True, False, False, False, False])
+
+        res = self._post('mark_read_before',
+                         {'before': timezone.now().isoformat(),
+                          'author': self.authors[2].pk})
+        self.assertEqual(res.json(), {'authors': 1})
+        self.assertTrue(reads.is_read(self.profile,
+                                      self.posts[self.authors[2].pk][2]))
+
+
+@override_settings(ROOT_URLCONF='blog.asgi_urls',
+                   EVENTS_BUS='blog_app.events.LocalBus',
+                   EVENTS_HEARTBEAT=0.01)
+class FeedStreamTest(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', '', 'testpassword')
+        self.author = User.objects.create_user('author', '', 'testpassword')
+        self.other = User.objects.create_user('other', '', 'testpassword')
+        self.reader.profile.following.add(self.author.profile)
+
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.reader)
+
+    def _create_post(self, author):
+        post = Post.objects.create(caption='Live', content_text='t',
+                                   author=author.profile)
+        # the event is published by the outbox relay
+        background_worker.conf.task_always_eager = True
+        try:
+            outbox.relay()
+        finally:
+            background_worker.conf.task_always_eager = False
+        return post
+
+    def _read(self, count, **kwargs):
+        async def read():
+            response = await self.async_client.get(reverse('feed_stream'),
+                                                   **kwargs)
+            chunks = aiter(response.streaming_content)
+            received = [await anext(chunks)]
+            await sync_to_async(self._create_post)(self.other)
+            post = await sync_to_async(self._create_post)(self.author)
+            for _ in range(count):
+                received.append(await anext(chunks))
+            await chunks.aclose()
+            return response, post, [chunk.decode() for chunk in received]
+        return async_to_sync(read)()
+
+    def _event(self, chunk):
+        lines = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+        return int(lines['id']), json.loads(lines['data'])
+
+    def test_local_bus(self):
+        bus = events.LocalBus()
+
+        async def run():
+            async with bus.subscribe(['a']) as first, \
+                    bus.subscribe(['a', 'b']) as second:
+                for channel, message in (('a', 1), ('b', 2), ('c', 3)):
+                    bus.publish(channel, message)
+                return ([await first.get(1), await first.get(0.01)],
+                        [await second.get(1), await second.get(1)])
+
+        self.assertEqual(async_to_sync(run)(), ([1, None], [1, 2]))
+        self.assertEqual(bus._subscriptions, {})
+
+    def test_new_posts_of_followed_authors(self):
+        response, post, chunks = self._read(2)
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(chunks[0], 'retry: 5000\n\n')
+
+        pk, data = self._event(chunks[1])
+        self.assertEqual(pk, post.pk)
+        self.assertEqual(data['author'], 'author')
+        self.assertEqual(data['url'], reverse('post_detail', args=(post.pk,)))
+
+        self.assertEqual(chunks[2], ': ping\n\n')
+
+    def test_replay_after_reconnect(self):
+        posts = [Post.objects.create(caption=f'c{i}', content_text='t',
+                                     author=self.author.profile)
+                 for i in range(3)]
+        # published before the stream was opened
+        OutboxMessage.objects.all().delete()
+
+        _, post, chunks = self._read(
+            3, headers={'Last-Event-ID': str(posts[0].pk)})
+        self.assertEqual([self._event(chunk)[0] for chunk in chunks[1:]],
+                         [posts[1].pk, posts[2].pk, post.pk])
+
+    def test_login_required(self):
+        async def get():
+            return await AsyncClient().get(reverse('feed_stream'))
+        self.assertEqual(async_to_sync(get)().status_code, 302)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    def _route(self, view_class=views.AllView, method='get', cookies=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        routes = []
+
+        def get_response(request):
+            middleware.process_view(request, view_class.as_view(), (), {})
+            routes.append(router.db_for_read(Post))
+            routes.append(router.db_for_write(Post))
+            routes.append(router.db_for_read(Post))
+            return HttpResponse()
+
+        middleware = routers.ReplicaRoutingMiddleware(get_response)
+        return routes, middleware(request)
+
+    def test_read_views_use_replica_until_write(self):
+        routes, response = self._route()
+        self.assertEqual(routes, ['replica', 'default', 'default'])
+        self.assertEqual(
+            response.cookies[routers.STICKY_COOKIE]['max-age'],
+            settings.DATABASE_STICKY_SECONDS)
+
+    def test_primary_reads(self):
+        for kwargs in ({'method': 'post'}, {'view_class': views.PostCreate},
+                       {'cookies': {routers.STICKY_COOKIE: '1'}}):
+            with self.subTest(**kwargs):
+                routes, _ = self._route(**kwargs)
+                self.assertEqual(routes, ['default'] * 3)
+
+        # outside of requests
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+
+@skipUnless('replica' in settings.DATABASES,
+            'needs a "replica" database alias that is not a test mirror')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaReadTest(TestCase):
+    # the runner sets up the aliases of skipped classes too
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def test_read_your_writes(self):
+        user = User.objects.create_user('author', '', 'testpassword')
+        self.client.force_login(user)
+
+        self.client.post(reverse('post_create'),
+                         {'caption': 'caption', 'content_text': 'text'})
+        url = reverse('post_detail', args=(Post.objects.get().pk,))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        # nothing is replicated into the test replica, a client without
+        # the cookie reads from it
+        del self.client.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def _replica_reads(self):
+        state = routers.RoutingState()
+        state.replica = 'replica'
+        return routers._state.set(state)
+
+    def test_graph_loaded_from_primary(self):
+        author = User.objects.create_user('author', '', 'testpassword')
+        follower = User.objects.create_user('follower', '', 'testpassword')
+        follower.profile.following.add(author.profile)
+        django_cache.clear()
+
+        token = self._replica_reads()
+        try:
+            self.assertEqual(list(graph.followers(author.profile.pk)),
+                             [follower.profile.pk])
+            self.assertTrue(graph.is_following(follower.profile.pk,
+                                               author.profile.pk))
+        finally:
+            routers._state.reset(token)
+
+    def test_users_loaded_from_primary(self):
+        user = User.objects.create_user('author', '', 'testpassword')
+        deletion.delete_profile(user.profile)
+        django_cache.clear()
+
+        token = self._replica_reads()
+        try:
+            self.assertFalse(users.get_user(user.pk).is_active)
+            self.assertEqual(deletion.deleted_profiles(), {user.profile.pk})
+        finally:
+            routers._state.reset(token)
+
+
+class FollowGraphTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.profiles = [User.objects.create_user(f'user{i}', '', 'password')
+                         .profile for i in range(4)]
+        self.pks = [profile.pk for profile in self.profiles]
+
+    def test_lists_follow_changes(self):
+        first, second, third, fourth = self.profiles
+        first.following.add(second, third)
+        fourth.following.add(second)
+
+        self.assertEqual(list(graph.following(first.pk)), self.pks[1:3])
+        self.assertEqual(list(graph.followers(second.pk)),
+                         [first.pk, fourth.pk])
+        self.assertTrue(graph.is_following(first.pk, third.pk))
+        self.assertFalse(graph.is_following(third.pk, first.pk))
+
+        first.following.remove(second)
+        second.profile_set.clear()
+        self.assertEqual(list(graph.following(first.pk)), [third.pk])
+        self.assertEqual(list(graph.followers(second.pk)), [])
+        self.assertEqual(list(graph.following(fourth.pk)), [])
+
+        third.user.delete()
+        self.assertEqual(list(graph.following(first.pk)), [])
+
+    def test_reads_skip_the_database(self):
+        viewer, author = self.profiles[:2]
+        viewer.following.add(author)
+        graph.following(viewer.pk)
+
+        self.client.force_login(viewer.user)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(reverse('blog', args=(author.pk,)))
+            self.client.get(reverse('feed'))
+
+        self.assertTrue(res.context['is_followed'])
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'blog_app_profile_following' in query['sql']])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_pulled_authors(self):
+        first, second, third, _ = self.profiles
+        first.following.add(third)
+        second.following.add(third)
+        first.following.add(second)
+
+        self.assertEqual(graph.pulled(), {third.pk})
+        self.assertEqual(graph.pulled_authors(first.pk), [third.pk])
+
+        second.following.remove(third)
+        self.assertEqual(graph.pulled(), set())
+
+    def test_new_profile_starts_empty(self):
+        django_cache.set(graph._key(graph.FOLLOWERS, self.pks[-1] + 1),
+                         graph._pack([self.pks[0]]))
+        profile = User.objects.create_user('new', '', 'password').profile
+        self.assertEqual(list(graph.followers(profile.pk)), [])
+
+    def test_rebuild_and_stats(self):
+        first, second, third, _ = self.profiles
+        first.following.add(second, third)
+        second.following.add(third)
+        django_cache.clear()
+
+        out = StringIO()
+        call_command('follow_graph', rebuild=True, batch_size=3, stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual((stats['profiles'], stats['edges'], stats['bytes']),
+                         (4, 3, 3 * 2 * 4))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(graph.followers(third.pk)),
+                             [first.pk, second.pk])
+
+        out = StringIO()
+        call_command('follow_graph', stdout=out)
+        self.assertEqual(json.loads(out.getvalue()), stats)
+
+    def test_stats_before_rebuild(self):
+        django_cache.clear()
+
+        with self.assertRaisesMessage(CommandError, '--rebuild'):
+            call_command('follow_graph', stdout=StringIO())
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.author = User.objects.create_user('author', '', 'password')
+        self.reader = User.objects.create_user('reader', '', 'password')
+        self.reader.profile.following.add(self.author.profile)
+
+        self.posts = [Post.objects.create(caption=f'post {i}',
+                                          content_text=f'text {i}',
+                                          author=self.author.profile)
+                      for i in range(12)]
+        self.old = self.posts[:5]
+        old_date = timezone.now() - timedelta(days=400)
+        for i, post in enumerate(self.old):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=old_date + timedelta(minutes=i))
+
+    def test_moves_old_posts(self):
+        out = StringIO()
+        call_command('archive_posts', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(),
+                         'Archived 5 posts, pruned 0 read markers.')
+
+        self.assertEqual(list(ArchivedPost.objects.order_by('pk')
+                              .values_list('pk', flat=True)),
+                         [post.pk for post in self.old])
+        self.assertEqual(Post.objects.count(), 7)
+        self.assertFalse(FeedEntry.objects.filter(
+            post_id__in=[post.pk for post in self.old]).exists())
+        self.assertEqual(ArchivedPost.objects.get(pk=self.old[0].pk)
+                         .content_html, '<p>text 0</p>')
+
+        self.author.profile.refresh_from_db()
+        self.assertEqual(self.author.profile.post_count, 12)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('fixed 0', out.getvalue())
+
+    def test_resumes_in_bounded_batches(self):
+        self.assertEqual(archive.archive_posts(
+            archive.archive_cutoff(), batch_size=2, max_batches=1), 2)
+        self.assertEqual(archive.archive_posts(batch_size=2), 3)
+        self.assertEqual(archive.archive_posts(), 0)
+
+    def test_blog_pages_continue_into_archive(self):
+        archive.archive_posts()
+        url = reverse('blog', args=(self.author.profile.pk,))
+
+        pks, cursors = [], []
+        response = self.client.get(url)
+        while True:
+            page = response.context['page_obj']
+            pks += [post.pk for post in page]
+            if not page.has_next():
+                break
+            cursors.append(page.next_cursor)
+            response = self.client.get(url, {'cursor': page.next_cursor})
+
+        self.assertEqual(pks, [post.pk for post in reversed(self.posts)])
+        self.assertContains(response, 'text 0')
+
+        response = self.client.get(
+            url, {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         pks[:10])
+
+        # the sync response is in the anonymous page cache
+        django_cache.clear()
+
+        async def get():
+            return await AsyncClient().get(url, {'cursor': cursors[0]})
+        with override_settings(ROOT_URLCONF='blog.asgi_urls'):
+            response = async_to_sync(get)()
+            self.assertIs(response.resolver_match.func.view_class,
+                          async_views.AsyncBlogView)
+        self.assertEqual([post.pk for post in response.context['posts']],
+                         pks[10:])
+
+    def test_archived_post_view(self):
+        archive.archive_posts()
+        post = self.old[0]
+        self.client.force_login(self.author)
+
+        response = self.client.get(reverse('post_detail', args=(post.pk,)))
+        self.assertContains(response, 'post 0')
+        self.assertNotContains(response,
+                               reverse('post_update', args=(post.pk,)))
+
+        data = self.client.get(reverse('post_detail_api', args=(post.pk,)),
+                               {'fields': 'caption'}).json()
+        self.assertEqual(data, {'caption': 'post 0'})
+
+        response = self.client.get(reverse('post_update', args=(post.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_archived_post(self):
+        archive.archive_posts()
+        post = self.old[0]
+        url = reverse('post_delete', args=(post.pk,))
+
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_login(self.author)
+        self.assertContains(
+            self.client.get(reverse('post_detail', args=(post.pk,))), url)
+        self.assertRedirects(self.client.post(url), reverse(
+            'blog', args=(self.author.profile.pk,)))
+
+        self.assertFalse(ArchivedPost.objects.filter(pk=post.pk).exists())
+        self.assertEqual(self.client.get(reverse(
+            'post_detail', args=(post.pk,))).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(counters.reconcile(Profile.objects.all()), 0)
+
+    def test_prunes_read_markers(self):
+        profile = self.reader.profile
+        reads.mark(profile, self.old[2])
+        reads.mark(profile, self.posts[8])
+
+        self.assertEqual(archive.run(), (5, 1))
+
+        marker = ReadMarker.objects.get(profile=profile)
+        self.assertEqual(marker.read, {self.posts[8].pk})
+        self.assertEqual(archive.prune_read_markers(), 0)
+
+
+class RequestUserTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user('user', '', 'password')
+        self.client.force_login(self.user)
+
+    def test_authenticated_request_without_queries(self):
+        self.client.get(reverse('post_create'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('post_create'))
+        self.assertEqual(response.context['user_profile'], self.user.profile)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('root_redirect'))
+        self.assertRedirects(response, reverse('feed'),
+                             fetch_redirect_response=False)
+
+    def test_changes_drop_the_cached_user(self):
+        self.client.get(reverse('post_create'))
+
+        self.user.first_name = 'first'
+        self.user.save()
+        response = self.client.get(reverse('post_create'))
+        self.assertEqual(response.context['user'].first_name, 'first')
+
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertRedirects(self.client.get(reverse('post_create')),
+                             f'{settings.LOGIN_URL}?next='
+                             f'{reverse("post_create")}',
+                             fetch_redirect_response=False)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get(reverse('post_create'))
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('root_redirect'))
+        self.assertRedirects(response, reverse('all'),
+                             fetch_redirect_response=False)
+
+    def test_logout_ends_the_cached_session(self):
+        self.client.get(reverse('post_create'))
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        self.client.logout()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        response = self.client.get(reverse('root_redirect'))
+        self.assertRedirects(response, reverse('all'),
+                             fetch_redirect_response=False)
+
+    def test_deleted_user_is_logged_out(self):
+        self.client.get(reverse('post_create'))
+        self.user.delete()
+
+        response = self.client.get(reverse('root_redirect'))
+        self.assertRedirects(response, reverse('all'),
+                             fetch_redirect_response=False)
+
+
+class ListingTemplateTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.reader = User.objects.create_user('reader', '', 'password')
+        author = User.objects.create_user('author', 'a', 'password')
+        author.first_name = '<first>'
+        author.save()
+        self.reader.profile.following.add(author.profile)
+
+        posts = [Post.objects.create(caption=f'<caption {i}>',
+                                     content_text=f'text\n\n{i}',
+                                     author=author.profile)
+                 for i in range(12)]
+        reads.mark(self.reader.profile, posts[-1])
+
+    def _content(self, response):
+        self.assertEqual(response.status_code, 200)
+        # csrf tokens and cursor signatures differ between responses
+        return re.sub(r'name="csrfmiddlewaretoken" value="[^"]+"|cursor=[^"]+',
+                      '', response.content.decode())
+
+    def _render(self, url, engine):
+        django_cache.clear()
+        with override_settings(LISTING_TEMPLATE_ENGINE=engine):
+            return self._content(self.client.get(url))
+
+    def test_same_html_from_both_engines(self):
+        for login in (False, True):
+            if login:
+                self.client.force_login(self.reader)
+            for url in (reverse('all'), reverse('feed')):
+                if url == reverse('feed') and not login:
+                    continue
+                with self.subTest(url=url, login=login):
+                    html = self._render(url, 'jinja2')
+                    self.assertIn('&lt;caption 11&gt;', html)
+                    self.assertHTMLEqual(html, self._render(url, 'django'))
+
+    def test_async_views_use_the_engine(self):
+        self.client.force_login(self.reader)
+        expected = self._render(reverse('feed'), 'django')
+
+        client = AsyncClient()
+        client.force_login(self.reader)
+
+        async def get():
+            return await client.get(reverse('feed'))
+
+        django_cache.clear()
+        with override_settings(ROOT_URLCONF='blog.asgi_urls',
+                               LISTING_TEMPLATE_ENGINE='jinja2'):
+            response = async_to_sync(get)()
+        # only Django templates are recorded by the test client
+        self.assertEqual(response.templates, [])
+        self.assertHTMLEqual(self._content(response), expected)
+
+    def test_cached_loader(self):
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertEqual(type(loader).__module__,
+                         'django.template.loaders.cached')
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+
+        settings_override = override_settings(STATIC_ROOT=static_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.static_root = static_root.name
+
+    def test_unhashed_without_manifest(self):
+        self.assertEqual(staticfiles_storage.url('blog_app/style.css'),
+                         '/static/blog_app/style.css')
+
+    def test_hashed_and_compressed(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+        url = staticfiles_storage.url('blog_app/style.css')
+        self.assertRegex(url, r'^/static/blog_app/style\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.static_root,
+                            url[len(settings.STATIC_URL):])
+        for suffix in ('', '.gz', '.br'):
+            self.assertTrue(os.path.exists(path + suffix))
+
+        # without the font files pages fall back to Google Fonts
+        with mock.patch.object(fonts, 'shipped', return_value=False):
+            response = self.client.get(reverse('all'))
+        self.assertContains(response, url)
+        self.assertContains(response, 'fonts.googleapis.com')
+        # the page is cached with the previous stylesheet
+        django_cache.clear()
+        with mock.patch.object(fonts, 'shipped', return_value=True):
+            response = self.client.get(reverse('all'))
+        self.assertContains(
+            response, staticfiles_storage.url('blog_app/fonts/fonts.css'))
+        self.assertNotContains(response, 'fonts.googleapis.com')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_fonts_shipped(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        directory = directory.name
+        css_path = os.path.join(directory, 'fonts.css')
+        with open(css_path, 'w') as css_file:
+            css_file.write("@font-face { src: url(a.woff2) format('woff2'); }")
+
+        with mock.patch.object(fonts.finders, 'find', return_value=css_path):
+            fonts.shipped.cache_clear()
+            self.assertFalse(fonts.shipped())
+            open(os.path.join(directory, 'a.woff2'), 'wb').close()
+            fonts.shipped.cache_clear()
+            self.assertTrue(fonts.shipped())
+        fonts.shipped.cache_clear()
+
+    def test_localize_fonts(self):
+        css = """
+/* cyrillic */
+@font-face {
+  font-family: 'Roboto Slab';
+  font-style: normal;
+  font-weight: 400;
+  font-display: swap;
+  src: url(https://fonts.example/a.woff2) format('woff2');
+  unicode-range: U+0301, U+0400-045F;
+}
+/* greek */
+@font-face {
+  font-family: 'Roboto Slab';
+  font-style: normal;
+  font-weight: 400;
+  src: url(https://fonts.example/b.woff2) format('woff2');
+  unicode-range: U+0370-03FF;
+}
+"""
+        localized, files = fonts.localize(css)
+
+        self.assertEqual(files, {'roboto-slab-cyrillic-400.woff2':
+                                 'https://fonts.example/a.woff2'})
+        self.assertIn("url(roboto-slab-cyrillic-400.woff2) format('woff2')",
+                      localized)
+        self.assertIn('unicode-range: U+0301, U+0400-045F;', localized)
+        self.assertNotIn('fonts.example', localized)
+
+
+class AdminTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.admin = User.objects.create_superuser('admin', '', 'password')
+        self.users = [User.objects.create_user(f'user{i}', '', 'password')
+                      for i in range(3)]
+        self.client.force_login(self.admin)
+
+    def _post(self, i, author):
+        return Post.objects.create(caption=f'caption {i}',
+                                   content_text=f'text {i}', author=author)
+
+    def _changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_constant(self):
+        url = reverse('admin:blog_app_post_changelist')
+        profiles_url = reverse('admin:blog_app_profile_changelist')
+        for i in range(2):
+            self._post(i, self.users[i].profile)
+        # loads the session user into the cache
+        self.client.get(url)
+        posts, profiles = (self._changelist_queries(url),
+                           self._changelist_queries(profiles_url))
+
+        for i in range(2, 8):
+            user = User.objects.create_user(f'more{i}', '', 'password')
+            self._post(i, user.profile)
+        self.assertEqual(self._changelist_queries(url), posts)
+        self.assertEqual(self._changelist_queries(profiles_url), profiles)
+
+    def test_change_forms_dont_list_all_rows(self):
+        profile = self.users[0].profile
+        post = self._post(0, profile)
+
+        response = self.client.get(
+            reverse('admin:blog_app_profile_change', args=(profile.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '>user2')
+        self.assertContains(response, 'vManyToManyRawIdAdminField')
+
+        response = self.client.get(
+            reverse('admin:blog_app_post_change', args=(post.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '>user2')
+        self.assertContains(response, 'admin-autocomplete')
+
+    def test_estimated_count_paginator(self):
+        paginator = EstimatedCountPaginator(Post.objects.order_by('pk'), 10)
+        self._post(0, self.users[0].profile)
+
+        with mock.patch('blog_app.pagination.estimate_count',
+                        return_value=50000), \
+                self.settings(ESTIMATED_COUNT_THRESHOLD=10000):
+            self.assertEqual(paginator.count, 50000)
+
+        paginator = EstimatedCountPaginator(Post.objects.order_by('pk'), 10)
+        with mock.patch('blog_app.pagination.estimate_count',
+                        return_value=5):
+            self.assertEqual(paginator.count, 1)
+
+    def test_search(self):
+        first = self._post(0, self.users[0].profile)
+        self._post(1, self.users[1].profile)
+
+        response = self.client.get(
+            reverse('admin:blog_app_post_changelist'), {'q': 'caption 0'})
+        self.assertEqual(list(response.context['cl'].result_list), [first])
+
+        response = self.client.get(
+            reverse('admin:blog_app_profile_changelist'), {'q': 'user1'})
+        self.assertEqual([profile.user.username for profile
+                          in response.context['cl'].result_list], ['user1'])
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'blog_app', 'model_name': 'post',
+            'field_name': 'author', 'term': 'user2'})
+        self.assertEqual([result['text'] for result
+                          in response.json()['results']], ['user2 ()'])
+
+    def test_archive_action(self):
+        posts = [self._post(i, self.users[0].profile) for i in range(3)]
+
+        response = self.client.post(
+            reverse('admin:blog_app_post_changelist'), {
+                'action': 'archive_posts',
+                '_selected_action': [posts[0].pk, posts[1].pk],
+            }, follow=True)
+        self.assertContains(response, 'Archived 2 posts.')
+
+        self.assertEqual(list(Post.objects.values_list('pk', flat=True)),
+                         [posts[2].pk])
+        self.assertEqual(set(ArchivedPost.objects.values_list('pk',
+                                                              flat=True)),
+                         {posts[0].pk, posts[1].pk})
+
+        response = self.client.get(reverse('admin:blog_app_archivedpost_change',
+                                           args=(posts[0].pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="_save"')
+
+    def test_reconcile_action(self):
+        profile = self.users[0].profile
+        self._post(0, profile)
+        Profile.objects.filter(pk=profile.pk).update(post_count=7)
+
+        response = self.client.post(
+            reverse('admin:blog_app_profile_changelist'), {
+                'action': 'reconcile_counters',
+                '_selected_action': [profile.pk],
+            }, follow=True)
+        self.assertContains(response, 'Fixed 1 profile.')
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.post_count, 1)
+
+
+class DeletionTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+        self.author = User.objects.create_user('author', '', 'password')
+        self.follower = User.objects.create_user('follower', '', 'password')
+        self.other = User.objects.create_user('other', '', 'password')
+        self.follower.profile.following.add(self.author.profile)
+        self.author.profile.following.add(self.other.profile)
+
+        self.posts = [Post.objects.create(caption=f'caption {i}',
+                                          content_text=f'text {i}',
+                                          author=self.author.profile)
+                      for i in range(3)]
+        reads.mark(self.follower.profile, self.posts[0])
+
+    def _purge_key(self, name, pk):
+        return f'delete:{name}:{pk}:{tasks.purge_deleted.name}'
+
+    def _counts(self, user):
+        profile = Profile.objects.get(user=user)
+        return (profile.post_count, profile.followers_count,
+                profile.following_count)
+
+    def test_post_delete_hides_post(self):
+        post = self.posts[0]
+        self.client.force_login(self.author)
+
+        response = self.client.post(reverse('post_delete', args=(post.pk,)))
+        self.assertRedirects(response, reverse(
+            'blog', args=(self.author.profile.pk,)))
+
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        self.assertTrue(OutboxMessage.objects.filter(
+            key=self._purge_key('post', post.pk)).exists())
+        self.assertEqual(self._counts(self.author), (2, 1, 1))
+        self.assertEqual(self.client.get(reverse(
+            'post_detail', args=(post.pk,))).status_code, 404)
+        self.assertEqual(self.client.post(reverse(
+            'post_delete', args=(post.pk,))).status_code, 404)
+        self.assertFalse(deletion.delete_post(post))
+
+        self.client.force_login(self.follower)
+        for name in ('all', 'feed'):
+            response = self.client.get(reverse(name))
+            self.assertNotIn(post, response.context['object_list'])
+        response = self.client.get(reverse('search'), {'q': 'caption'})
+        self.assertNotIn(post, response.context['object_list'])
+
+        tasks.purge_deleted.apply()
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertFalse(FeedEntry.objects.filter(post_id=post.pk).exists())
+        self.assertEqual(self._counts(self.author), (2, 1, 1))
+        self.assertEqual(counters.reconcile(Profile.objects.all()), 0)
+
+    def test_delete_posts_in_bulk(self):
+        self.assertEqual(deletion.delete_posts(Post.objects.all()), 3)
+        self.assertEqual(deletion.delete_posts(Post.objects.all()), 0)
+
+        self.assertEqual(self._counts(self.author), (0, 1, 1))
+        self.assertFalse(search.search(Post.objects.all(), 'caption'))
+        self.assertQuerysetEqual(
+            OutboxMessage.objects.filter(task=tasks.purge_deleted.name),
+            [self._purge_key('post', self.posts[0].pk)],
+            transform=lambda message: message.key)
+
+        tasks.purge_deleted.apply()
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(counters.reconcile(Profile.objects.all()), 0)
+
+    def test_delete_profile_hides_it(self):
+        profile = self.author.profile
+        self.assertTrue(self.client.login(username='author',
+                                          password='password'))
+
+        self.assertTrue(deletion.delete_profile(profile))
+        self.assertFalse(deletion.delete_profile(profile))
+
+        self.assertTrue(OutboxMessage.objects.filter(
+            key=self._purge_key('profile', profile.pk)).exists())
+        self.assertFalse(
+            self.client.get(reverse('all')).context['user'].is_authenticated)
+        self.assertFalse(self.client.login(username='author',
+                                           password='password'))
+
+        self.client.force_login(self.follower)
+        self.assertEqual(self.client.get(reverse(
+            'blog', args=(profile.pk,))).status_code, 404)
+        self.assertEqual(self.client.get(reverse(
+            'post_detail', args=(self.posts[0].pk,))).status_code, 404)
+        for name in ('all', 'feed'):
+            self.assertEqual(
+                list(self.client.get(reverse(name)).context['object_list']),
+                [])
+        self.assertEqual(follows.follow(self.other.profile, {profile.pk}),
+                         set())
+
+    def test_purge_profile(self):
+        profile = self.author.profile
+        archive.archive_post_pks([self.posts[0].pk])
+        deletion.delete_profile(profile)
+
+        out = StringIO()
+        call_command('purge_deleted', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(),
+                         'Deleted 2 follows, 0 feed entries, 0 read markers, '
+                         '2 posts, 1 archived posts, 1 profiles. '
+                         '0 profiles and 0 posts left.')
+
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Profile.objects.filter(pk=profile.pk).exists())
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertFalse(ReadMarker.objects.exists())
+        self.assertEqual(self._counts(self.follower), (0, 0, 0))
+        self.assertEqual(self._counts(self.other), (0, 0, 0))
+        self.assertEqual(list(graph.following(self.follower.profile.pk)), [])
+        self.assertEqual(counters.reconcile(Profile.objects.all()), 0)
+
+    def test_purge_resumes_in_bounded_batches(self):
+        deletion.delete_profile(self.author.profile)
+        deletion.delete_post(Post.objects.create(
+            caption='c', content_text='t', author=self.other.profile))
+
+        progress = []
+        totals = purge.purge(batch_size=1, max_batches=3,
+                             progress=lambda totals: progress.append(
+                                 sum(totals.values())))
+        self.assertEqual(progress, [1, 2, 3])
+        self.assertEqual(totals['follows'], 2)
+        self.assertEqual(purge.pending(), {'profiles': 1, 'posts': 1})
+
+        totals = purge.purge()
+        self.assertEqual((totals['profiles'], totals['posts']), (1, 3))
+        self.assertEqual(purge.pending(), {'profiles': 0, 'posts': 0})
+        self.assertFalse(Post.objects.exists())
+
+    def test_admin_actions(self):
+        admin_user = User.objects.create_superuser('admin', '', 'password')
+        self.client.force_login(admin_user)
+
+        response = self.client.post(
+            reverse('admin:auth_user_changelist'), {
+                'action': 'delete_users',
+                '_selected_action': [self.author.pk],
+            }, follow=True)
+        self.assertContains(response, 'Deleting 1 user.')
+        self.assertIsNotNone(Profile.objects.get(
+            user=self.author).deleted_at)
+
+        response = self.client.post(
+            reverse('admin:blog_app_post_changelist'), {
+                'action': 'delete_posts',
+                '_selected_action': [self.posts[0].pk],
+            }, follow=True)
+        self.assertContains(response, 'Deleting 1 post.')
+
+        response = self.client.get(reverse('admin:auth_user_delete',
+                                           args=(self.other.pk,)))
+        self.assertEqual(response.status_code, 403)
@@ -19,4 +19,31 @@ urlpatterns = [
     path('post/<int:pk>/', views.PostView.as_view(), name='post_detail'),
     path('post/<int:pk>/edit', views.PostUpdate.as_view(), name='post_update'),
     path('post/<int:pk>/del', views.PostDelete.as_view(), name='post_delete'),
+
+    path('search', views.SearchView.as_view(), name='search'),
+    path('api/all', views.AllApiView.as_view(), name='all_api'),
+    path('api/feed', views.FeedApiView.as_view(), name='feed_api'),
+    path('api/user/<int:profile_pk>/', views.BlogApiView.as_view(),
+         name='blog_api'),
+    path('api/post/<int:pk>/', views.PostApiView.as_view(),
+         name='post_detail_api'),
+    path('api/search', views.SearchApiView.as_view(), name='search_api'),
+
+    path('api/follow', views.BulkActionView.as_view(action='follow'),
+         name='bulk_follow'),
+    path('api/unfollow', views.BulkActionView.as_view(action='unfollow'),
+         name='bulk_unfollow'),
+    path('api/follow/import',
+         views.BulkActionView.as_view(action='import_follows'),
+         name='import_follows'),
+    path('api/reads/mark', views.BulkActionView.as_view(action='mark_read'),
+         name='bulk_mark_read'),
+    path('api/reads/unmark',
+         views.BulkActionView.as_view(action='mark_unread'),
+         name='bulk_mark_unread'),
+    path('api/reads/mark_before',
+         views.BulkActionView.as_view(action='mark_before'),
+         name='mark_read_before'),
+
+    path('profiling', views.profiling_report, name='profiling_report'),
 ]
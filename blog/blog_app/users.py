@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import PRIMARY
+
+
+# Requests load their user through CachedUserBackend: the user is fetched
+# with its profile in one query and cached across requests, so with cached
+# sessions an authenticated request reaches the view without a query.
+# request.user is resolved once per request by AuthenticationMiddleware.
+# Cached users are dropped when the user or its profile is saved or
+# deleted. Profile counters are updated with F() expressions and may be
+# stale in the cache, Profile.save() never writes them back.
+
+def _key(user_pk):
+    return f'user:{user_pk}'
+
+
+def get_user(user_pk):
+    user = cache.get(_key(user_pk))
+    if user is None:
+        user = (User.objects.using(PRIMARY).select_related('profile')
+                .filter(pk=user_pk).first())
+        if user is not None:
+            cache.set(_key(user_pk), user, settings.USER_CACHE_TIMEOUT)
+
+    return user
+
+
+def invalidate(*user_pks):
+    def delete():
+        cache.delete_many([_key(pk) for pk in user_pks])
+
+    # users loaded by other connections before commit are dropped again
+    delete()
+    transaction.on_commit(delete)
+
+
+class CachedUserBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = get_user(user_id)
+        return user if user and self.user_can_authenticate(user) else None
@@ -0,0 +1,19 @@
+BULK_BATCH_SIZE = 1000
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_create(model, objs, **kwargs):
+    # bulk_create() splits every chunk further when the backend limits
+    # the number of query parameters (SQLite)
+    for chunk in chunks(objs, BULK_BATCH_SIZE):
+        model.objects.bulk_create(chunk, **kwargs)
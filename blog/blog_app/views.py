@@ -1,76 +1,182 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.db.models.signals import m2m_changed, post_save
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.dispatch import receiver
-from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import (Http404, HttpResponseBadRequest,
+                         HttpResponseRedirect, JsonResponse)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views import generic
 
-from celery import group
-
-from .models import Profile, Post
-from .tasks import send_new_post_notification
+from . import (api, cache, counters, deletion, feed, follows, graph,
+               outbox, profiling, reads, search, users)
+from .models import ArchivedPost, Profile, Post
+from .pagination import CursorPaginationMixin
+from .tasks import notify_followers, publish_post, purge_deleted
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
+        graph.reset(Profile.objects.create(user=instance).pk)
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields, **kwargs):
     instance.profile.save()
 
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        cache.invalidate_user()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=User)
+def user_update_cached(sender, instance, **kwargs):
+    users.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=Profile)
+def profile_update_cached(sender, instance, **kwargs):
+    users.invalidate(instance.user_id)
+
+
+@receiver(deletion.profiles_deleted)
+def profiles_soft_delete(sender, pks, user_pks, **kwargs):
+    # hidden by deletion.delete_profiles, purged in the background
+    users.invalidate(*user_pks)
+    cache.invalidate_user()
+    cache.bump_version('posts', *(f'blog:{pk}' for pk in pks))
+    outbox.enqueue(f'delete:profile:{min(pks)}', purge_deleted.s())
+
+
+@receiver(pre_delete, sender=Profile)
+def profile_delete(sender, instance, **kwargs):
+    pairs = (counters.existing_follows(follower_pks={instance.pk})
+             + counters.existing_follows(followee_pks={instance.pk}))
+    counters.remove_follows(pairs)
+    graph.update({follower for follower, _ in pairs} | {instance.pk},
+                 {followee for _, followee in pairs} | {instance.pk})
+
 
 @receiver(m2m_changed, sender=Profile.following.through)
-def profile_update(sender, instance, action, pk_set, **kwargs):
+def profile_update(sender, instance, action, reverse, pk_set, **kwargs):
+    follower_pks, followee_pks = (({instance.pk}, pk_set) if not reverse
+                                  else (pk_set, {instance.pk}))
+
     if action == 'pre_add':
-        if instance.pk == list(pk_set)[0]:
+        if instance.pk in pk_set:
             raise ValidationError('You can not follow yourself')
+
+        # pk_set was read before any lock, a concurrent add of the same
+        # pairs may have committed since. With both sides locked until
+        # commit, pairs that exist now are dropped from pk_set, which is
+        # also the set Django inserts and sends to post_add.
+        counters.lock_profiles(follower_pks | followee_pks)
+        pk_set.difference_update(
+            follower if reverse else followee for follower, followee
+            in counters.existing_follows(follower_pks, followee_pks))
+    elif action == 'post_add' and pk_set:
+        counters.change_follow_counts(follower_pks, followee_pks, 1)
+        graph.update(follower_pks, followee_pks)
+        feed.add_follows(follower_pks, followee_pks)
+        cache.bump_version(*(f'blog:{pk}' for pk in followee_pks),
+                           *(f'feed:{pk}' for pk in follower_pks))
+    elif action == 'pre_remove':
+        counters.remove_follows(
+            counters.existing_follows(follower_pks, followee_pks))
     elif action == 'post_remove':
-        posts_read = instance.posts_read.filter(author__id__in=pk_set)
-        instance.posts_read.remove(*posts_read)
+        reads.clear(follower_pks, followee_pks)
+        feed.remove_follows(follower_pks, followee_pks)
+        graph.update(follower_pks, followee_pks)
+        cache.bump_version(*(f'blog:{pk}' for pk in followee_pks),
+                           *(f'feed:{pk}' for pk in follower_pks))
+    elif action == 'pre_clear':
+        follows.remove_pairs(counters.existing_follows(
+            **({'followee_pks': {instance.pk}} if reverse
+               else {'follower_pks': {instance.pk}})))
 
 
 @receiver(post_save, sender=Post)
 def post_create_email_followers(sender, instance, created, **kwargs):
+    cache.invalidate_post(instance)
+
+    if instance.deleted_at is not None:
+        return
+
+    search.index_posts([instance.pk])
+
     if created:
-        followers_email = list(
-            Profile.objects.select_related('user')
-                .filter(following=instance.author)
-                .values_list('user__email', flat=True))
+        counters.change_post_count(instance.author_id, 1)
+        feed.push_post(instance)
+
+        outbox.enqueue(f'post:{instance.pk}',
+                       notify_followers.s(instance.pk),
+                       publish_post.s(instance.pk))
 
-        path = str(reverse_lazy('post_detail', args=(instance.pk,)))
 
-        send_tasks = group([
-            send_new_post_notification.si(str(instance.author), path, email)
-            for email in followers_email])
-        send_tasks()
+@receiver(deletion.posts_deleted)
+def posts_soft_delete(sender, pks, authors, **kwargs):
+    # hidden by deletion.delete_posts, purged in the background
+    counters.remove_posts(authors)
+    search.remove_posts(pks)
+    cache.bump_version('posts', *(f'blog:{pk}' for pk in authors),
+                       *(f'post:{pk}' for pk in pks))
+    outbox.enqueue(f'delete:post:{min(pks)}', purge_deleted.s())
+
+
+@receiver(post_delete, sender=Post)
+def post_delete_update_counters(sender, instance, **kwargs):
+    # deleted posts were counted off when they were hidden
+    if instance.deleted_at is None:
+        counters.change_post_count(instance.author_id, -1)
+    cache.invalidate_post(instance)
+    search.remove_posts([instance.pk])
 
 
 class BaseView(generic.base.ContextMixin):
+    @cached_property
+    def user_profile(self):
+        return (self.request.user.profile
+                if self.request.user.is_authenticated else None)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['user_profile'] = (self.request.user.profile
-                                   if self.request.user.is_authenticated
-                                   else None)
+        context['user_profile'] = self.user_profile
 
         return context
 
 
+class ListingTemplateMixin:
+    """Render with the engine named by settings.LISTING_TEMPLATE_ENGINE."""
+
+    @property
+    def template_engine(self):
+        return settings.LISTING_TEMPLATE_ENGINE
+
+
 class RootRedirectView(generic.RedirectView):
     def get_redirect_url(self, *args, **kwargs):
         return (reverse_lazy('feed') if self.request.user.is_authenticated
                 else reverse_lazy('all'))
 
 
-class AllView(BaseView, generic.ListView):
+class AllView(BaseView, cache.AnonymousPageCacheMixin, CursorPaginationMixin,
+              ListingTemplateMixin, generic.ListView):
     model = Post
+    use_replica = True
 
     login_url = '/accounts/login/'
 
@@ -78,8 +184,12 @@ class AllView(BaseView, generic.ListView):
     context_object_name = 'posts_feed'
     paginate_by = 10
 
+    def get_page_cache_versions(self):
+        return super().get_page_cache_versions() + ['posts']
+
     def get_queryset(self):
-        return Post.objects.select_related('author').order_by('-pub_date')
+        return (deletion.visible(Post.objects.select_related('author__user'))
+                .defer(*Post.LIST_DEFERRED).order_by('-pub_date'))
 
 
 class FeedView(LoginRequiredMixin, AllView):
@@ -89,11 +199,26 @@ class FeedView(LoginRequiredMixin, AllView):
 
     template_name = 'blog_app/feed.html'
     context_object_name = 'posts_feed'
+    cursor_date_field = 'feed_date'
+    cursor_pk_field = 'feed_pk'
+
+    def get_page_cache_versions(self):
+        return (super().get_page_cache_versions()
+                + [f'feed:{self.user_profile.pk}'])
 
     def get_queryset(self):
-        return (Post.objects.select_related('author')
-                .filter(author__in=self.request.user.profile.following.all())
-                .order_by('-pub_date'))
+        return (feed.feed_queryset(self.user_profile)
+                .select_related('author__user').defer('content_text'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        posts = context['object_list']
+        read_posts = reads.read_post_ids(self.user_profile, posts)
+        for post in posts:
+            post.is_read = post.pk in read_posts
+
+        return context
 
 
 @method_decorator(login_required, name='dispatch')
@@ -102,32 +227,24 @@ class ProfileUpdateView(generic.UpdateView):
 
     def _mark_post(self, user_profile, post_pk):
         post = get_object_or_404(Post, pk=post_pk)
-        if post in user_profile.posts_read.all():
-            user_profile.posts_read.remove(post)
-        else:
-            user_profile.posts_read.add(post)
+        reads.toggle(user_profile, post)
 
     def _manage_follow(self, user_profile, follow, unfollow):
-        profile = Profile.objects.get(pk=follow or unfollow)
-
-        if user_profile == profile:
-            return
-
         if follow:
-            user_profile.following.add(profile)
+            follows.follow(user_profile, [follow])
         elif unfollow:
-            user_profile.following.remove(profile)
+            follows.unfollow(user_profile, [unfollow])
 
     def get(self, request, *args, **kwargs):
         raise Http404
 
     def post(self, request, *args, **kwargs):
         if 'mark_post_read' in request.POST:
-            self._mark_post(self.request.user.profile,
+            self._mark_post(request.user.profile,
                             request.POST['mark_post_read'])
         elif 'follow' in request.POST or 'unfollow' in request.POST:
             self._manage_follow(
-                self.request.user.profile,
+                request.user.profile,
                 request.POST.get('follow'), request.POST.get('unfollow'))
         else:
             return HttpResponseBadRequest(f'Bad request: {request.path}')
@@ -135,65 +252,99 @@ class ProfileUpdateView(generic.UpdateView):
         return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
-class BlogView(BaseView, generic.ListView):
+class BlogView(BaseView, cache.AnonymousPageCacheMixin, CursorPaginationMixin,
+               generic.ListView):
     model = Post
+    use_replica = True
 
     template_name = 'blog_app/blog.html'
     context_object_name = 'posts'
     paginate_by = 10
 
+    def get_page_cache_versions(self):
+        return (super().get_page_cache_versions()
+                + [f'blog:{self.kwargs["profile_pk"]}'])
+
     def get_queryset(self):
-        if not Profile.objects.filter(pk=self.kwargs['profile_pk']).exists():
+        if not Profile.objects.filter(pk=self.kwargs['profile_pk'],
+                                      deleted_at__isnull=True).exists():
             raise Http404(f'User profile with pk = {self.kwargs["profile_pk"]} '
                           f'does not exist.')
-        return (Post.objects.filter(author__pk=self.kwargs['profile_pk'])
-                .order_by('-pub_date'))
+        return (Post.objects.filter(author__pk=self.kwargs['profile_pk'],
+                                    deleted_at__isnull=True)
+                .defer(*Post.LIST_DEFERRED).order_by('-pub_date'))
+
+    def get_archive_queryset(self):
+        return (ArchivedPost.objects
+                .filter(author_id=self.kwargs['profile_pk'])
+                .defer(*Post.LIST_DEFERRED))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
         profile_pk = self.kwargs['profile_pk']
         profile = (Profile.objects.select_related('user').get(pk=profile_pk))
 
         context['user_info'] = {
             'username': profile.user.username,
             'full_name': profile.user.get_full_name,
-            'postcount': profile.post_set.count(),
+            'postcount': profile.post_count,
+            'followers_count': profile.followers_count,
             'pk': profile_pk
         }
 
-        if self.request.user.is_authenticated:
-            context['is_followed'] = (self.request.user.profile
-                                      .following.filter(pk=profile_pk).exists())
+        if self.user_profile:
+            context['is_followed'] = graph.is_following(self.user_profile.pk,
+                                                        profile_pk)
 
         return context
 
 
 class FollowingView(BaseView, LoginRequiredMixin, generic.ListView):
     model = Profile
+    use_replica = True
 
     template_name = 'blog_app/following.html'
     context_object_name = 'profiles'
 
     def get_queryset(self):
-        return (self.request.user.profile.following.all()
-                .order_by('user__username'))
+        return (self.user_profile.following.filter(deleted_at__isnull=True)
+                .select_related('user').order_by('user__username'))
 
 
-class PostView(BaseView, generic.DetailView):
+class PostView(BaseView, cache.AnonymousPageCacheMixin, generic.DetailView):
     model = Post
+    use_replica = True
 
     template_name = 'blog_app/post_detail.html'
     context_object_name = 'post'
 
+    def get_page_cache_versions(self):
+        return (super().get_page_cache_versions()
+                + [f'post:{self.kwargs["pk"]}'])
+
+    def get_queryset(self):
+        return deletion.visible(Post.objects.select_related('author__user'))
+
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # archived posts cost a second query
+            return get_object_or_404(
+                deletion.visible(
+                    ArchivedPost.objects.select_related('author__user')),
+                pk=self.kwargs['pk'])
+
 
 @method_decorator(login_required, name='dispatch')
 class PostCreate(BaseView, generic.CreateView):
     model = Post
     fields = ['caption', 'content_text']
 
+    @transaction.atomic
     def form_valid(self, form):
-        form.instance.author = Profile.objects.get(user=self.request.user)
+        # the post and its outbox messages are committed together
+        form.instance.author = self.user_profile
         form.save()
 
         return super().form_valid(form)
@@ -207,8 +358,11 @@ class PostUpdate(BaseView, generic.UpdateView):
     model = Post
     fields = ['caption', 'content_text']
 
+    def get_queryset(self):
+        return Post.objects.filter(deleted_at__isnull=True)
+
     def dispatch(self, request, *args, **kwargs):
-        if self.get_object().author.user != request.user:
+        if self.get_object().author_id != self.user_profile.pk:
             raise PermissionDenied
 
         return super().dispatch(request, *args, **kwargs)
@@ -221,12 +375,234 @@ class PostUpdate(BaseView, generic.UpdateView):
 class PostDelete(BaseView, generic.DeleteView):
     model = Post
 
+    def get_queryset(self):
+        return Post.objects.filter(deleted_at__isnull=True)
+
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # archived posts can't be edited, but can be deleted
+            return get_object_or_404(ArchivedPost, pk=self.kwargs['pk'])
+
     def dispatch(self, request, *args, **kwargs):
-        if self.get_object().author.user != request.user:
+        if self.get_object().author_id != self.user_profile.pk:
             raise PermissionDenied
 
         return super().dispatch(request, *args, **kwargs)
 
+    def form_valid(self, form):
+        if self.object.is_archived:
+            deletion.delete_archived_post(self.object)
+        else:
+            # hidden now, its feed entries are deleted in the background
+            deletion.delete_post(self.object)
+
+        return HttpResponseRedirect(self.get_success_url())
+
     def get_success_url(self):
-        return reverse_lazy(
-            'blog', args=(Profile.objects.get(user=self.request.user).pk,))
+        return reverse_lazy('blog', args=(self.user_profile.pk,))
+
+
+class SearchView(BaseView, generic.ListView):
+    model = Post
+
+    template_name = 'blog_app/search.html'
+    context_object_name = 'posts_feed'
+    paginate_by = 10
+
+    scopes = ('all', 'blog', 'feed')
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.GET.get('scope') == 'feed'
+                and not request.user.is_authenticated):
+            return redirect_to_login(request.get_full_path())
+
+        return super().dispatch(request, *args, **kwargs)
+
+    @cached_property
+    def scope(self):
+        scope = self.request.GET.get('scope') or 'all'
+        if scope not in self.scopes:
+            raise Http404(f'Unknown search scope: {scope}.')
+        return scope
+
+    @cached_property
+    def author(self):
+        author_pk = self.request.GET.get('author', '')
+        if not author_pk.isdigit():
+            raise Http404('Search in a blog requires an author.')
+        return get_object_or_404(Profile.objects.select_related('user'),
+                                 pk=author_pk, deleted_at__isnull=True)
+
+    def get_queryset(self):
+        if self.scope == 'feed':
+            posts = feed.feed_queryset(self.user_profile)
+        elif self.scope == 'blog':
+            posts = Post.objects.filter(author=self.author,
+                                        deleted_at__isnull=True)
+        else:
+            posts = deletion.visible(Post.objects.all())
+
+        return (search.search(posts, self.request.GET.get('q', ''))
+                .select_related('author__user').defer(*Post.LIST_DEFERRED))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        context.update({
+            'query': self.request.GET.get('q', ''),
+            'scope': self.scope,
+            'author': self.author if self.scope == 'blog' else None,
+            'query_string': f'{params.urlencode()}&' if params else '',
+        })
+
+        return context
+
+
+class SearchApiView(api.PostJsonMixin, SearchView):
+    extra_fields = {'rank': lambda post: post.search_rank}
+
+    def get_pagination_data(self, page):
+        return {
+            'count': page.paginator.count,
+            'page': page.number,
+            'num_pages': page.paginator.num_pages,
+        }
+
+    def get_json_data(self, context):
+        return {
+            'query': context['query'],
+            'scope': context['scope'],
+            **super().get_json_data(context),
+        }
+
+
+class AllApiView(api.PostJsonMixin, cache.ConditionalGetMixin, AllView):
+    cache_pages = False
+
+
+class FeedApiView(api.PostJsonMixin, cache.ConditionalGetMixin, FeedView):
+    cache_pages = False
+    extra_fields = {'is_read': lambda post: post.is_read}
+
+    def dispatch(self, request, *args, **kwargs):
+        # the feed version needs a profile, check login before the ETag
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+
+        return super().dispatch(request, *args, **kwargs)
+
+
+class BlogApiView(api.PostJsonMixin, cache.ConditionalGetMixin, BlogView):
+    cache_pages = False
+
+    def get_page_cache_versions(self):
+        # is_followed depends on the viewer
+        return (super().get_page_cache_versions()
+                + ([f'feed:{self.user_profile.pk}'] if self.user_profile
+                   else []))
+
+    def get_json_data(self, context):
+        user_info = context['user_info']
+
+        return {
+            'author': {
+                'pk': user_info['pk'],
+                'username': user_info['username'],
+                'full_name': user_info['full_name'](),
+                'post_count': user_info['postcount'],
+                'followers_count': user_info['followers_count'],
+                'is_followed': context.get('is_followed'),
+            },
+            **super().get_json_data(context),
+        }
+
+
+class PostApiView(api.PostJsonMixin, cache.ConditionalGetMixin, PostView):
+    cache_pages = False
+
+
+class BulkActionError(Exception):
+    pass
+
+
+@method_decorator(login_required, name='dispatch')
+class BulkActionView(generic.View):
+    """Follow changes and read marks for many posts or profiles at once.
+
+    Answers with JSON, or redirects to `next` when it is given so that the
+    actions can be posted from plain HTML forms.
+    """
+    action = None
+
+    def _pks(self, name):
+        values = [value for item in self.request.POST.getlist(name)
+                  for value in item.split(',') if value.strip()]
+        if not all(value.strip().isdigit() for value in values):
+            raise BulkActionError(f'{name} must be a list of ids.')
+        if len(values) > settings.BULK_ACTION_MAX_ITEMS:
+            raise BulkActionError(
+                f'At most {settings.BULK_ACTION_MAX_ITEMS} {name} ids '
+                f'are allowed.')
+        return {int(value) for value in values}
+
+    def follow(self, profile):
+        return {'followed': sorted(follows.follow(profile,
+                                                  self._pks('profile')))}
+
+    def unfollow(self, profile):
+        return {'unfollowed': sorted(follows.unfollow(profile,
+                                                      self._pks('profile')))}
+
+    def import_follows(self, profile):
+        upload = self.request.FILES.get('file')
+        text = (upload.read().decode('utf-8', 'replace') if upload
+                else self.request.POST.get('usernames', ''))
+
+        usernames = follows.parse_usernames(text)
+        if len(usernames) > settings.BULK_ACTION_MAX_ITEMS:
+            raise BulkActionError(
+                f'At most {settings.BULK_ACTION_MAX_ITEMS} usernames '
+                f'are allowed.')
+
+        followed, unknown = follows.import_follows(profile, usernames)
+        return {'followed': sorted(followed), 'unknown': unknown}
+
+    def mark_read(self, profile):
+        return {'marked': reads.mark_posts(profile, self._pks('post'))}
+
+    def mark_unread(self, profile):
+        return {'marked': reads.mark_posts(profile, self._pks('post'),
+                                           read=False)}
+
+    def mark_before(self, profile):
+        before = parse_datetime(self.request.POST.get('before', ''))
+        if before is None:
+            raise BulkActionError('before must be an ISO 8601 datetime.')
+        if timezone.is_naive(before):
+            before = timezone.make_aware(before)
+
+        author_pks = (self._pks('author') if 'author' in self.request.POST
+                      else None)
+        return {'authors': reads.mark_before(profile, before, author_pks)}
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = getattr(self, self.action)(request.user.profile)
+        except BulkActionError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+
+        next_url = request.POST.get('next')
+        if next_url and url_has_allowed_host_and_scheme(
+                next_url, allowed_hosts={request.get_host()}):
+            return HttpResponseRedirect(next_url)
+
+        return JsonResponse(data)
+
+
+@staff_member_required
+def profiling_report(request):
+    return JsonResponse(profiling.get_report())